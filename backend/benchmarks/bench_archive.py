@@ -0,0 +1,157 @@
+"""诊断结果存档基准测试 - 成组提交、跨段随机读取与多进程写入
+
+- 写入：在事件循环上以 --rate 条/秒的节奏 append()（模拟请求路径），后台任务成组落盘；
+  输出 append() 的耗时、提交次数（每次一个 fdatasync）、事件循环延迟
+- 读取：写完后从全部序号中随机读取 --reads 次（冷启动的新实例，全部走内存映射），输出 get() 的 p50 / p99
+- 多进程：--procs 个进程交替写入同一个存档（序号按进程交错，落在相同的段上），最后逐条校验
+- --segment-records 调小可以用较少的记录覆盖多个段（线上默认每段 100 万条）
+
+用法：
+    python benchmarks/bench_archive.py [--records 200000] [--segment-records 50000] [--rate 5000] [--procs 4]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# 将 backend 目录加入 sys.path 以便导入 services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.result_archive import ResultArchive
+
+PROBE_INTERVAL = 0.005
+
+
+def make_record(sequence_no: int) -> dict:
+    return {
+        "object_name": "灵魂已离职的吗喽", "display_name": f"第 {sequence_no} 号工位上的吗喽",
+        "keywords": ["摆烂", "社畜", "已读不回"], "diagnosis": "经鉴定，该个体的精神已提前下班。" * 8,
+        "image_url": "t8rb7429x.hn-bkt.clouddn.com/species/灵魂已离职的吗喽_1768237072.png", "created_at": 1768310620,
+    }
+
+
+def quantile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def write_phase(archive: ResultArchive, records: int, rate: float) -> dict:
+    lag, append_times = [], []
+    stop = asyncio.Event()
+
+    async def probe():
+        while not stop.is_set():
+            expected = time.perf_counter() + PROBE_INTERVAL
+            await asyncio.sleep(PROBE_INTERVAL)
+            lag.append(max(0.0, time.perf_counter() - expected))
+
+    probe_task = asyncio.create_task(probe())
+    await archive.start()
+    started = time.perf_counter()
+    batch = max(1, int(rate * 0.01))
+    for first in range(1, records + 1, batch):
+        for sequence_no in range(first, min(first + batch, records + 1)):
+            t0 = time.perf_counter()
+            archive.append(sequence_no, make_record(sequence_no))
+            append_times.append(time.perf_counter() - t0)
+        # 按 --rate 的节奏到达
+        await asyncio.sleep(max(0.0, started + first / rate - time.perf_counter()))
+    await archive.stop()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe_task
+    return {
+        "elapsed": elapsed,
+        "append_p99_us": quantile(append_times, 0.99) * 1e6,
+        "commits": archive.commits,
+        "lag_p99_ms": quantile(lag, 0.99) * 1000,
+        "lag_max_ms": max(lag) * 1000,
+    }
+
+
+def read_phase(directory: str, segment_records: int, records: int, reads: int) -> dict:
+    archive = ResultArchive(directory, segment_records=segment_records)
+    timings, missing = [], 0
+    for _ in range(reads):
+        sequence_no = random.randint(1, records)
+        t0 = time.perf_counter()
+        payload = archive.get(sequence_no)
+        timings.append(time.perf_counter() - t0)
+        if payload is None or json.loads(payload)["sequence_no"] != sequence_no:
+            missing += 1
+    return {"p50_us": statistics.median(timings) * 1e6, "p99_us": quantile(timings, 0.99) * 1e6, "missing": missing}
+
+
+def writer_process(directory: str, segment_records: int, index: int, procs: int, records: int):
+    async def run():
+        archive = ResultArchive(directory, segment_records=segment_records, commit_interval=0.01)
+        await archive.start()
+        for sequence_no in range(1 + index, records + 1, procs):
+            archive.append(sequence_no, make_record(sequence_no))
+            if sequence_no % 200 < procs:
+                await asyncio.sleep(0.001)
+        await archive.stop()
+
+    asyncio.run(run())
+
+
+def multiprocess_phase(directory: str, segment_records: int, procs: int, records: int) -> dict:
+    started = time.perf_counter()
+    workers = [multiprocessing.Process(target=writer_process, args=(directory, segment_records, i, procs, records))
+               for i in range(procs)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    archive = ResultArchive(directory, segment_records=segment_records)
+    bad = sum(1 for n in range(1, records + 1)
+              if (payload := archive.get(n)) is None or json.loads(payload)["sequence_no"] != n)
+    return {"elapsed": elapsed, "bad": bad}
+
+
+def disk_usage(directory: str, suffix: str) -> int:
+    """实际占用的磁盘空间（稀疏文件只计写过的块）"""
+    return sum(os.stat(os.path.join(directory, name)).st_blocks * 512
+               for name in os.listdir(directory) if name.endswith(suffix))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--segment-records", type=int, default=50000)
+    parser.add_argument("--rate", type=float, default=5000, help="每秒 append 的条数")
+    parser.add_argument("--reads", type=int, default=100000)
+    parser.add_argument("--procs", type=int, default=4)
+    parser.add_argument("--proc-records", type=int, default=20000, help="多进程写入的总条数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = os.path.join(tmp, "archive")
+        archive = ResultArchive(directory, segment_records=args.segment_records)
+        w = asyncio.run(write_phase(archive, args.records, args.rate))
+        segments = len([name for name in os.listdir(directory) if name.endswith(".log")])
+        print(f"写入 {args.records} 条（{args.rate:.0f} 条/秒，{segments} 个段）: {w['elapsed']:.1f}s，"
+              f"append() p99 {w['append_p99_us']:.0f}µs，成组提交 {w['commits']} 次"
+              f"（平均每次 {args.records / max(1, w['commits']):.0f} 条）")
+        print(f"  事件循环延迟 p99 {w['lag_p99_ms']:.1f}ms  max {w['lag_max_ms']:.1f}ms")
+        print(f"  磁盘: 记录 {disk_usage(directory, '.log') / 2 ** 20:.0f} MB，索引 {disk_usage(directory, '.idx') / 2 ** 20:.1f} MB"
+              f"（平均每条 {disk_usage(directory, '.log') / args.records:.0f} 字节）")
+
+        r = read_phase(directory, args.segment_records, args.records, args.reads)
+        print(f"随机读取 {args.reads} 次: get() p50 {r['p50_us']:.1f}µs  p99 {r['p99_us']:.1f}µs  缺失 {r['missing']}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        m = multiprocess_phase(os.path.join(tmp, "archive"), min(args.segment_records, args.proc_records // 2),
+                               args.procs, args.proc_records)
+        print(f"{args.procs} 个进程交替写入 {args.proc_records} 条: {m['elapsed']:.1f}s，校验失败 {m['bad']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""诊断序号计数器基准测试 - 多进程并发递增
+
+N 个进程同时对同一个计数文件调用 SequenceCounter.next()，
+校验所有序号互不重复，并输出吞吐量。
+
+用法：
+    python benchmarks/bench_counter.py [--procs 8] [--count 20000] [--block-sizes 1,16,256]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+# 将 backend 目录加入 sys.path 以便导入 services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.counter import SequenceCounter
+
+
+def worker(path: str, block_size: int, count: int, start_event, out_path: str):
+    counter = SequenceCounter(path, block_size=block_size)
+    counter.open()
+    start_event.wait()
+    values = [counter.next() for _ in range(count)]
+    counter.close()
+    with open(out_path, "w") as f:
+        f.write("\n".join(map(str, values)))
+
+
+def run(procs: int, count: int, block_size: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "counter.bin")
+        start_event = multiprocessing.Event()
+        outputs = [os.path.join(tmp, f"out-{i}.txt") for i in range(procs)]
+        workers = [
+            multiprocessing.Process(target=worker, args=(path, block_size, count, start_event, out))
+            for out in outputs
+        ]
+        for p in workers:
+            p.start()
+        time.sleep(0.5)  # 等待所有进程完成初始化
+
+        started = time.perf_counter()
+        start_event.set()
+        for p in workers:
+            p.join()
+        elapsed = time.perf_counter() - started
+
+        assert all(p.exitcode == 0 for p in workers), "worker 进程异常退出"
+        values = []
+        for out in outputs:
+            with open(out) as f:
+                values.extend(int(line) for line in f.read().split())
+        assert len(values) == procs * count, f"序号数量不符: {len(values)}"
+        assert len(set(values)) == len(values), "出现重复序号"
+        assert min(values) >= 1
+        return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--procs", type=int, default=8)
+    parser.add_argument("--count", type=int, default=20000, help="每个进程获取的序号数")
+    parser.add_argument("--block-sizes", default="1,16,256")
+    args = parser.parse_args()
+
+    total = args.procs * args.count
+    print(f"{'block':>6} {'procs':>6} {'total':>9} {'seconds':>8} {'ops/s':>12}")
+    for block_size in (int(x) for x in args.block_sizes.split(",")):
+        elapsed = run(args.procs, args.count, block_size)
+        print(f"{block_size:>6} {args.procs:>6} {total:>9} {elapsed:>8.3f} {total / elapsed:>12,.0f}")
+    print("✅ 所有序号唯一")
+
+
+if __name__ == "__main__":
+    main()
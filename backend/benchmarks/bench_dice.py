@@ -0,0 +1,120 @@
+"""骰子结果池基准测试 - 点骰子的诊断与手写症状的诊断延迟对比
+
+- 上游替身与被测 app 的运行方式同 loadtest.py（替身在子进程，app 在后台线程）
+- 先等结果池填满（记录填满耗时与 LLM 调用次数），然后按 --concurrency 并发发送 --requests 个请求：
+  - dice:  GET /api/dice 取文案，再用该文案请求 /api/diagnose/stream（池中有结果时直接回放）
+  - typed: 用 loadtest.py 的症状列表请求 /api/diagnose/stream（每个请求都调用 LLM）
+- 输出两组请求到 species / done 的 p50 / p99、结果池命中与未命中次数，以及 dice 阶段打到 LLM 替身的调用数
+- 请求数超过池容量（文案数 x --pool-size）时，多出来的骰子请求回退到 LLM，可观察补充速率跟不上时的表现
+
+用法：
+    python benchmarks/bench_dice.py [--requests 30] [--concurrency 5] [--pool-size 3] [--refill-per-minute 600] [--llm-latency 1.0]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+# 将 backend 目录加入 sys.path 以便导入 main 与 services
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+import httpx
+
+from loadtest import SYMPTOMS, BackendServer, MockProcess, configure_env, percentiles, stream_request
+
+
+async def drive(base_url: str, mode: str, requests: int, concurrency: int) -> list:
+    jobs = iter(range(requests))
+    records = []
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0) as client:
+        async def worker():
+            for _ in jobs:
+                if mode == "dice":
+                    started = time.perf_counter()
+                    symptom = (await client.get("/api/dice")).json()["symptom"]
+                    record = await stream_request(client, symptom)
+                    # 计入取文案的一次往返
+                    offset = time.perf_counter() - started - record["total"]
+                    for key in ("species", "done"):
+                        if key in record:
+                            record[key] += offset
+                else:
+                    record = await stream_request(client, random.choice(SYMPTOMS))
+                records.append(record)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--pool-size", type=int, default=3, help="DICE_POOL_SIZE")
+    parser.add_argument("--refill-per-minute", type=float, default=600, help="DICE_POOL_REFILL_PER_MINUTE")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="LLM 替身首字延迟（秒）")
+    parser.add_argument("--llm-rate", type=float, default=60.0, help="LLM 替身每秒输出的 chunk 数")
+    parser.add_argument("--fill-timeout", type=float, default=120, help="等待结果池填满的最长时间（秒）")
+    args = parser.parse_args()
+    # MockProcess / configure_env 需要的其它参数
+    args.new_species_rate, args.seedream_delay, args.qiniu_delay = 0.0, 1.0, 0.5
+    args.on_miss, args.cache = "generate", False
+    args.llm_mode, args.llm_fast_latency, args.llm_fast_rate = "single", 0.15, 300.0
+    args.llm_fail_rate = 0.0
+
+    with MockProcess(args) as mock, tempfile.TemporaryDirectory() as tmp:
+        configure_env(mock.url, args, tmp)
+        os.environ.update({
+            "DICE_POOL_ENABLED": "true",
+            "DICE_POOL_SIZE": str(args.pool_size),
+            "DICE_POOL_REFILL_PER_MINUTE": str(args.refill_per_minute),
+        })
+        logging.disable(logging.INFO)
+
+        import main as backend
+        from services.counter import SequenceCounter
+        from services.dice_pool import dice_pool
+        from services.gallery_expansion import miss_store
+        from services.local_classifier import decision_log
+        from services.result_archive import result_archive
+        from services.species_registry import species_registry
+
+        backend.sequence_counter = SequenceCounter(os.path.join(tmp, "counter.bin"))
+        species_registry.path = os.path.join(tmp, "generated_species.jsonl")
+        miss_store.path = os.path.join(tmp, "species_misses.json")
+        decision_log.path = os.path.join(tmp, "llm_decisions.jsonl")
+        result_archive.directory = os.path.join(tmp, "archive")
+
+        capacity = len(dice_pool.symptoms) * args.pool_size
+        with BackendServer(backend.app) as server:
+            started = time.perf_counter()
+            while len(dice_pool) < capacity and time.perf_counter() - started < args.fill_timeout:
+                time.sleep(0.1)
+            print(f"结果池: {len(dice_pool)}/{capacity} 份（{len(dice_pool.symptoms)} 条文案 x {args.pool_size}），"
+                  f"填满耗时 {time.perf_counter() - started:.1f}s，LLM 调用 {mock.stats()['llm_requests']} 次")
+
+            print(f"\n{args.requests} 个请求 @ 并发 {args.concurrency}，LLM 替身首字延迟 {args.llm_latency}s")
+            print(f"{'mode':<6} {'ok':>4} {'species p50/p99 (ms)':>22} {'done p50/p99 (ms)':>20} {'LLM 调用':>9}")
+            for mode in ("dice", "typed"):
+                hits, llm_before = dice_pool.hits, mock.stats()["llm_requests"]
+                records = asyncio.run(drive(server.url, mode, args.requests, args.concurrency))
+                ok = [r for r in records if r["ok"]]
+                species = percentiles([r["species"] for r in ok if "species" in r])
+                done = percentiles([r["done"] for r in ok])
+                # dice 阶段的 LLM 调用包括回退请求与后台补充
+                print(f"{mode:<6} {len(ok):>4} {species.get('p50', 0):>11.0f}/{species.get('p99', 0):<10.0f} "
+                      f"{done.get('p50', 0):>9.0f}/{done.get('p99', 0):<10.0f} {mock.stats()['llm_requests'] - llm_before:>9}")
+                if mode == "dice":
+                    print(f"       结果池命中 {dice_pool.hits - hits}，未命中 {dice_pool.misses}，"
+                          f"剩余 {len(dice_pool)} 份")
+
+
+if __name__ == "__main__":
+    main()
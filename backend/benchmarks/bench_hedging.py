@@ -0,0 +1,134 @@
+"""LLM 对冲请求与故障转移基准测试
+
+在两个本地 OpenAI 兼容替身上（各自独立的事件循环线程）按给定并发发起流式调用，
+测量 LLMBackendPool.open_stream() 的首字延迟（TTFT）与整段输出耗时：
+- tail:     首选后端有 --slow-rate 的请求首字延迟为 --slow-latency 秒（长尾），备用后端正常；
+            对比只用首选后端（single）、两个后端但不对冲（failover）与对冲（hedge）
+- failing:  首选后端每个请求都返回 500，检查故障转移与熔断（熔断后不再打到首选后端）
+
+输出各后端收到的请求数、被取消（落选后关闭连接）的请求数，以及 won / lost / failed 次数。
+
+用法：
+    python benchmarks/bench_hedging.py [--requests 300] [--concurrency 10] [--slow-rate 0.05] [--slow-latency 3]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# 将 backend 目录加入 sys.path 以便导入 services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from mock_upstreams import MockOptions, MockServer
+from services.http_clients import clients
+from services.llm_backends import LLMBackend, LLMBackendPool
+from services.metrics import LLM_ATTEMPTS, LLM_HEDGES
+
+MESSAGES = [{"role": "user", "content": "【现存馆藏列表】水豚、树懒\n\n请鉴定这个人的精神物种：今天不想上班"}]
+
+
+def quantile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def attempts(names: list) -> dict:
+    return {name: {outcome: int(LLM_ATTEMPTS.get(name, outcome)) for outcome in ("won", "lost", "failed")}
+            for name in names}
+
+
+async def drive(pool: LLMBackendPool, requests: int, concurrency: int) -> dict:
+    ttft, total, errors = [], [], 0
+    jobs = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in jobs:
+            started = time.perf_counter()
+            try:
+                stream = await pool.open_stream(MESSAGES, temperature=1.0)
+            except Exception:
+                errors += 1
+                continue
+            ttft.append(time.perf_counter() - started)
+            try:
+                async for _ in stream.contents():
+                    pass
+            finally:
+                await stream.close()
+            total.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    # 等待落选请求关闭上游连接
+    while pool._abandoned:
+        await asyncio.sleep(0.05)
+    return {
+        "ttft_p50": statistics.median(ttft) if ttft else 0.0,
+        "ttft_p99": quantile(ttft, 0.99) if ttft else 0.0,
+        "ttft_max": max(ttft) if ttft else 0.0,
+        "total_p99": quantile(total, 0.99) if total else 0.0,
+        "errors": errors,
+    }
+
+
+def make_pool(servers: list, hedge: bool, breaker_failures: int = 3) -> LLMBackendPool:
+    backends = [LLMBackend(name, server.url + "/v1", "mock", "mock-key", breaker_failures=breaker_failures)
+                for name, server in servers]
+    return LLMBackendPool(backends, hedge_enabled=hedge, hedge_default_delay=1.0, hedge_min_delay=0.3)
+
+
+async def run_scenario(label: str, servers: list, hedge: bool, args) -> None:
+    names = [name for name, _ in servers]
+    before = {name: dict(server.stats) for name, server in servers}
+    attempts_before = attempts(names)
+    hedges_before = {name: LLM_HEDGES.get(name) for name in names}
+
+    result = await drive(make_pool(servers, hedge), args.requests, args.concurrency)
+    await asyncio.sleep(0.3)
+
+    print(f"\n[{label}] TTFT p50 {result['ttft_p50'] * 1000:.0f}ms  p99 {result['ttft_p99'] * 1000:.0f}ms  "
+          f"max {result['ttft_max'] * 1000:.0f}ms  |  整段 p99 {result['total_p99'] * 1000:.0f}ms  |  失败 {result['errors']}")
+    after_attempts = attempts(names)
+    for name, server in servers:
+        requested = server.stats["llm_requests"] - before[name]["llm_requests"]
+        aborted = server.stats["llm_aborted"] - before[name]["llm_aborted"]
+        failed = server.stats["llm_failed"] - before[name]["llm_failed"]
+        counts = {outcome: after_attempts[name][outcome] - attempts_before[name][outcome]
+                  for outcome in ("won", "lost", "failed")}
+        hedges = int(LLM_HEDGES.get(name) - hedges_before[name])
+        print(f"  {name:<9} 请求 {requested:>4}  取消 {aborted:>4}  500 {failed:>4}  |  "
+              f"won {counts['won']:>4}  lost {counts['lost']:>4}  failed {counts['failed']:>4}  对冲触发 {hedges}")
+
+
+async def main_async(args):
+    tail = MockOptions(llm_latency=args.latency, llm_rate=args.llm_rate,
+                       llm_slow_rate=args.slow_rate, llm_slow_latency=args.slow_latency)
+    healthy = MockOptions(llm_latency=args.latency, llm_rate=args.llm_rate)
+    failing = MockOptions(llm_latency=args.latency, llm_rate=args.llm_rate, llm_fail_rate=1.0)
+
+    print(f"请求 {args.requests}，并发 {args.concurrency}，首字延迟 {args.latency * 1000:.0f}ms，"
+          f"首选后端长尾 {args.slow_rate:.0%} × {args.slow_latency:.1f}s")
+    with MockServer(tail) as primary, MockServer(healthy) as secondary, MockServer(failing) as broken:
+        await run_scenario("tail / single", [("primary", primary)], hedge=False, args=args)
+        await run_scenario("tail / failover", [("primary", primary), ("secondary", secondary)], hedge=False, args=args)
+        await run_scenario("tail / hedge", [("primary", primary), ("secondary", secondary)], hedge=True, args=args)
+        await run_scenario("failing / hedge", [("broken", broken), ("secondary", secondary)], hedge=True, args=args)
+    await clients.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.3, help="正常请求的首字延迟（秒）")
+    parser.add_argument("--llm-rate", type=float, default=200.0, help="每秒输出的 chunk 数")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="首选后端长尾请求的比例")
+    parser.add_argument("--slow-latency", type=float, default=3.0, help="长尾请求的首字延迟（秒）")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""本地物种分类器基准测试 - 推理延迟与 LLM 故障时的兜底效果
+
+1. 推理：在本进程中对 loadtest.py 的症状列表（及其变体）反复调用 classify() / diagnose()，
+   输出首次构建权重矩阵的耗时与单次推理的 p50 / p99 / max（目标：远低于 1ms）
+2. 端到端（--no-e2e 时跳过）：在相同的上游替身参数下以不同配置运行 loadtest.py（各自一个子进程，
+   配置在导入时读取），对比流式请求成功数、到 species / done 的 p50 / p99 与 LLM 替身收到的调用数：
+   - llm:         正常调用 LLM
+   - share:       LOCAL_CLASSIFIER_SHARE=1，全部走本地
+   - outage:      LLM 替身全部返回 500，LOCAL_CLASSIFIER_FALLBACK=true 本地兜底（后端熔断后直接走本地，不再打到 LLM）
+   - no-fallback: LLM 替身全部返回 500，不开启兜底（默认行为：全部失败）
+
+用法：
+    python benchmarks/bench_local_classifier.py [--iterations 20000] [--model data/local_classifier.npz] [--requests 200] [--concurrency 20]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+# 将 backend 目录加入 sys.path 以便导入 services
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+from loadtest import SYMPTOMS
+from services.local_classifier import MODEL_FILE, LocalClassifier
+
+SCENARIOS = [
+    ("llm", 0.0, {}),
+    ("share", 0.0, {"LOCAL_CLASSIFIER_SHARE": "1"}),
+    ("outage", 1.0, {"LOCAL_CLASSIFIER_FALLBACK": "true"}),
+    ("no-fallback", 1.0, {}),
+]
+
+
+def bench_inference(args):
+    classifier = LocalClassifier(model_path=args.model)
+    started = time.perf_counter()
+    classifier.classify(SYMPTOMS[0])
+    build_ms = (time.perf_counter() - started) * 1000
+    texts = SYMPTOMS + [f"{symptom}，{i}天了" for i, symptom in enumerate(SYMPTOMS)]
+    print(f"模型: {args.model if os.path.exists(args.model) else '无（种子关键词 + 物种描述）'}，"
+          f"训练样本 {classifier.trained_samples} 条，首次构建 {build_ms:.1f} ms")
+    print(f"{'call':<10} {'p50 (µs)':>9} {'p99 (µs)':>9} {'max (µs)':>9}")
+    for name, call in (("classify", classifier.classify), ("diagnose", classifier.diagnose)):
+        samples = []
+        for i in range(args.iterations):
+            text = texts[i % len(texts)]
+            t0 = time.perf_counter()
+            call(text)
+            samples.append(time.perf_counter() - t0)
+        samples.sort()
+        p50, p99 = samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+        print(f"{name:<10} {p50 * 1e6:>9.1f} {p99 * 1e6:>9.1f} {samples[-1] * 1e6:>9.1f}")
+
+
+def run_loadtest(fail_rate: float, env: dict, args, output: str) -> dict:
+    cmd = [
+        sys.executable, os.path.join(BENCH_DIR, "loadtest.py"), "--endpoint", "stream",
+        "--requests", str(args.requests), "--concurrency", str(args.concurrency),
+        "--llm-latency", str(args.llm_latency), "--llm-fail-rate", str(fail_rate), "--output", output,
+    ]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, env=dict(os.environ, **env))
+    with open(output, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--model", default=MODEL_FILE, help="训练好的模型文件（不存在时只用种子关键词）")
+    parser.add_argument("--no-e2e", action="store_true", help="只测推理延迟")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="LLM 替身首字延迟（秒）")
+    args = parser.parse_args()
+
+    bench_inference(args)
+    if args.no_e2e:
+        return
+
+    print(f"\n{args.requests} 个流式请求 @ 并发 {args.concurrency}，LLM 替身首字延迟 {args.llm_latency}s")
+    print(f"{'scenario':<12} {'ok':>5} {'species p50/p99 (ms)':>22} {'done p50/p99 (ms)':>20} {'LLM 调用':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, fail_rate, env in SCENARIOS:
+            result = run_loadtest(fail_rate, env, args, os.path.join(tmp, f"{name}.json"))
+            s = result["endpoints"]["stream"]
+            species, done = s["time_to_species_ms"], s["time_to_done_ms"]
+            print(f"{name:<12} {s['requests'] - s['errors']:>5} "
+                  f"{species.get('p50', 0):>11.0f}/{species.get('p99', 0):<10.0f} "
+                  f"{done.get('p50', 0):>9.0f}/{done.get('p99', 0):<10.0f} {result['upstreams']['llm_requests']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""日志基准测试 - 诊断热路径上日志占用的事件循环时间
+
+日志写到一个管道，管道另一端是按 --drain-kbps 限速读取的子进程（模拟终端、容器日志驱动、日志采集端跟不上的情况）。
+在事件循环上以 --concurrency 个并发"请求"重放诊断接口的日志调用，对比：
+- sync:  旧配置（basicConfig，StreamHandler 在调用线程同步写出），每个请求 7 条 INFO，含完整 LLM 结果与 Seedream 响应
+- queue: configure_logging()（队列 + 后台线程写出），请求日志 2 条 INFO，大段内容按 LOG_PAYLOAD_SAMPLE_RATE 采样，其余为 DEBUG
+
+输出每个请求在日志调用中花费的事件循环时间（均值 / p99）、事件循环延迟与实际写出的字节数。
+
+用法：
+    python benchmarks/bench_logging.py [--requests 2000] [--concurrency 50] [--drain-kbps 256] [--sample-rate 0.01]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# 将 backend 目录加入 sys.path 以便导入 services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROBE_INTERVAL = 0.005
+
+# 按 kbps 限速读取 stdin 并统计字节数
+READER = """
+import sys, time
+rate = float(sys.argv[1]) * 1024
+total, started = 0, time.perf_counter()
+while chunk := sys.stdin.buffer.read1(4096):
+    total += len(chunk)
+    if rate > 0:
+        time.sleep(max(0.0, total / rate - (time.perf_counter() - started)))
+print(total)
+"""
+
+RESULT = {
+    "type": "species", "object_name": "灵魂已离职的吗喽", "display_name": "工位上灵魂出窍的吗喽",
+    "keywords": ["摆烂", "社畜", "已读不回"], "image_url": "http://t8rb7429x.hn-bkt.clouddn.com/species/x.png",
+    "diagnosis": "经鉴定，该个体的精神已提前下班，" * 20,
+}
+SEEDREAM = {"model": "doubao-seedream-4-5-251128", "created": 1768310620,
+            "data": [{"url": "https://ark-content-generation.tos-cn-beijing.volces.com/" + "x" * 400, "size": "2048x2048"}],
+            "usage": {"generated_images": 1, "output_tokens": 16384, "total_tokens": 16384}}
+
+
+async def probe_loop_lag(samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        expected = time.perf_counter() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+def sync_request(logger: logging.Logger, i: int, timings: list):
+    """旧版诊断接口的日志调用"""
+    started = time.perf_counter()
+    logger.info(f"收到诊断请求: symptom='上班如上坟，心如死灰 #{i}'")
+    logger.info("开始调用 LLM 诊断...")
+    logger.info(f"LLM 原始响应: {str(RESULT)[:200]}...")
+    logger.info(f"LLM 诊断结果: {RESULT}")
+    logger.info(f"诊断计数器: {i}")
+    logger.info(f"display_name: {RESULT['display_name']}, object_name: {RESULT['object_name']}")
+    logger.info(str(SEEDREAM))
+    timings.append(time.perf_counter() - started)
+
+
+def queue_request(logger: logging.Logger, i: int, timings: list):
+    """当前诊断接口的日志调用"""
+    from services.logging_setup import payload_sampled, start_request
+
+    start_request()
+    started = time.perf_counter()
+    logger.info(f"收到诊断请求: symptom='上班如上坟，心如死灰 #{i}'")
+    logger.debug("开始调用 LLM 诊断...")
+    if payload_sampled():
+        logger.info(f"LLM 原始响应: {str(RESULT)[:200]}...")
+        logger.info(f"LLM 诊断结果: {RESULT}")
+        logger.info(f"Seedream 响应: {SEEDREAM}")
+    logger.debug(f"诊断计数器: {i}")
+    logger.debug(f"display_name: {RESULT['display_name']}, object_name: {RESULT['object_name']}")
+    logger.info(f"诊断成功: sequence_no={i}, object_name='{RESULT['object_name']}'")
+    timings.append(time.perf_counter() - started)
+
+
+async def drive(emit, logger: logging.Logger, requests: int, concurrency: int) -> dict:
+    timings, lag = [], []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_loop_lag(lag, stop))
+    jobs = iter(range(requests))
+
+    async def worker():
+        for i in jobs:
+            emit(logger, i, timings)
+            await asyncio.sleep(0.001)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+    return {
+        "elapsed": elapsed,
+        "mean_us": statistics.fmean(timings) * 1e6,
+        "p99_us": sorted(timings)[int(len(timings) * 0.99)] * 1e6,
+        "lag_p99_ms": sorted(lag)[int(len(lag) * 0.99)] * 1000 if lag else 0.0,
+        "lag_max_ms": max(lag, default=0.0) * 1000,
+    }
+
+
+def run_mode(mode: str, args) -> dict:
+    read_fd, write_fd = os.pipe()
+    reader = subprocess.Popen([sys.executable, "-c", READER, str(args.drain_kbps)], stdin=read_fd,
+                              stdout=subprocess.PIPE, text=True)
+    os.close(read_fd)
+    stream = os.fdopen(write_fd, "w", encoding="utf-8")
+
+    root = logging.getLogger()
+    if mode == "sync":
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+        root.handlers[:] = [handler]
+        root.setLevel(logging.INFO)
+        emit = sync_request
+    else:
+        from services import logging_setup
+
+        root.handlers[:] = []
+        logging_setup.configure_logging(stream)
+        emit = queue_request
+
+    result = asyncio.run(drive(emit, logging.getLogger("main"), args.requests, args.concurrency))
+    if mode == "queue":
+        logging_setup.shutdown_logging()
+        result["dropped"] = logging_setup.dropped_records()
+    root.handlers[:] = []
+    stream.close()
+    result["bytes"] = int(reader.communicate()[0])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--drain-kbps", type=float, default=256, help="日志读取端的吞吐（KB/s，<= 0 不限速）")
+    parser.add_argument("--sample-rate", type=float, default=0.01, help="LOG_PAYLOAD_SAMPLE_RATE")
+    parser.add_argument("--format", choices=["text", "json"], default="json", help="queue 模式的 LOG_FORMAT")
+    args = parser.parse_args()
+    os.environ["LOG_PAYLOAD_SAMPLE_RATE"] = str(args.sample_rate)
+    os.environ["LOG_FORMAT"] = args.format
+
+    print(f"{args.requests} 个请求，并发 {args.concurrency}，日志读取端 {args.drain_kbps:.0f} KB/s，"
+          f"采样率 {args.sample_rate:.0%}，queue 模式格式 {args.format}")
+    print(f"{'mode':<7} {'耗时':>8} {'日志/请求 均值':>14} {'p99':>10} {'循环延迟 p99':>12} {'max':>9} {'写出':>9}")
+    for mode in ("sync", "queue"):
+        r = run_mode(mode, args)
+        extra = f"  丢弃 {r['dropped']}" if r.get("dropped") else ""
+        print(f"{mode:<7} {r['elapsed']:>7.2f}s {r['mean_us']:>12.0f}µs {r['p99_us']:>8.0f}µs "
+              f"{r['lag_p99_ms']:>10.1f}ms {r['lag_max_ms']:>7.1f}ms {r['bytes'] / 1024:>7.0f}KB{extra}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Prompt 体积基准测试 - 全量物种列表 vs 检索短名单
+
+把图库扩充到 N 个物种（真实图库 + 合成物种），对比两种方式下每个请求发送的 prompt 大小：
+- full:      把全部物种名放进 prompt（旧做法）
+- shortlist: 静态 System Prompt + SpeciesIndex 检索出的 top-k 短名单
+
+同时测量 shortlist() 本身的耗时。加 --live 时会对 .env 中配置的 OpenAI 兼容接口发起真实的流式请求，
+测量两种方式的首字延迟（TTFT）。
+
+用法：
+    python benchmarks/bench_prompt_size.py [--sizes 22,50,80,200] [--k 12]
+    python benchmarks/bench_prompt_size.py --sizes 22,200 --live --runs 3
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# 将 backend 目录加入 sys.path 以便导入 services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.catalog import PRESET_SPECIES_FILE, PresetCatalog
+from services.llm_streaming import get_system_prompt
+from services.settings import settings
+from services.species_index import SpeciesIndex
+
+SYMPTOMS = [
+    "明天早八，但现在凌晨三点我还在刷视频",
+    "好生气，好想指着领导的面骂他一顿",
+    "上班像上坟，心情如死灰",
+    "周末又被拉去加班，工资还没涨",
+    "社恐发作，只想缩在角落里",
+]
+ADJECTIVES = ["过期的", "战损版", "正在融化的", "自闭的", "嘴硬的", "安详的", "炸毛的", "发霉的", "失眠的", "打结的"]
+OBJECTS = ["柠檬", "拖鞋", "充电宝", "路由器", "仙人掌", "电饭煲", "海绵", "橡皮擦", "风筝", "易拉罐", "台灯", "枕头"]
+
+
+def estimate_tokens(text: str) -> int:
+    """估算 token 数（安装了 tiktoken 时精确计算）"""
+    try:
+        import tiktoken
+
+        return len(tiktoken.get_encoding("o200k_base").encode(text))
+    except Exception:
+        ascii_chars = sum(1 for c in text if ord(c) < 128)
+        return (len(text) - ascii_chars) + ascii_chars // 4
+
+
+def build_catalog(size: int, tmp: str) -> PresetCatalog:
+    with open(PRESET_SPECIES_FILE, "r", encoding="utf-8") as f:
+        species = json.load(f)
+    rng = random.Random(size)
+    while len(species) < size:
+        name = f"{rng.choice(ADJECTIVES)}{rng.choice(OBJECTS)}{len(species)}"
+        species.append({"object_name": name, "image_url": f"https://cdn.example.com/{len(species)}.png"})
+    path = os.path.join(tmp, f"species-{size}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(species[:size], f, ensure_ascii=False)
+    return PresetCatalog(path)
+
+
+def messages(names, symptom: str):
+    return [
+        {"role": "system", "content": get_system_prompt()},
+        {"role": "user", "content": f"【现存馆藏列表】{'、'.join(names)}\n\n请鉴定这个人的精神物种：{symptom}"},
+    ]
+
+
+def prompt_tokens(names, symptom: str) -> int:
+    return sum(estimate_tokens(m["content"]) for m in messages(names, symptom))
+
+
+async def measure_ttft(names, symptom: str) -> float:
+    from services.http_clients import clients
+
+    t0 = time.perf_counter()
+    response = await clients.openai().chat.completions.create(
+        model=settings.openai_model_name, messages=messages(names, symptom), temperature=1.0, stream=True,
+    )
+    try:
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                return time.perf_counter() - t0
+    finally:
+        await response.close()
+    return time.perf_counter() - t0
+
+
+async def run_live(catalog: PresetCatalog, index: SpeciesIndex, runs: int):
+    full, short = [], []
+    for i in range(runs):
+        symptom = SYMPTOMS[i % len(SYMPTOMS)]
+        full.append(await measure_ttft(catalog.names, symptom))
+        short.append(await measure_ttft(index.shortlist(symptom), symptom))
+    return statistics.median(full) * 1000, statistics.median(short) * 1000
+
+
+def main():
+    logging.disable(logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="22,50,80,200")
+    parser.add_argument("--k", type=int, default=12)
+    parser.add_argument("--live", action="store_true", help="对真实接口测量首字延迟")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    header = f"{'species':>8} {'full tok':>9} {'short tok':>10} {'saved':>7} {'shortlist ms':>13}"
+    if args.live:
+        header += f" {'full TTFT ms':>13} {'short TTFT ms':>14}"
+    print(header)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(s) for s in args.sizes.split(",")):
+            catalog = build_catalog(size, tmp)
+            index = SpeciesIndex(catalog, top_k=args.k)
+            index.shortlist(SYMPTOMS[0])  # 构建索引
+
+            full_tokens = statistics.mean(prompt_tokens(catalog.names, s) for s in SYMPTOMS)
+            short_tokens = statistics.mean(prompt_tokens(index.shortlist(s), s) for s in SYMPTOMS)
+            t0 = time.perf_counter()
+            for _ in range(200):
+                index.shortlist(random.choice(SYMPTOMS))
+            shortlist_ms = (time.perf_counter() - t0) / 200 * 1000
+
+            line = (f"{size:>8} {full_tokens:>9.0f} {short_tokens:>10.0f} "
+                    f"{1 - short_tokens / full_tokens:>7.1%} {shortlist_ms:>13.3f}")
+            if args.live:
+                full_ttft, short_ttft = asyncio.run(run_live(catalog, index, args.runs))
+                line += f" {full_ttft:>13.0f} {short_ttft:>14.0f}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""七牛云上传基准测试 - 并发抓取时的事件循环延迟
+
+在本地七牛替身（抓取耗时 --delay 秒）上并发执行 N 次上传，同时用一个
+每 5ms 唤醒一次的探针协程测量事件循环延迟，对比：
+- legacy: 在协程中直接发起同步请求（等价于旧版 BucketManager.fetch 的调用方式）
+- async:  save_to_qiniu 的异步实现
+
+用法：
+    python benchmarks/bench_qiniu_upload.py [--concurrency 20] [--delay 0.3]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# 将 backend 目录加入 sys.path 以便导入 services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+from mock_upstreams import MockOptions, MockServer
+
+PROBE_INTERVAL = 0.005
+
+
+async def probe_loop_lag(samples: list, stop: asyncio.Event):
+    """记录每次唤醒相对预期时间的延迟"""
+    while not stop.is_set():
+        expected = time.perf_counter() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+def legacy_fetch(qiniu_storage, source_url: str, key: str) -> str:
+    """旧实现的调用方式：同步 HTTP 请求直接跑在事件循环线程里"""
+    io_host = qiniu_storage._io_host
+    path = (f"/fetch/{qiniu_storage._urlsafe_b64(source_url)}"
+            f"/to/{qiniu_storage._urlsafe_b64(f'{qiniu_storage.settings.qiniu_bucket}:{key}')}")
+    response = httpx.post(f"{io_host}{path}", headers={"Authorization": qiniu_storage._management_token(path)})
+    response.raise_for_status()
+    return qiniu_storage.get_image_url(key)
+
+
+async def run(mode: str, concurrency: int, qiniu_storage) -> dict:
+    samples = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_loop_lag(samples, stop))
+    await asyncio.sleep(0.05)
+
+    async def upload(i: int):
+        source, key = f"http://example.com/{i}.png", f"species/bench_{i}.png"
+        if mode == "legacy":
+            return legacy_fetch(qiniu_storage, source, key)
+        return await qiniu_storage.save_to_qiniu(source, key)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(upload(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+
+    samples.sort()
+    return {
+        "mode": mode,
+        "elapsed": elapsed,
+        "lag_max": samples[-1] if samples else 0.0,
+        "lag_p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))] if samples else 0.0,
+        "lag_mean": statistics.fmean(samples) if samples else 0.0,
+    }
+
+
+async def bench(args, server: MockServer):
+    from services import qiniu_storage
+    from services.http_clients import clients
+
+    await qiniu_storage._get_io_host()
+    print(f"{'mode':>8} {'uploads':>8} {'seconds':>8} {'lag max(ms)':>12} {'lag p99(ms)':>12} {'lag mean(ms)':>13}")
+    for mode in ("legacy", "async"):
+        result = await run(mode, args.concurrency, qiniu_storage)
+        print(f"{mode:>8} {args.concurrency:>8} {result['elapsed']:>8.2f} {result['lag_max'] * 1e3:>12.1f}"
+              f" {result['lag_p99'] * 1e3:>12.1f} {result['lag_mean'] * 1e3:>13.2f}")
+    print(f"mock 最大并发抓取数: {server.stats['qiniu_inflight_max']} (QINIU_MAX_CONCURRENCY={qiniu_storage.settings.qiniu_max_concurrency})")
+    await clients.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.3, help="替身模拟的单次抓取耗时（秒）")
+    args = parser.parse_args()
+
+    with MockServer(MockOptions(qiniu_delay=args.delay)) as server:
+        # 必须在导入 services 之前设置
+        os.environ["QINIU_UC_HOST"] = server.url
+        os.environ.setdefault("QINIU_ACCESS_KEY", "bench-ak")
+        os.environ.setdefault("QINIU_SECRET_KEY", "bench-sk")
+        asyncio.run(bench(args, server))
+
+
+if __name__ == "__main__":
+    main()
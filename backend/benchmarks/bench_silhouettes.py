@@ -0,0 +1,99 @@
+"""剪影图集基准测试 - 首次生成、增量重建与首页下载量
+
+在本地图库 CDN 替身（白底涂鸦风格的随机图片）上：
+- 测量 silhouette_tile() 处理单张图片的耗时
+- 首次生成 N 个物种的图集：耗时、下载原图数、图集大小 vs 全部原图大小
+- 图库新增 --add 个物种后增量重建：只下载新增的原图，重建耗时
+- 图库未变化时 refresh() 的耗时（应接近 0）
+
+用法：
+    python benchmarks/bench_silhouettes.py [--species 22,100] [--add 3] [--tile 128]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# 将 backend 目录加入 sys.path 以便导入 services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from mock_upstreams import MockServer, doodle_png
+from services.catalog import PresetCatalog
+from services.http_clients import clients
+from services.silhouette_atlas import ATLAS_AVAILABLE, SilhouetteAtlas, silhouette_tile
+
+
+def write_catalog(catalog: PresetCatalog, server: MockServer, count: int):
+    host = server.url.removeprefix("http://")
+    # 与线上图库一致：链接不带协议
+    catalog.save([{"object_name": f"物种{i}", "image_url": f"{host}/species/{i}.png"} for i in range(count)])
+
+
+async def bench(count: int, add: int, tile: int, server: MockServer):
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog = PresetCatalog(os.path.join(tmp, "preset_species.json"))
+        atlas = SilhouetteAtlas(catalog, os.path.join(tmp, "silhouettes"), tile_size=tile)
+        source_bytes = sum(len(doodle_png(str(i))) for i in range(count))
+
+        write_catalog(catalog, server, count)
+        before = server.stats["cdn_requests"]
+        started = time.perf_counter()
+        await atlas.refresh()
+        cold = time.perf_counter() - started
+        cold_downloads = server.stats["cdn_requests"] - before
+        atlas_bytes = len(atlas.image)
+
+        started = time.perf_counter()
+        await atlas.refresh()
+        unchanged = time.perf_counter() - started
+
+        write_catalog(catalog, server, count + add)
+        before = server.stats["cdn_requests"]
+        started = time.perf_counter()
+        await atlas.refresh()
+        incremental = time.perf_counter() - started
+        incremental_downloads = server.stats["cdn_requests"] - before
+
+        print(f"\n{count} 个物种（tile {tile}px）")
+        print(f"  首次生成    {cold * 1000:>8.0f}ms  下载原图 {cold_downloads}")
+        print(f"  未变化      {unchanged * 1000:>8.2f}ms")
+        print(f"  新增 {add} 个   {incremental * 1000:>8.0f}ms  下载原图 {incremental_downloads}")
+        print(f"  首页下载量  原图合计 {source_bytes / 1024:.0f} KB ({count} 个请求) -> "
+              f"图集 {atlas_bytes / 1024:.0f} KB + 偏移表 {len(atlas.payload) / 1024:.1f} KB (2 个请求)")
+        print(f"  图集尺寸    {atlas.manifest['width']}x{atlas.manifest['height']}，{len(json.loads(atlas.payload)['items'])} 个格子")
+
+
+async def main_async(args):
+    sample = doodle_png("sample")
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        silhouette_tile(sample, args.tile, 40)
+        timings.append(time.perf_counter() - started)
+    print(f"silhouette_tile(): 1024x1024 原图 -> {args.tile}px 剪影，中位数 {statistics.median(timings) * 1000:.1f}ms")
+
+    with MockServer() as server:
+        for count in args.species:
+            await bench(count, args.add, args.tile, server)
+    await clients.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--species", type=lambda s: [int(x) for x in s.split(",")], default=[22, 100])
+    parser.add_argument("--add", type=int, default=3, help="增量重建时新增的物种数")
+    parser.add_argument("--tile", type=int, default=128, help="剪影格子边长（像素）")
+    parser.add_argument("--repeat", type=int, default=20, help="单张处理耗时的测量次数")
+    args = parser.parse_args()
+    if not ATLAS_AVAILABLE:
+        sys.exit("需要安装 numpy 与 Pillow")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""近似症状缓存基准测试 - 不同缓存规模下的查询耗时
+
+向 SimilarSymptomCache 写入 N 条随机生成的中文症状，然后测量 get() 的耗时
+（包含向量化、矩阵-向量乘法与 top-k 选择），并统计改写后的症状的命中率。
+
+用法：
+    python benchmarks/bench_similar_cache.py [--sizes 10000,50000,100000] [--queries 500] [--dim 512]
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+# 将 backend 目录加入 sys.path 以便导入 services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.similar_cache import SimilarSymptomCache
+
+# 常用字，用于拼出长度 5~30 的随机症状
+CHARS = "上班像如坟心情死灰今天好累不想动老板又画饼烦了我是一条咸鱼周末加班工资没涨头发掉光熬夜失眠焦虑内卷躺平摸鱼早八困到爆炸"
+RESULT = {"object_name": "咸鱼", "display_name": "咸鱼", "keywords": ["躺平"], "diagnosis": "诊断文案"}
+
+
+def random_symptom(rng: random.Random) -> str:
+    return "".join(rng.choice(CHARS) for _ in range(rng.randint(5, 30)))
+
+
+def paraphrase(symptom: str, rng: random.Random) -> str:
+    """替换一个字，模拟 "上班如上坟" / "上班像上坟" 这样的改写（命中率随 SIMILAR_CACHE_THRESHOLD 与症状长度变化）"""
+    i = rng.randrange(len(symptom))
+    return symptom[:i] + rng.choice(CHARS) + symptom[i + 1:]
+
+
+def run(size: int, queries: int, dim: int, seed: int):
+    rng = random.Random(seed)
+    cache = SimilarSymptomCache(capacity=size, dim=dim)
+    symptoms = [random_symptom(rng) for _ in range(size)]
+    for s in symptoms:
+        cache.put(s, RESULT)
+
+    timings = []
+    for _ in range(queries):
+        query = paraphrase(rng.choice(symptoms), rng)
+        t0 = time.perf_counter()
+        cache.get(query)
+        timings.append(time.perf_counter() - t0)
+
+    timings.sort()
+    p50 = statistics.median(timings) * 1000
+    p99 = timings[int(len(timings) * 0.99) - 1] * 1000
+    stats = cache.stats()
+    print(f"{size:>8} {dim:>5} {stats['bytes'] / 1024 / 1024:>9.1f} {p50:>9.3f} {p99:>9.3f} "
+          f"{stats['hit_rate']:>8.1%}")
+
+
+def main():
+    logging.disable(logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,50000,100000")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'entries':>8} {'dim':>5} {'matrix MB':>9} {'p50 ms':>9} {'p99 ms':>9} {'hit rate':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        run(size, args.queries, args.dim, args.seed)
+
+
+if __name__ == "__main__":
+    main()
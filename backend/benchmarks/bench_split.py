@@ -0,0 +1,62 @@
+"""拆分模式基准测试 - 单次调用与"快速模型归类 + 诊断文案"两次调用的 species 事件延迟对比
+
+在相同的上游替身参数下分别以 --llm-mode single / split 运行 loadtest.py（各自一个子进程，
+因为 LLM_SPLIT_MODE 在导入时读取），汇总两种模式下流式请求到 species / image / done 的 p50 / p99
+与 LLM 替身收到的调用数。
+
+替身的时间模型：主模型首字延迟 --llm-latency、每秒 --llm-rate 个 chunk（单次调用要先写完物种字段才有 species 事件）；
+快速模型首字延迟 --llm-fast-latency、每秒 --llm-fast-rate 个 chunk。
+
+用法：
+    python benchmarks/bench_split.py [--requests 200] [--concurrency 20] [--llm-latency 0.3] [--llm-rate 60] [--new-species-rate 0.3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_loadtest(mode: str, args, output: str) -> dict:
+    cmd = [
+        sys.executable, os.path.join(BENCH_DIR, "loadtest.py"), "--endpoint", "stream", "--llm-mode", mode,
+        "--requests", str(args.requests), "--concurrency", str(args.concurrency),
+        "--llm-latency", str(args.llm_latency), "--llm-rate", str(args.llm_rate),
+        "--llm-fast-latency", str(args.llm_fast_latency), "--llm-fast-rate", str(args.llm_fast_rate),
+        "--new-species-rate", str(args.new_species_rate), "--output", output,
+    ]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+    with open(output, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="主模型替身首字延迟（秒）")
+    parser.add_argument("--llm-rate", type=float, default=60.0, help="主模型替身每秒输出的 chunk 数")
+    parser.add_argument("--llm-fast-latency", type=float, default=0.15, help="快速模型替身首字延迟（秒）")
+    parser.add_argument("--llm-fast-rate", type=float, default=300.0, help="快速模型替身每秒输出的 chunk 数")
+    parser.add_argument("--new-species-rate", type=float, default=0.3, help="LLM 替身返回新物种（需要生成图片）的概率")
+    args = parser.parse_args()
+
+    print(f"{args.requests} 个流式请求 @ 并发 {args.concurrency}；主模型 {args.llm_latency}s + {args.llm_rate:.0f} chunk/s，"
+          f"快速模型 {args.llm_fast_latency}s + {args.llm_fast_rate:.0f} chunk/s，新物种 {args.new_species_rate:.0%}")
+    print(f"{'mode':<7} {'ok':>5} {'species p50/p99 (ms)':>22} {'image p50/p99 (ms)':>20} {'done p50/p99 (ms)':>20} {'LLM 调用':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("single", "split"):
+            result = run_loadtest(mode, args, os.path.join(tmp, f"{mode}.json"))
+            s = result["endpoints"]["stream"]
+            species, image, done = s["time_to_species_ms"], s["time_to_image_ms"], s["time_to_done_ms"]
+            print(f"{mode:<7} {s['requests'] - s['errors']:>5} "
+                  f"{species.get('p50', 0):>11.0f}/{species.get('p99', 0):<10.0f} "
+                  f"{image.get('p50', 0):>9.0f}/{image.get('p99', 0):<10.0f} "
+                  f"{done.get('p50', 0):>9.0f}/{done.get('p99', 0):<10.0f} {result['upstreams']['llm_requests']:>9}")
+
+
+if __name__ == "__main__":
+    main()
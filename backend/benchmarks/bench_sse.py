@@ -0,0 +1,123 @@
+"""SSE 编码基准测试 - 每个响应的帧数、字节数与编码耗时
+
+回放 fixtures/stream_chunks.json 中录制的 chunk 序列（按 --rate 个 chunk/秒 的模拟时钟），
+经 DiagnosisStreamParser 得到事件后，对比两种编码方式：
+- legacy: 每个事件一帧，f"data: {json.dumps(event, ensure_ascii=False)}\\n\\n"
+- writer: SSEWriter（orjson/紧凑 JSON、预编码前缀、诊断文案按时间/大小窗口合并）
+
+用法：
+    python benchmarks/bench_sse.py [--rates 30,60,120] [--interval 0.05] [--max-bytes 256] [--repeat 2000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+# 将 backend 目录加入 sys.path 以便导入 services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import sse
+from services.json_stream import DiagnosisStreamParser
+
+FIXTURE_FILE = os.path.join(os.path.dirname(__file__), "fixtures", "stream_chunks.json")
+
+
+def timed_events(chunks, rate: float):
+    """[(到达时间, 事件)]，第 i 个 chunk 在 i / rate 秒到达"""
+    parser = DiagnosisStreamParser()
+    events = []
+    for i, piece in enumerate(chunks):
+        events.extend((i / rate, event) for event in parser.feed(piece))
+    events.extend((len(chunks) / rate, event) for event in parser.close())
+    return events
+
+
+def legacy_encode(events):
+    frames = [f"data: {json.dumps(event, ensure_ascii=False)}\n\n" for _, event in events]
+    frames.append(f"data: {json.dumps({'type': 'done', 'sequence_no': 12345}, ensure_ascii=False)}\n\n")
+    return [frame.encode("utf-8") for frame in frames]
+
+
+def writer_encode(events, interval: float, max_bytes: int):
+    """按事件到达时间驱动模拟时钟；两个事件之间若缓冲到期，模拟 asyncio.wait 超时后的 poll()"""
+    now = [0.0]
+    writer = sse.SSEWriter(interval, max_bytes, heartbeat_interval=15.0, clock=lambda: now[0])
+    frames = []
+    for at, event in events:
+        timeout = writer.timeout()
+        if timeout is not None and now[0] + timeout <= at:
+            now[0] += timeout
+            frame = writer.poll()
+            if frame:
+                frames.append(frame)
+        now[0] = at
+        if event["type"] == "diagnosis_chunk":
+            frame = writer.chunk(event["chunk"])
+            if frame:
+                frames.append(frame)
+        else:
+            frame = writer.flush()
+            if frame:
+                frames.append(frame)
+            frames.append(writer.event(event))
+    frame = writer.flush()
+    if frame:
+        frames.append(frame)
+    frames.append(writer.done(12345, True))
+    return frames
+
+
+def decoded_text(frames):
+    """还原客户端收到的诊断文案，校验两种方式结果一致"""
+    text = []
+    for frame in frames:
+        if frame.startswith(b"data: "):
+            event = json.loads(frame[6:])
+            if event["type"] == "diagnosis_chunk":
+                text.append(event["chunk"])
+    return "".join(text)
+
+
+def cpu_time(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rates", default="30,60,120", help="模拟的 LLM 输出速率（chunk/秒）")
+    parser.add_argument("--interval", type=float, default=0.05)
+    parser.add_argument("--max-bytes", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(FIXTURE_FILE, "r", encoding="utf-8") as f:
+        fixtures = json.load(f)
+
+    print(f"JSON encoder: {'orjson' if sse.orjson is not None else 'json'}; "
+          f"window {args.interval * 1000:.0f}ms / {args.max_bytes}B")
+    print(f"{'rate':>5} {'legacy frames':>14} {'writer frames':>14} {'legacy bytes':>13} {'writer bytes':>13}"
+          f" {'legacy us':>10} {'writer us':>10}")
+    for rate in (float(r) for r in args.rates.split(",")):
+        totals = [0, 0, 0, 0, 0.0, 0.0]
+        for fixture in fixtures:
+            events = timed_events(fixture["chunks"], rate)
+            legacy = legacy_encode(events)
+            writer = writer_encode(events, args.interval, args.max_bytes)
+            assert decoded_text(legacy) == decoded_text(writer), fixture["name"]
+            totals[0] += len(legacy)
+            totals[1] += len(writer)
+            totals[2] += sum(map(len, legacy))
+            totals[3] += sum(map(len, writer))
+            totals[4] += cpu_time(lambda: legacy_encode(events), args.repeat)
+            totals[5] += cpu_time(lambda: writer_encode(events, args.interval, args.max_bytes), args.repeat)
+        n = len(fixtures)
+        print(f"{rate:>5.0f} {totals[0] / n:>14.1f} {totals[1] / n:>14.1f} {totals[2] / n:>13.0f} {totals[3] / n:>13.0f}"
+              f" {totals[4] / n:>10.1f} {totals[5] / n:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""启动耗时基准测试 - 导入 main 与 lifespan 启动的耗时，超出预算时以非零状态退出
+
+每轮在新的子进程中用 `python -X importtime` 导入 main，再执行 lifespan 的启动阶段（不预热上游连接，
+计数器与新物种登记表写到临时目录），统计：
+- import: main 的累计导入耗时
+- own: 扣除 Web 框架（fastapi / starlette / pydantic / uvicorn）后，后端自身模块及其依赖的导入耗时
+- startup: lifespan 启动阶段（直到可以接收请求，包括在线程中预先导入 openai）的耗时
+同时检查导入 main 后不应被加载的重量级模块（openai、numpy 等首次使用时才导入）。
+
+可以在 CI 中运行，任一中位数超出预算或加载了不该加载的模块时退出码为 1：
+    python benchmarks/bench_startup.py [--runs 5] [--import-budget-ms 1200] [--own-budget-ms 150] [--startup-budget-ms 1500]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FRAMEWORK_MODULES = {"fastapi", "starlette", "pydantic", "pydantic_core", "uvicorn"}
+# 导入 main 之后不应出现的模块（首次使用时才导入）
+LAZY_MODULES = ["openai", "numpy", "PIL", "qiniu"]
+
+CHILD_SCRIPT = """
+import asyncio, json, os, sys, tempfile, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+loaded = [m for m in json.loads(sys.argv[1]) if m in sys.modules]
+from services.counter import SequenceCounter
+from services.gallery_expansion import miss_store
+from services.local_classifier import decision_log
+from services.result_archive import result_archive
+from services.species_registry import species_registry
+
+async def start():
+    async with main.app.router.lifespan_context(main.app):
+        return time.perf_counter()
+
+with tempfile.TemporaryDirectory() as tmp:
+    main.sequence_counter = SequenceCounter(os.path.join(tmp, "counter.bin"))
+    species_registry.path = os.path.join(tmp, "generated_species.jsonl")
+    miss_store.path = os.path.join(tmp, "species_misses.json")
+    decision_log.path = os.path.join(tmp, "llm_decisions.jsonl")
+    result_archive.directory = os.path.join(tmp, "archive")
+    t2 = time.perf_counter()
+    ready = asyncio.run(start())
+print(json.dumps({"import": t1 - t0, "startup": ready - t2, "loaded": loaded}))
+"""
+
+
+def parse_line(line: str):
+    """'import time:  self |  cumulative | name' -> (self, cumulative, depth, name)"""
+    head, cumulative, name = line.split("|")
+    self_us = int(head.split(":")[1])
+    depth = (len(name) - len(name.lstrip()) - 1) // 2
+    return self_us, int(cumulative), depth, name.strip()
+
+
+def measure_once() -> dict:
+    env = dict(os.environ, UPSTREAM_WARMUP="false", GALLERY_EXPANSION_ENABLED="false",
+               SILHOUETTE_ATLAS_ENABLED="false", DICE_POOL_ENABLED="false",
+               PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD_SCRIPT, json.dumps(LAZY_MODULES)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"child failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    total = framework = 0
+    self_times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            self_us, cumulative, depth, name = parse_line(line)
+        except ValueError:  # 表头
+            continue
+        self_times[name] = self_us
+        if depth == 0 and name == "main":
+            total = cumulative
+        elif depth == 1 and name.split(".")[0] in FRAMEWORK_MODULES:
+            framework += cumulative
+    result.update(import_tree_ms=total / 1000, own_ms=(total - framework) / 1000, self_times=self_times)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float, default=1200.0, help="导入 main 的总耗时预算")
+    parser.add_argument("--own-budget-ms", type=float, default=150.0, help="扣除 Web 框架后的导入耗时预算")
+    parser.add_argument("--startup-budget-ms", type=float, default=1500.0, help="lifespan 启动阶段（含预先导入 openai）的耗时预算")
+    parser.add_argument("--top", type=int, default=10, help="列出自身耗时最多的模块数")
+    args = parser.parse_args()
+
+    runs = [measure_once() for _ in range(args.runs)]
+    import_ms = statistics.median(r["import"] * 1000 for r in runs)
+    own_ms = statistics.median(r["own_ms"] for r in runs)
+    startup_ms = statistics.median(r["startup"] * 1000 for r in runs)
+    loaded = sorted({m for r in runs for m in r["loaded"]})
+
+    print(f"{args.runs} runs (median)")
+    print(f"{'import main':<22} {import_ms:>8.1f} ms   budget {args.import_budget_ms:.0f} ms")
+    print(f"{'  excluding framework':<22} {own_ms:>8.1f} ms   budget {args.own_budget_ms:.0f} ms")
+    print(f"{'lifespan startup':<22} {startup_ms:>8.1f} ms   budget {args.startup_budget_ms:.0f} ms")
+
+    slowest = sorted(runs[-1]["self_times"].items(), key=lambda item: -item[1])[:args.top]
+    print("\nslowest modules (self time, last run):")
+    for name, self_us in slowest:
+        print(f"  {self_us / 1000:>8.1f} ms  {name}")
+
+    failures = []
+    if import_ms > args.import_budget_ms:
+        failures.append(f"import main {import_ms:.1f} ms > {args.import_budget_ms:.0f} ms")
+    if own_ms > args.own_budget_ms:
+        failures.append(f"import excluding framework {own_ms:.1f} ms > {args.own_budget_ms:.0f} ms")
+    if startup_ms > args.startup_budget_ms:
+        failures.append(f"lifespan startup {startup_ms:.1f} ms > {args.startup_budget_ms:.0f} ms")
+    if loaded:
+        failures.append(f"modules that should load lazily were imported: {', '.join(loaded)}")
+    if failures:
+        print("\nFAIL")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
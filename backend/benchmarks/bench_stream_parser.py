@@ -0,0 +1,220 @@
+"""流式诊断解析器基准测试 - 回放录制的 chunk 序列
+
+对比旧实现（每个 chunk 复制整个缓冲区并尝试 json.loads）与
+DiagnosisStreamParser（每个 delta 只扫描一次）的解析耗时。
+
+旧实现找到物种信息之后每个 delta 只做几次子串替换，不解码转义，也不去掉缩进输出结尾的
+引号与换行（因此 legacy ok 为 0）；录制的短输出上增量解析器反而更慢（约 0.6x，
+转义密集的序列里每个 delta 都要解码 \\uXXXX），诊断文案变长或字段顺序不同时才更快。
+
+用法：
+    python benchmarks/bench_stream_parser.py [--repeat 200] [--scale 1,4,16]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+# 将 backend 目录加入 sys.path 以便导入 services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.json_stream import DiagnosisStreamParser
+
+FIXTURE_FILE = os.path.join(os.path.dirname(__file__), "fixtures", "stream_chunks.json")
+
+
+def legacy_parse(chunks):
+    """旧版 diagnose_symptom_streaming 中的解析逻辑（逐行照搬，只去掉网络调用、预置图库查询与日志）"""
+    events = []
+    full_content = ""
+    species_info_sent = False
+    diagnosis_started = False
+    diagnosis_buffer = ""
+
+    for piece in chunks:
+        full_content += piece
+
+        if not species_info_sent:
+            try:
+                clean_content = full_content
+                if clean_content.startswith("```json"):
+                    clean_content = clean_content.replace("```json", "", 1)
+                if clean_content.startswith("```"):
+                    clean_content = clean_content.replace("```", "", 1)
+
+                if '"diagnosis"' in clean_content:
+                    diagnosis_idx = clean_content.index('"diagnosis"')
+                    before_diagnosis = clean_content[:diagnosis_idx].rstrip().rstrip(',')
+
+                    try:
+                        partial_json = before_diagnosis + "}"
+                        partial_data = json.loads(partial_json)
+
+                        object_name = partial_data.get("object_name", "未知物种")
+                        display_name = partial_data.get("display_name") or object_name
+                        keywords = partial_data.get("keywords", ["神秘", "未知", "待鉴定"])
+
+                        events.append({
+                            "type": "species",
+                            "object_name": object_name,
+                            "display_name": display_name,
+                            "keywords": keywords,
+                            "image_url": None,
+                        })
+
+                        species_info_sent = True
+                        diagnosis_started = True
+
+                        after_diagnosis_key = clean_content[diagnosis_idx + len('"diagnosis"'):]
+                        colon_idx = after_diagnosis_key.find(':')
+                        if colon_idx != -1:
+                            after_colon = after_diagnosis_key[colon_idx + 1:].lstrip()
+                            if after_colon.startswith('"'):
+                                diagnosis_buffer = after_colon[1:]
+                                if diagnosis_buffer.endswith('"'):
+                                    diagnosis_buffer = diagnosis_buffer[:-1]
+                                if diagnosis_buffer.endswith('"}'):
+                                    diagnosis_buffer = diagnosis_buffer[:-2]
+                                if diagnosis_buffer:
+                                    events.append({"type": "diagnosis_chunk", "chunk": diagnosis_buffer})
+
+                    except json.JSONDecodeError:
+                        pass
+
+            except Exception:
+                pass
+
+        elif diagnosis_started:
+            new_text = piece
+
+            if '"}' in new_text or '```' in new_text:
+                new_text = new_text.replace('"}', '').replace('```', '').replace('"', '')
+
+            if new_text.strip() in ['}', ']', '"}', '"]']:
+                new_text = ""
+
+            if new_text.endswith('"}'):
+                new_text = new_text[:-2]
+            elif new_text.endswith('}'):
+                new_text = new_text[:-1]
+
+            if new_text.strip():
+                events.append({"type": "diagnosis_chunk", "chunk": new_text})
+
+    if not species_info_sent:
+        try:
+            clean_content = full_content
+            if clean_content.startswith("```json"):
+                clean_content = clean_content.replace("```json", "").replace("```", "").strip()
+            elif clean_content.startswith("```"):
+                clean_content = clean_content.replace("```", "").strip()
+
+            result = json.loads(clean_content)
+            object_name = result.get("object_name", "未知物种")
+            display_name = result.get("display_name") or object_name
+
+            events.append({
+                "type": "species",
+                "object_name": object_name,
+                "display_name": display_name,
+                "keywords": result.get("keywords", ["神秘", "未知", "待鉴定"]),
+                "image_url": None,
+            })
+
+            diagnosis = result.get("diagnosis", "你的精神物种正在鉴定中...")
+            events.append({"type": "diagnosis_chunk", "chunk": diagnosis})
+
+        except json.JSONDecodeError:
+            events.append({"type": "error", "message": "诊断解析失败，请重试"})
+    return events
+
+
+def incremental_parse(chunks):
+    parser = DiagnosisStreamParser()
+    events = []
+    for piece in chunks:
+        events.extend(parser.feed(piece))
+    events.extend(parser.close())
+    return events
+
+
+def split_record(chunks):
+    """还原录制序列对应的 JSON 对象，返回 (data, 是否有代码块, 平均 chunk 长度)"""
+    text = "".join(chunks)
+    fenced = text.startswith("```")
+    body = text.strip("`").removeprefix("json").strip() if fenced else text
+    avg = max(1, round(len(text) / len(chunks)))
+    return json.loads(body), fenced, avg
+
+
+def build_record(chunks, factor, diagnosis_first=False):
+    """
+    基于录制序列构造回放序列
+
+    factor: 诊断文案放大倍数，模拟更长的输出
+    diagnosis_first: 模型不按约定顺序、先输出 diagnosis 的情况
+    """
+    data, fenced, avg = split_record(chunks)
+    data["diagnosis"] = data["diagnosis"] * factor
+    if diagnosis_first:
+        data = {"diagnosis": data.pop("diagnosis"), **data}
+    if factor == 1 and not diagnosis_first:
+        return chunks, data
+    text = json.dumps(data, ensure_ascii=False, indent=2)
+    if fenced:
+        text = "```json\n" + text + "\n```"
+    # 保持原始序列的平均 chunk 长度
+    return [text[i:i + avg] for i in range(0, len(text), avg)], data
+
+
+def is_correct(events, expected):
+    """species 字段与拼接后的诊断文案是否与原始 JSON 一致"""
+    species = [e for e in events if e["type"] == "species"]
+    diagnosis = "".join(e["chunk"] for e in events if e["type"] == "diagnosis_chunk")
+    return (
+        len(species) == 1
+        and species[0].get("display_name") == expected["display_name"]
+        and species[0].get("keywords") == expected["keywords"]
+        and diagnosis == expected["diagnosis"]
+    )
+
+
+def bench(fn, records, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for chunks in records:
+            fn(chunks)
+    elapsed = time.perf_counter() - start
+    return elapsed / (repeat * len(records))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--scale", default="1,4,16", help="诊断文案放大倍数，逗号分隔")
+    args = parser.parse_args()
+
+    with open(FIXTURE_FILE, "r", encoding="utf-8") as f:
+        fixtures = json.load(f)
+
+    print(f"{'order':>16} {'scale':>6} {'chunks':>7} {'legacy(us)':>11} {'incr(us)':>9} {'speedup':>8} {'legacy ok':>10} {'incr ok':>8}")
+    for diagnosis_first in (False, True):
+        order = "diagnosis_first" if diagnosis_first else "recorded"
+        for factor in (int(x) for x in args.scale.split(",")):
+            pairs = [build_record(r["chunks"], factor, diagnosis_first) for r in fixtures]
+            records = [chunks for chunks, _ in pairs]
+            avg_chunks = sum(len(r) for r in records) / len(records)
+            legacy_ok = sum(is_correct(legacy_parse(c), d) for c, d in pairs)
+            incr_ok = sum(is_correct(incremental_parse(c), d) for c, d in pairs)
+            legacy = bench(legacy_parse, records, args.repeat)
+            incremental = bench(incremental_parse, records, args.repeat)
+            print(
+                f"{order:>16} {factor:>6} {avg_chunks:>7.0f} {legacy * 1e6:>11.1f} {incremental * 1e6:>9.1f}"
+                f" {legacy / incremental:>7.1f}x {legacy_ok:>6}/{len(pairs)} {incr_ok:>5}/{len(pairs)}"
+            )
+    print("\nspeedup < 1 表示增量解析器更慢；旧实现不解码转义、会把 JSON 结尾符号混入诊断文案（legacy ok 列），两者的工作量并不相同")
+
+
+if __name__ == "__main__":
+    main()
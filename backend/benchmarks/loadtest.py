@@ -0,0 +1,427 @@
+"""端到端压测 - 在本地上游替身上驱动 /api/diagnose/stream 与 /api/diagnose
+
+- 上游替身（OpenAI 兼容接口、Seedream、七牛）在独立子进程中运行，不占用被测进程的 GIL
+- 后端 app 在本进程的后台线程中由 uvicorn 运行，同一事件循环上挂一个探针协程测量事件循环延迟
+- 压测客户端在主线程中按给定并发发送请求，记录每个请求到 species 事件、image 事件和 done 的耗时
+- 结果保存为 JSON（默认 benchmarks/results/），可用 --compare 与之前的结果对比
+
+默认关闭诊断结果缓存与近似症状缓存（每个请求都会打到 LLM 替身），加 --cache 时保留缓存。
+计数器与新物种登记表写到临时目录，不影响 data/ 下的数据。
+
+用法：
+    python benchmarks/loadtest.py [--concurrency 50] [--requests 500] [--endpoint stream|post|mixed]
+    python benchmarks/loadtest.py --new-species-rate 0.3 --compare benchmarks/results/<之前的结果>.json
+    python benchmarks/loadtest.py --new-species-rate 0.5 --abandon-rate 0.3   # 部分客户端收到物种后即断开
+    python benchmarks/loadtest.py --llm-mode split   # 拆分模式：快速模型归类 + 诊断文案（对比两种模式见 bench_split.py）
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+# 将 backend 目录加入 sys.path 以便导入 main 与 services
+sys.path.append(BACKEND_DIR)
+sys.path.append(BENCH_DIR)
+
+import httpx
+import uvicorn
+
+from mock_upstreams import free_port
+
+PROBE_INTERVAL = 0.005
+SYMPTOMS = [
+    "明天早八，但现在凌晨三点我还在刷视频",
+    "好生气，好想指着领导的面骂他一顿",
+    "上班像上坟，心情如死灰",
+    "周末又被拉去加班，工资还没涨",
+    "社恐发作，只想缩在角落里",
+    "减肥第三天，晚上偷偷吃了炸鸡",
+    "考试周复习不完，头发一把一把掉",
+    "被甲方改了十八版方案，快疯了",
+]
+
+
+def rss_bytes() -> int:
+    """当前进程的常驻内存（Linux 读取 /proc，其它平台返回峰值）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(len(values) * q))]
+    return {
+        "p50": round(statistics.median(values) * 1000, 1),
+        "p95": round(pick(0.95) * 1000, 1),
+        "p99": round(pick(0.99) * 1000, 1),
+        "max": round(values[-1] * 1000, 1),
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+class MockProcess:
+    """在子进程中运行 mock_upstreams.py"""
+
+    def __init__(self, args):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.cmd = [
+            sys.executable, os.path.join(BENCH_DIR, "mock_upstreams.py"), "--port", str(self.port),
+            "--llm-latency", str(args.llm_latency), "--llm-rate", str(args.llm_rate),
+            "--new-species-rate", str(args.new_species_rate),
+            "--seedream-delay", str(args.seedream_delay), "--qiniu-delay", str(args.qiniu_delay),
+            "--llm-fast-latency", str(args.llm_fast_latency), "--llm-fast-rate", str(args.llm_fast_rate),
+            "--llm-fail-rate", str(args.llm_fail_rate),
+        ]
+        self._proc = None
+
+    def stats(self) -> dict:
+        return httpx.get(f"{self.url}/_stats").json()
+
+    def __enter__(self):
+        self._proc = subprocess.Popen(self.cmd)
+        deadline = time.monotonic() + 15
+        while time.monotonic() < deadline:
+            try:
+                httpx.head(self.url)
+                return self
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        self._proc.kill()
+        raise RuntimeError("mock upstreams failed to start")
+
+    def __exit__(self, *exc):
+        self._proc.terminate()
+        self._proc.wait(timeout=5)
+
+
+class BackendServer:
+    """在后台线程中运行被测 app，并在同一事件循环上测量延迟"""
+
+    def __init__(self, app):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.lag_samples = []
+        self._probing = False
+        self._server = uvicorn.Server(uvicorn.Config(app, port=self.port, log_level="warning"))
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._serve()), daemon=True)
+
+    async def _probe(self):
+        while not self._server.should_exit:
+            expected = time.perf_counter() + PROBE_INTERVAL
+            await asyncio.sleep(PROBE_INTERVAL)
+            if self._probing:
+                self.lag_samples.append(max(0.0, time.perf_counter() - expected))
+
+    async def _serve(self):
+        probe = asyncio.create_task(self._probe())
+        await self._server.serve()
+        await probe
+
+    def start_probe(self):
+        self.lag_samples.clear()
+        self._probing = True
+
+    def stop_probe(self):
+        self._probing = False
+
+    def __enter__(self):
+        self._thread.start()
+        deadline = time.monotonic() + 15
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("backend failed to start")
+            time.sleep(0.02)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+
+
+async def stream_request(client: httpx.AsyncClient, symptom: str, abandon: bool = False) -> dict:
+    """abandon=True 时模拟用户关闭页面：收到 species 事件后立即断开"""
+    record = {"endpoint": "abandoned" if abandon else "stream", "ok": False}
+    t0 = time.perf_counter()
+    try:
+        async with client.stream("GET", "/api/diagnose/stream", params={"symptom": symptom}) as response:
+            if response.status_code != 200:
+                record["error"] = f"HTTP {response.status_code}"
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[6:])
+                elapsed = time.perf_counter() - t0
+                if event["type"] == "species":
+                    record.setdefault("species", elapsed)
+                    if abandon:
+                        record["done"] = elapsed
+                        record["ok"] = True
+                        break
+                elif event["type"] == "image":
+                    record["image"] = elapsed
+                elif event["type"] == "done":
+                    record["done"] = elapsed
+                    record["ok"] = True
+                elif event["type"] == "error":
+                    record["error"] = event.get("message")
+    except httpx.HTTPError as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["total"] = time.perf_counter() - t0
+    return record
+
+
+async def post_request(client: httpx.AsyncClient, symptom: str) -> dict:
+    record = {"endpoint": "post", "ok": False}
+    t0 = time.perf_counter()
+    try:
+        response = await client.post("/api/diagnose", json={"symptom": symptom})
+        record["ok"] = response.status_code == 200
+        if not record["ok"]:
+            record["error"] = f"HTTP {response.status_code}"
+    except httpx.HTTPError as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["total"] = record["done"] = time.perf_counter() - t0
+    return record
+
+
+async def drive(base_url: str, args) -> tuple:
+    rng = random.Random(args.seed)
+    counter = iter(range(args.requests))
+    records = []
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        async def worker():
+            for i in counter:
+                symptom = rng.choice(SYMPTOMS)
+                endpoint = args.endpoint if args.endpoint != "mixed" else ("stream", "post")[i % 2]
+                if endpoint == "stream":
+                    records.append(await stream_request(client, symptom, rng.random() < args.abandon_rate))
+                else:
+                    records.append(await post_request(client, symptom))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    return records, elapsed
+
+
+def summarize(records: list, elapsed: float) -> dict:
+    summary = {}
+    for endpoint in sorted({r["endpoint"] for r in records}):
+        rows = [r for r in records if r["endpoint"] == endpoint]
+        ok = [r for r in rows if r["ok"]]
+        summary[endpoint] = {
+            "requests": len(rows),
+            "errors": len(rows) - len(ok),
+            "throughput_rps": round(len(ok) / elapsed, 2),
+            "time_to_species_ms": percentiles([r["species"] for r in ok if "species" in r]),
+            "time_to_image_ms": percentiles([r["image"] for r in ok if "image" in r]),
+            "time_to_done_ms": percentiles([r["done"] for r in ok]),
+        }
+        errors = sorted({r["error"] for r in rows if r.get("error")})
+        if errors:
+            summary[endpoint]["error_samples"] = errors[:5]
+    return summary
+
+
+def print_report(result: dict):
+    print(f"\n{result['config']['requests']} requests @ concurrency {result['config']['concurrency']}, "
+          f"{result['elapsed_s']}s (rev {result['revision']})")
+    print(f"{'endpoint':>8} {'ok':>6} {'err':>5} {'rps':>8} {'species p50/p99':>18} {'done p50/p99':>18} {'image p50':>10}")
+    for endpoint, s in result["endpoints"].items():
+        species = s["time_to_species_ms"]
+        done = s["time_to_done_ms"]
+        print(f"{endpoint:>8} {s['requests'] - s['errors']:>6} {s['errors']:>5} {s['throughput_rps']:>8.1f} "
+              f"{species.get('p50', 0):>8.0f}/{species.get('p99', 0):<9.0f} "
+              f"{done.get('p50', 0):>8.0f}/{done.get('p99', 0):<9.0f} "
+              f"{s['time_to_image_ms'].get('p50', 0):>10.0f}")
+    lag, memory = result["loop_lag_ms"], result["memory_mb"]
+    print(f"loop lag: max {lag['max']}ms  p99 {lag['p99']}ms  mean {lag['mean']}ms")
+    print(f"memory: rss {memory['rss_start']} -> {memory['rss_end']} MB, peak {memory['rss_peak']} MB")
+    print(f"upstream calls: {result['upstreams']}")
+    print(f"after disconnect: {result['disconnects']}")
+    print(f"shed: {result['shed']}")
+    if "archive" in result:
+        print(f"archive: {result['archive']}")
+
+
+def compare(result: dict, baseline_path: str):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\ncompared with {os.path.basename(baseline_path)} (rev {baseline.get('revision')}):")
+
+    def row(label, new, old):
+        if new is None or old is None:
+            return
+        delta = f"{(new - old) / old:+.1%}" if old else "n/a"
+        print(f"  {label:<32} {old:>10} -> {new:<10} {delta}")
+
+    for endpoint, s in result["endpoints"].items():
+        old = baseline.get("endpoints", {}).get(endpoint)
+        if not old:
+            continue
+        row(f"{endpoint} throughput_rps", s["throughput_rps"], old["throughput_rps"])
+        for metric in ("time_to_species_ms", "time_to_done_ms"):
+            for q in ("p50", "p99"):
+                row(f"{endpoint} {metric} {q}", s[metric].get(q), old[metric].get(q))
+    row("loop_lag_ms max", result["loop_lag_ms"]["max"], baseline["loop_lag_ms"]["max"])
+    row("loop_lag_ms p99", result["loop_lag_ms"]["p99"], baseline["loop_lag_ms"]["p99"])
+    row("memory_mb rss_peak", result["memory_mb"]["rss_peak"], baseline["memory_mb"]["rss_peak"])
+
+
+def configure_env(mock_url: str, args, tmp: str):
+    """必须在导入 main / services 之前调用（load_dotenv 不会覆盖已设置的变量）"""
+    os.environ.update({
+        "OPENAI_BASE_URL": f"{mock_url}/v1",
+        "OPENAI_API_KEY": "loadtest",
+        "ARK_API_URL": f"{mock_url}/api/v3/images/generations",
+        "ARK_API_KEY": "loadtest",
+        "QINIU_UC_HOST": mock_url,
+        "QINIU_ACCESS_KEY": "loadtest-ak",
+        "QINIU_SECRET_KEY": "loadtest-sk",
+        "QINIU_BUCKET": "loadtest",
+        "QINIU_DOMAIN": "https://cdn.loadtest.local",
+        # 压测不改动真实图库
+        "GALLERY_EXPANSION_ENABLED": "false",
+        "SILHOUETTE_ATLAS_ENABLED": "false",
+        # 骰子结果池的后台补充会额外调用 LLM 替身，压测时关闭（bench_dice.py 单独测）
+        "DICE_POOL_ENABLED": "false",
+        "SPECIES_IMAGE_ON_MISS": args.on_miss,
+        "LLM_SPLIT_MODE": "true" if args.llm_mode == "split" else "false",
+        "LLM_FAST_MODEL": "mock-fast",
+    })
+    if not args.cache:
+        os.environ["DIAGNOSIS_CACHE_TTL"] = "0"
+        os.environ["SIMILAR_CACHE_TTL"] = "0"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--endpoint", choices=["stream", "post", "mixed"], default="stream")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="LLM 替身首字延迟（秒）")
+    parser.add_argument("--llm-rate", type=float, default=60.0, help="LLM 替身每秒输出的 chunk 数")
+    parser.add_argument("--new-species-rate", type=float, default=0.0, help="LLM 替身返回新物种的概率")
+    parser.add_argument("--llm-mode", choices=["single", "split"], default="single",
+                        help="单次调用，或快速模型归类 + 诊断文案两次调用（LLM_SPLIT_MODE）")
+    parser.add_argument("--llm-fast-latency", type=float, default=0.15, help="拆分模式归类用的快速模型替身首字延迟（秒）")
+    parser.add_argument("--llm-fast-rate", type=float, default=300.0, help="快速模型替身每秒输出的 chunk 数")
+    parser.add_argument("--llm-fail-rate", type=float, default=0.0,
+                        help="LLM 替身返回 500 的概率（失败的请求由本地分类器兜底，见 bench_local_classifier.py）")
+    parser.add_argument("--seedream-delay", type=float, default=1.0)
+    parser.add_argument("--qiniu-delay", type=float, default=0.5)
+    parser.add_argument("--on-miss", choices=["generate", "nearest"], default="generate",
+                        help="新物种在请求中生成图片，还是返回最相近的预置物种图片（SPECIES_IMAGE_ON_MISS）")
+    parser.add_argument("--abandon-rate", type=float, default=0.0, help="流式请求收到物种后即断开的比例")
+    parser.add_argument("--cache", action="store_true", help="保留诊断结果缓存")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="结果 JSON 路径（默认 benchmarks/results/loadtest-<时间>-<版本>.json）")
+    parser.add_argument("--compare", help="与之前保存的结果 JSON 对比")
+    parser.add_argument("--verbose", action="store_true", help="保留后端 INFO 日志")
+    args = parser.parse_args()
+
+    with MockProcess(args) as mock, tempfile.TemporaryDirectory() as tmp:
+        configure_env(mock.url, args, tmp)
+        if not args.verbose:
+            logging.disable(logging.INFO)
+
+        import main as backend
+        from services.counter import SequenceCounter
+        from services.gallery_expansion import miss_store
+        from services.local_classifier import decision_log
+        from services.result_archive import result_archive
+        from services.species_registry import species_registry
+
+        backend.sequence_counter = SequenceCounter(os.path.join(tmp, "counter.bin"))
+        species_registry.path = os.path.join(tmp, "generated_species.jsonl")
+        miss_store.path = os.path.join(tmp, "species_misses.json")
+        decision_log.path = os.path.join(tmp, "llm_decisions.jsonl")
+        result_archive.directory = os.path.join(tmp, "archive")
+
+        rss_start = rss_bytes()
+        with BackendServer(backend.app) as server:
+            server.start_probe()
+            records, elapsed = asyncio.run(drive(server.url, args))
+            server.stop_probe()
+            # 等断开后的取消与后台图片生成落定
+            time.sleep(args.seedream_delay + args.qiniu_delay + 0.5)
+            lag = sorted(server.lag_samples) or [0.0]
+        rss_end = rss_bytes()
+
+        result = {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": vars(args),
+            "elapsed_s": round(elapsed, 2),
+            "endpoints": summarize(records, elapsed),
+            "loop_lag_ms": {
+                "max": round(lag[-1] * 1000, 1),
+                "p99": round(lag[min(len(lag) - 1, int(len(lag) * 0.99))] * 1000, 1),
+                "mean": round(statistics.fmean(lag) * 1000, 2),
+            },
+            "memory_mb": {
+                "rss_start": round(rss_start / 2 ** 20, 1),
+                "rss_end": round(rss_end / 2 ** 20, 1),
+                "rss_peak": round(peak_rss_bytes() / 2 ** 20, 1),
+            },
+            "upstreams": mock.stats(),
+            "disconnects": {
+                "clients": backend.metrics.DISCONNECTS_TOTAL.get("stream"),
+                "llm_cancelled": backend.metrics.CANCELLED_TOTAL.get("llm"),
+                "image_cancelled": backend.metrics.CANCELLED_TOTAL.get("image"),
+                "image_detached": backend.background_tasks.detached,
+            },
+            # 诊断结果存档：成组提交的次数（每次一个 fdatasync）
+            "archive": {"appended": result_archive.appended, "committed": result_archive.committed,
+                        "commits": result_archive.commits},
+            # 准入控制拒绝的调用数（上游/原因）
+            "shed": {f"{upstream}/{reason}": value
+                     for (upstream, reason), value in sorted(backend.metrics.ADMISSION_SHED._values.items())},
+        }
+
+    print_report(result)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"loadtest-{time.strftime('%Y%m%d-%H%M%S')}-{result['revision']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nresult saved to {output}")
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""本地上游替身 - 基准测试与压测使用，不消耗真实额度
+
+目前提供：
+- OpenAI 兼容接口：POST /v1/chat/completions（支持 stream=true，可配置首字延迟、长尾比例、失败率与输出速率）
+- Seedream：POST /api/v3/images/generations
+- 七牛云：UC 区域查询 /v4/query 与远程抓取 /fetch/<EncodedURL>/to/<EncodedEntryURI>
+- 图库 CDN：GET /species/<名称>.png 返回白底涂鸦风格的随机图片（需要 Pillow，同名图片内容相同）
+
+既可以在测试脚本中用 MockServer 在后台线程启动，也可以单独运行：
+    python benchmarks/mock_upstreams.py --port 18100 --qiniu-delay 0.5 --llm-latency 0.3 --llm-rate 60
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import math
+import random
+import re
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.requests import ClientDisconnect
+
+# 请求中没有【现存馆藏列表】时使用的物种
+DEFAULT_SPECIES = ["安详的陈年咸鱼", "正在喷火的煤气罐", "死活解不开的耳机线", "一触即缩的含羞草"]
+KEYWORDS = ["凌晨三点的守夜人", "间歇性踌躇满志", "持续性混吃等死", "素质消失术", "与其内耗不如发疯"]
+DIAGNOSIS = ("这并非懒惰，而是为了对抗宇宙热力学熵增而做出的伟大牺牲。你的肉体虽然静止，"
+             "但灵魂已在互联网完成了一万次冲浪。建议继续保持水平状态，翻身可能会导致骨质酥松。")
+
+
+class MockOptions:
+    """
+    替身的行为参数
+
+    Args:
+        qiniu_delay: 七牛远程抓取耗时（秒）
+        qiniu_fail_rate: 七牛抓取返回 5xx 的概率
+        llm_latency: LLM 首个 chunk 之前的延迟（秒）
+        llm_rate: LLM 每秒输出的 chunk 数（每个 chunk 1~5 个字符），<= 0 表示不限速
+        new_species_rate: LLM 返回不在列表中的新物种的概率（触发图片生成）
+        seedream_delay: Seedream 生成一张图片的耗时（秒）
+        llm_slow_rate: LLM 首字延迟变为 llm_slow_latency 的概率（模拟长尾）
+        llm_slow_latency: 慢请求的首字延迟（秒）
+        llm_fail_rate: LLM 直接返回 500 的概率
+        llm_fast_model: 请求这个模型名时视为拆分模式的物种归类，只返回物种字段，按 llm_fast_latency / llm_fast_rate 响应
+        llm_fast_latency: 快速模型的首字延迟（秒）
+        llm_fast_rate: 快速模型每秒输出的 chunk 数
+    """
+
+    def __init__(self, qiniu_delay: float = 0.5, qiniu_fail_rate: float = 0.0, llm_latency: float = 0.3,
+                 llm_rate: float = 60.0, new_species_rate: float = 0.0, seedream_delay: float = 1.0,
+                 llm_slow_rate: float = 0.0, llm_slow_latency: float = 5.0, llm_fail_rate: float = 0.0,
+                 llm_fast_model: str = "mock-fast", llm_fast_latency: float = 0.15, llm_fast_rate: float = 300.0):
+        self.qiniu_delay = qiniu_delay
+        self.qiniu_fail_rate = qiniu_fail_rate
+        self.llm_latency = llm_latency
+        self.llm_rate = llm_rate
+        self.new_species_rate = new_species_rate
+        self.seedream_delay = seedream_delay
+        self.llm_slow_rate = llm_slow_rate
+        self.llm_slow_latency = llm_slow_latency
+        self.llm_fail_rate = llm_fail_rate
+        self.llm_fast_model = llm_fast_model
+        self.llm_fast_latency = llm_fast_latency
+        self.llm_fast_rate = llm_fast_rate
+
+
+def _diagnosis_content(messages: list, new_species_rate: float, classify: bool = False) -> str:
+    """
+    构造一份诊断 JSON：从用户消息的候选列表中随机选物种，或按概率编一个新物种
+
+    拆分模式的两种请求：物种归类（classify，即请求的是快速模型）只返回物种字段，诊断文案（用户消息带【鉴定结果】）只返回正文
+    """
+    user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    if user.startswith("【鉴定结果】"):
+        return DIAGNOSIS
+    match = re.search(r"【现存馆藏列表】(.*)", user)
+    names = [n for n in match.group(1).split("、") if n] if match else DEFAULT_SPECIES
+    if random.random() < new_species_rate:
+        object_name = f"压测物种{random.randrange(10 ** 9)}"
+    else:
+        object_name = random.choice(names)
+    result = {
+        "object_name": object_name,
+        "display_name": object_name,
+        "keywords": random.sample(KEYWORDS, 3),
+        "diagnosis": DIAGNOSIS,
+    }
+    if classify:
+        del result["diagnosis"]
+    return json.dumps(result, ensure_ascii=False, indent=2)
+
+
+def _split_chunks(text: str) -> list:
+    chunks, i = [], 0
+    while i < len(text):
+        size = random.randint(1, 5)
+        chunks.append(text[i:i + size])
+        i += size
+    return chunks
+
+
+def _b64decode(value: str) -> str:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode("utf-8")
+
+
+async def _sleep_or_disconnect(request: Request, delay: float) -> bool:
+    """等待 delay 秒；调用方提前断开时返回 True（普通接口不会因断开被取消，需要自己检测）"""
+    async def disconnected():
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+
+    watcher = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait({watcher}, timeout=delay)
+        return watcher.done()
+    finally:
+        watcher.cancel()
+
+
+def create_app(options: MockOptions, public_url: str = "") -> FastAPI:
+    app = FastAPI()
+    app.state.stats = {"qiniu_fetch": 0, "qiniu_inflight_max": 0, "llm_requests": 0, "llm_aborted": 0, "llm_failed": 0,
+                       "seedream_requests": 0, "seedream_aborted": 0, "cdn_requests": 0}
+    inflight = {"qiniu": 0}
+
+    @app.head("/")
+    @app.head("/v1")
+    async def root():
+        return {}
+
+    @app.get("/_stats")
+    async def get_stats():
+        return app.state.stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.stats["llm_requests"] += 1
+        if random.random() < options.llm_fail_rate:
+            app.state.stats["llm_failed"] += 1
+            return JSONResponse({"error": {"message": "mock upstream error", "type": "server_error"}}, status_code=500)
+        model = body.get("model", "mock")
+        fast = model == options.llm_fast_model
+        latency = options.llm_fast_latency if fast else options.llm_latency
+        if random.random() < options.llm_slow_rate:
+            latency = options.llm_slow_latency
+        rate = options.llm_fast_rate if fast else options.llm_rate
+        content = _diagnosis_content(body.get("messages", []), options.new_species_rate, classify=fast)
+        completion_id = f"chatcmpl-mock{random.randrange(10 ** 9)}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency + (len(content) / 3 / rate if rate > 0 else 0))
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            }
+
+        def chunk(delta: dict, finish_reason=None) -> str:
+            data = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        async def events():
+            try:
+                await asyncio.sleep(latency)
+                yield chunk({"role": "assistant", "content": ""})
+                for piece in _split_chunks(content):
+                    if rate > 0:
+                        await asyncio.sleep(1 / rate)
+                    yield chunk({"content": piece})
+                yield chunk({}, "stop")
+                yield "data: [DONE]\n\n"
+            except asyncio.CancelledError:
+                # 调用方提前断开了流
+                app.state.stats["llm_aborted"] += 1
+                raise
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/api/v3/images/generations")
+    async def seedream_generate(request: Request):
+        app.state.stats["seedream_requests"] += 1
+        try:
+            await request.json()
+        except ClientDisconnect:
+            disconnected = True
+        else:
+            disconnected = await _sleep_or_disconnect(request, options.seedream_delay)
+        if disconnected:
+            app.state.stats["seedream_aborted"] += 1
+            return JSONResponse({"error": "client disconnected"}, status_code=499)
+        host = public_url or "http://127.0.0.1"
+        return {"data": [{"url": f"{host}/images/{random.randrange(10 ** 9)}.png"}]}
+
+    @app.get("/species/{name}.png")
+    async def cdn_image(name: str):
+        app.state.stats["cdn_requests"] += 1
+        return Response(content=doodle_png(name), media_type="image/png")
+
+    @app.get("/v4/query")
+    async def qiniu_query(ak: str, bucket: str):
+        host = public_url or "http://127.0.0.1"
+        return {"hosts": [{"region": "mock", "ttl": 86400, "io": {"domains": [host]}}]}
+
+    @app.post("/fetch/{encoded_url}/to/{encoded_entry}")
+    async def qiniu_fetch(encoded_url: str, encoded_entry: str, request: Request):
+        if not request.headers.get("authorization", "").startswith("QBox "):
+            return JSONResponse({"error": "bad token"}, status_code=401)
+        stats = app.state.stats
+        stats["qiniu_fetch"] += 1
+        inflight["qiniu"] += 1
+        stats["qiniu_inflight_max"] = max(stats["qiniu_inflight_max"], inflight["qiniu"])
+        try:
+            # 七牛服务端去源站抓取图片所需的时间
+            await asyncio.sleep(options.qiniu_delay)
+            if random.random() < options.qiniu_fail_rate:
+                return JSONResponse({"error": "mock server error"}, status_code=599)
+            bucket, _, key = _b64decode(encoded_entry).partition(":")
+            return {"fsize": 1024, "hash": "mock", "key": key, "mimeType": "image/png", "source": _b64decode(encoded_url)}
+        finally:
+            inflight["qiniu"] -= 1
+
+    return app
+
+
+def doodle_png(name: str, size: int = 1024) -> bytes:
+    """白底、粗黑轮廓、内部随机上色的涂鸦（模拟 Seedream 生成的物种图）"""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(name)
+    image = Image.new("RGB", (size, size), "white")
+    draw = ImageDraw.Draw(image)
+    cx, cy, r = size / 2, size / 2, size * 0.3
+    body = [(cx + r * rng.uniform(0.6, 1.0) * math.cos(a), cy + r * rng.uniform(0.6, 1.0) * math.sin(a))
+            for a in (i * 2 * math.pi / 12 for i in range(12))]
+    fill = tuple(rng.randrange(150, 256) for _ in range(3))
+    draw.polygon(body, fill=fill, outline="black", width=size // 80)
+    for _ in range(3):
+        x, y, s = rng.uniform(0.2, 0.8) * size, rng.uniform(0.2, 0.8) * size, size * rng.uniform(0.03, 0.08)
+        draw.ellipse([x - s, y - s, x + s, y + s], fill="white", outline="black", width=size // 120)
+    draw.line([(cx, cy + r), (cx - r * 0.4, size * 0.95)], fill="black", width=size // 60)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class MockServer:
+    """在后台线程中运行替身服务（独立的事件循环，不干扰被测代码）"""
+
+    def __init__(self, options: MockOptions = None, port: int = 0):
+        self.options = options or MockOptions()
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.app = create_app(self.options, self.url)
+        self._server = uvicorn.Server(uvicorn.Config(self.app, port=self.port, log_level="warning", lifespan="off"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @property
+    def stats(self) -> dict:
+        return self.app.state.stats
+
+    def __enter__(self):
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("mock server failed to start")
+            time.sleep(0.02)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=18100)
+    parser.add_argument("--qiniu-delay", type=float, default=0.5)
+    parser.add_argument("--qiniu-fail-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-rate", type=float, default=60.0)
+    parser.add_argument("--new-species-rate", type=float, default=0.0)
+    parser.add_argument("--seedream-delay", type=float, default=1.0)
+    parser.add_argument("--llm-slow-rate", type=float, default=0.0, help="首字延迟变为 --llm-slow-latency 的概率")
+    parser.add_argument("--llm-slow-latency", type=float, default=5.0)
+    parser.add_argument("--llm-fail-rate", type=float, default=0.0, help="LLM 返回 500 的概率")
+    parser.add_argument("--llm-fast-latency", type=float, default=0.15, help="快速模型（mock-fast）的首字延迟")
+    parser.add_argument("--llm-fast-rate", type=float, default=300.0, help="快速模型每秒输出的 chunk 数")
+    args = parser.parse_args()
+
+    options = MockOptions(qiniu_delay=args.qiniu_delay, qiniu_fail_rate=args.qiniu_fail_rate,
+                          llm_latency=args.llm_latency, llm_rate=args.llm_rate,
+                          new_species_rate=args.new_species_rate, seedream_delay=args.seedream_delay,
+                          llm_slow_rate=args.llm_slow_rate, llm_slow_latency=args.llm_slow_latency,
+                          llm_fail_rate=args.llm_fail_rate, llm_fast_latency=args.llm_fast_latency,
+                          llm_fast_rate=args.llm_fast_rate)
+    url = f"http://127.0.0.1:{args.port}"
+    uvicorn.run(create_app(options, url), port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
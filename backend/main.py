@@ -1,31 +1,147 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List
 import os
 import logging
-import traceback
-import json
-import asyncio
 import time
+import asyncio
+from contextlib import asynccontextmanager
 
-from services.llm import diagnose_symptom
-from services.llm_streaming import diagnose_symptom_streaming, get_preset_image_url
-from services.image_gen import generate_species_image_from_prompt
-from services.qiniu_storage import save_to_qiniu
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from services.admission import Overloaded, image_admission, llm_admission
+from services.background import background_tasks
+from services.catalog import preset_catalog
+from services.counter import SequenceCounter
+from services.dice_pool import dice_pool
+from services.gallery_expansion import gallery_expander, miss_store
+from services.http_clients import clients
+from services.logging_setup import RequestContextMiddleware, configure_logging, dropped_records, payload_sampled
+from services import metrics
+from services.llm_streaming import diagnose_symptom_streaming, local_available
+from services.local_classifier import decision_log, local_classifier
+from services.result_archive import result_archive
+from services.result_cache import diagnosis_cache
+from services.settings import settings
+from services.silhouette_atlas import silhouette_atlas
+from services.similar_cache import NUMPY_AVAILABLE, similar_cache
+from services.species_image import (
+    PLACEHOLDER_IMAGE_URL, generate_species_image, lookup_species_image, nearest_preset_image,
 )
+from services.species_registry import species_registry
+from services.sse import INVALID_SYMPTOM_FRAME, SSEWriter, encode_json
+
 logger = logging.getLogger(__name__)
 
+# 计数器持久化文件路径
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+COUNTER_FILE = os.path.join(DATA_DIR, "diagnosis_counter.bin")
+LEGACY_COUNTER_FILE = os.path.join(DATA_DIR, "diagnosis_counter.txt")
+
+# 诊断序号计数器：多 worker 共享，block_size > 1 时每个 worker 按块预留序号
+sequence_counter = SequenceCounter(
+    COUNTER_FILE,
+    legacy_path=LEGACY_COUNTER_FILE,
+    block_size=settings.counter_block_size,
+    flush_interval=settings.counter_flush_interval,
+)
+
+metrics.register_collector(lambda: {
+    "diagnosis_cache_hits_total": ("counter", "Exact symptom cache hits", diagnosis_cache.hits),
+    "diagnosis_cache_misses_total": ("counter", "Exact symptom cache misses", diagnosis_cache.misses),
+    "diagnosis_cache_bytes": ("gauge", "Estimated exact symptom cache size", diagnosis_cache.stats()["bytes"]),
+    "similar_cache_hits_total": ("counter", "Near-duplicate symptom cache hits", similar_cache.hits),
+    "similar_cache_misses_total": ("counter", "Near-duplicate symptom cache misses", similar_cache.misses),
+    "generated_species": ("gauge", "Species in the generated species registry", len(species_registry)),
+    "background_tasks": ("gauge", "Detached image generations still running", len(background_tasks)),
+    "background_tasks_detached_total": ("counter", "Image generations detached after disconnect", background_tasks.detached),
+    "background_tasks_rejected_total": ("counter", "Image generations cancelled because the background queue was full",
+                                        background_tasks.rejected),
+    "species_misses_recorded_total": ("counter", "Species results that missed the preset gallery", miss_store.recorded),
+    "species_misses_tracked": ("gauge", "Distinct missed species in the miss store", len(miss_store)),
+    "gallery_expansion_published_total": ("counter", "Missed species published into the preset gallery",
+                                          gallery_expander.published),
+    "gallery_expansion_failed_total": ("counter", "Idle-time gallery generations that failed", gallery_expander.failed),
+    "silhouette_atlas_builds_total": ("counter", "Silhouette atlas rebuilds", silhouette_atlas.builds),
+    "silhouette_atlas_failed_total": ("counter", "Preset images that failed to become silhouettes", silhouette_atlas.failed),
+    "dice_pool_hits_total": ("counter", "Dice diagnoses replayed from the pre-generated pool", dice_pool.hits),
+    "dice_pool_misses_total": ("counter", "Dice diagnoses that found the pool empty", dice_pool.misses),
+    "dice_pool_generated_total": ("counter", "Diagnoses pre-generated into the dice pool", dice_pool.generated),
+    "dice_pool_failed_total": ("counter", "Dice pool pre-generations that failed", dice_pool.failed),
+    "dice_pool_entries": ("gauge", "Pre-generated dice diagnoses waiting to be served", len(dice_pool)),
+    "result_archive_appended_total": ("counter", "Diagnosis results appended to the archive", result_archive.appended),
+    "result_archive_committed_total": ("counter", "Diagnosis results written to disk", result_archive.committed),
+    "result_archive_commits_total": ("counter", "Group commits (one fdatasync each)", result_archive.commits),
+    "result_archive_failed_total": ("counter", "Archive group commits that failed", result_archive.failed),
+    "llm_decisions_recorded_total": ("counter", "LLM diagnoses recorded as local classifier training data",
+                                     decision_log.recorded),
+    "local_classifier_trained_samples": ("gauge", "LLM decisions the loaded local classifier model was trained on",
+                                         local_classifier.trained_samples),
+    "log_records_dropped_total": ("counter", "Log records dropped because the log queue was full", dropped_records()),
+})
+
+
+def _preload_modules():
+    """
+    导入请求路径上才会用到的重量级模块（openai 约 0.5s、numpy）
+
+    import main 时不加载它们（脚本、基准测试不需要），但也不能留给首个请求在事件循环上导入，
+    因此在启动阶段放到线程里与其他启动步骤并行完成
+    """
+    import openai  # noqa: F401
+    if NUMPY_AVAILABLE:
+        import numpy  # noqa: F401
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 配置日志（经由队列在后台线程输出，见 services/logging_setup.py）；导入 main 不再启动日志线程
+    configure_logging()
+    for backend in settings.llm_backends:
+        fast_model = f", 归类模型: {backend['fast_model']}" if settings.llm_split_mode else ""
+        logger.info(f"LLM 后端 {backend['name']}: {backend['base_url']}, 模型: {backend['model']}{fast_model}, "
+                    f"API Key 已{'设置' if backend['api_key'] else '未设置'}")
+    await sequence_counter.start()
+    preset_catalog.snapshot()
+    await clients.start(warmup=False)
+    # 以下步骤互不依赖，并行执行：启动耗时取最慢的一项而不是总和
+    await asyncio.gather(
+        asyncio.to_thread(species_registry.load),
+        asyncio.to_thread(dice_pool.load),
+        asyncio.to_thread(_preload_modules),
+        clients.warmup() if settings.upstream_warmup else asyncio.sleep(0),
+        miss_store.start() if settings.gallery_expansion_enabled else asyncio.sleep(0),
+    )
+    if settings.gallery_expansion_enabled:
+        gallery_expander.start()
+    if settings.silhouette_atlas_enabled:
+        await silhouette_atlas.start()
+    if settings.archive_enabled:
+        await result_archive.start()
+    if settings.dice_pool_enabled:
+        dice_pool.start()
+    if settings.decision_log_enabled:
+        await decision_log.start()
+    if local_available() and (settings.local_classifier_share > 0 or settings.local_classifier_fallback):
+        # 在启动阶段构建权重矩阵，而不是留给第一个走本地的请求
+        await asyncio.to_thread(local_classifier.classify, "")
+    yield
+    await decision_log.stop()
+    await dice_pool.stop()
+    await silhouette_atlas.stop()
+    await gallery_expander.stop()
+    await miss_store.stop()
+    await background_tasks.drain(settings.background_drain_timeout)
+    await result_archive.stop()
+    await clients.aclose()
+    await sequence_counter.stop()
+
+
 app = FastAPI(
     title="精神物种鉴定所 API",
     description="基于 AI 的情绪诊断工具",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS 配置
@@ -35,7 +151,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
+# 关联 ID：同一请求的所有日志带相同的 request_id
+app.add_middleware(RequestContextMiddleware)
 
 
 class DiagnoseRequest(BaseModel):
@@ -51,41 +170,94 @@ class DiagnoseResponse(BaseModel):
     diagnosis: str
     image_url: str
     sequence_no: int
+    source: str = "llm"  # "local": 本地分类器的模板文案（LLM 故障兜底或分流）
+    archived: bool = False  # 是否已存档（分享链接 /api/result/{sequence_no} 可用）
 
 
-# 计数器持久化文件路径
-DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
-COUNTER_FILE = os.path.join(DATA_DIR, "diagnosis_counter.txt")
-
-def get_next_sequence_no() -> int:
+def _resolve_species_image(event: dict, started: float):
     """
-    获取下一个诊断序号（带持久化）
+    补全 species 事件的图片（预置图库 -> 已生成登记表），并记录物种来源与耗时
+
+    开启图库扩充时，未命中预置图库的物种记入 miss_store，空闲时由 gallery_expander 补进图库；
+    SPECIES_IMAGE_ON_MISS=nearest 或图片生成过载时，没有现成图片的物种先用最相近的预置物种图片，不在请求中生成
     """
-    current_count = 0
-    
-    # 1. 尝试读取现有计数
-    if os.path.exists(COUNTER_FILE):
+    metrics.observe_stage("species", time.perf_counter() - started)
+    if event.get("image_url"):
+        metrics.SPECIES_TOTAL.inc("preset")
+        return
+    if settings.gallery_expansion_enabled:
+        miss_store.record(event["object_name"])
+    event["image_url"] = lookup_species_image(event["object_name"])
+    if event["image_url"]:
+        metrics.SPECIES_TOTAL.inc("registry")
+        return
+    use_nearest = settings.species_image_on_miss == "nearest"
+    if not use_nearest:
         try:
-            with open(COUNTER_FILE, "r") as f:
-                content = f.read().strip()
-                if content:
-                    current_count = int(content)
-        except Exception as e:
-            logger.error(f"读取计数器文件失败: {e}")
-            
-    # 2. 增加计数
-    next_count = current_count + 1
-    
-    # 3. 保存新计数
+            image_admission.check()
+        except Overloaded:
+            # 图片生成排队已满：同样改用最相近的预置图片
+            use_nearest = True
+    if use_nearest:
+        event["image_url"] = nearest_preset_image(event["object_name"])
+        if event["image_url"]:
+            metrics.SPECIES_TOTAL.inc("nearest")
+            return
+    metrics.SPECIES_TOTAL.inc("generated")
+
+
+def _diagnosis_events(symptom: str):
+    """诊断事件流：骰子文案优先回放预生成结果池，其余走缓存 / LLM"""
+    pooled = dice_pool.take(symptom) if settings.dice_pool_enabled else None
+    if pooled is not None:
+        return dice_pool.replay(pooled)
+    return diagnose_symptom_streaming(symptom)
+
+
+def _archive_result(sequence_no: int, species: dict, diagnosis: str, image_url: str) -> bool:
+    """把诊断结果写入存档（只进内存，后台成组落盘），供分享链接通过 /api/result/{sequence_no} 读取；返回是否已存档"""
+    if not settings.archive_enabled:
+        return False
+    object_name = species.get("object_name", "")
+    result_archive.append(sequence_no, {
+        "object_name": object_name,
+        "display_name": species.get("display_name") or object_name,
+        "keywords": species.get("keywords", []),
+        "diagnosis": diagnosis,
+        "image_url": image_url or "",
+        "created_at": int(time.time()),
+    })
+    return True
+
+
+async def _image_result(image_task: asyncio.Task, object_name: str) -> str:
+    """取出图片生成任务的结果，过载时降级为最相近的预置图片，失败时降级为占位图"""
     try:
-        if not os.path.exists(DATA_DIR):
-            os.makedirs(DATA_DIR)
-        with open(COUNTER_FILE, "w") as f:
-            f.write(str(next_count))
-    except Exception as e:
-        logger.error(f"保存计数器文件失败: {e}")
-        
-    return next_count
+        return await image_task
+    except Overloaded as e:
+        logger.warning(f"图片生成过载，改用最相近的预置图片: {e}")
+        return nearest_preset_image(object_name) or PLACEHOLDER_IMAGE_URL
+    except Exception as img_error:
+        logger.error(f"图片生成/上传失败: {type(img_error).__name__}: {str(img_error)}")
+        logger.warning(f"使用占位图: {PLACEHOLDER_IMAGE_URL}")
+        return PLACEHOLDER_IMAGE_URL
+
+
+_BUSY_MESSAGE = "鉴定所太忙了，请 {} 秒后再试"
+
+
+def _service_busy(error: Overloaded) -> HTTPException:
+    """上游过载时的 503 响应"""
+    return HTTPException(status_code=503, detail=_BUSY_MESSAGE.format(error.retry_after),
+                         headers={"Retry-After": str(error.retry_after)})
+
+
+async def _wait_for_disconnect(request: Request):
+    """等待客户端断开（不依赖服务器/Starlette 是否会主动取消响应）"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
 
 
 @app.get("/")
@@ -99,100 +271,257 @@ class PresetSpeciesItem(BaseModel):
     image_url: str
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 文本格式的指标"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/api/preset-species", response_model=List[PresetSpeciesItem])
-async def get_preset_species():
+async def get_preset_species(request: Request):
     """
     获取预置物种列表，用于前端轮播展示
+
+    响应体在图库变化时才重新序列化，支持 ETag / If-None-Match 协商缓存
     """
-    import json
-    preset_file = os.path.join(os.path.dirname(__file__), "data", "preset_species.json")
-    try:
-        with open(preset_file, "r", encoding="utf-8") as f:
-            species_list = json.load(f)
-        return species_list
-    except Exception as e:
-        print(f"Failed to load preset species: {e}")
-        return []
+    snapshot = preset_catalog.snapshot()
+    headers = {
+        "ETag": snapshot.etag,
+        "Cache-Control": f"public, max-age={settings.preset_species_max_age}",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or snapshot.etag in
+                          [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.payload, media_type="application/json", headers=headers)
+
+
+@app.get("/api/preset-species/silhouettes")
+async def get_silhouette_atlas(request: Request):
+    """
+    首页轮播的剪影图集偏移表：{"image", "tile", "width", "height", "items": {object_name: [x, y]}}
+
+    image 为带内容哈希的图集文件名（GET /api/preset-species/silhouettes/<image>，可永久缓存）；
+    图集尚未生成时返回 404，前端使用原图
+    """
+    if silhouette_atlas.payload is None:
+        raise HTTPException(status_code=404, detail="剪影图集尚未生成")
+    headers = {
+        "ETag": silhouette_atlas.etag,
+        "Cache-Control": f"public, max-age={settings.preset_species_max_age}",
+    }
+    if request.headers.get("if-none-match") == silhouette_atlas.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=silhouette_atlas.payload, media_type="application/json", headers=headers)
+
+
+@app.get("/api/preset-species/silhouettes/{name}")
+async def get_silhouette_image(name: str):
+    """剪影图集（文件名即内容哈希，内容不会变化）"""
+    image = await silhouette_atlas.read_image(name)
+    if image is None:
+        raise HTTPException(status_code=404, detail="图集不存在")
+    return Response(content=image, media_type="image/png", headers={
+        "Cache-Control": f"public, max-age={settings.silhouette_atlas_max_age}, immutable",
+    })
+
+
+@app.get("/api/result/{sequence_no}", response_model=DiagnoseResponse)
+async def get_result(sequence_no: int):
+    """
+    按序号读取已完成的诊断结果（分享链接），直接返回存档中的 JSON
+
+    结果写入后不再变化，可以被浏览器与 CDN 缓存
+    """
+    payload = result_archive.get(sequence_no) if sequence_no > 0 else None
+    if payload is None:
+        raise HTTPException(status_code=404, detail="没有找到这份鉴定报告")
+    return Response(content=payload, media_type="application/json", headers={
+        "Cache-Control": f"public, max-age={settings.archive_max_age}",
+    })
+
+
+@app.get("/api/dice")
+async def roll_dice():
+    """
+    随机一条骰子文案：{"symptom", "pooled"}
+
+    优先返回预生成结果池中有现成诊断的文案（pooled=true），用它发起诊断时直接回放、不等待 LLM
+    """
+    return Response(content=encode_json(dice_pool.roll()), media_type="application/json",
+                    headers={"Cache-Control": "no-store"})
 
 
 @app.get("/api/diagnose/stream")
-async def diagnose_stream(symptom: str):
+async def diagnose_stream(symptom: str, request: Request):
     """
     流式诊断接口，使用 SSE 返回结果
     
     事件类型：
-    - species: 物种基础信息 (object_name, display_name, keywords, image_url)
+    - species: 物种基础信息 (object_name, display_name, keywords, image_url)；本地分类器的结果另带 source="local"
     - diagnosis_chunk: 诊断文案片段
     - image: 生成的图片 URL（如果需要生成）
-    - done: 完成，包含 sequence_no
+    - done: 完成，包含 sequence_no 与 archived（是否已存档、分享链接可用；本地分类器的结果另带 source="local"）
     - error: 错误信息
+
+    骰子文案在预生成结果池中有现成结果时直接回放（见 services/dice_pool.py），不调用 LLM
+
+    客户端断开时立即取消 LLM 流；尚未完成的新物种图片转入后台继续生成（后台已满时取消）
+
+    LLM 排队已满时直接返回 503 + Retry-After；开始响应后才过载（排队超时）时发送 error 事件。
+    开启本地分类器兜底时不返回 503，过载或失败的请求改由本地分类器诊断（见 services/local_classifier.py）
     """
     logger.info(f"收到流式诊断请求: symptom='{symptom}'")
+    gallery_expander.note_activity()
     
     if len(symptom) < 5 or len(symptom) > 50:
         async def error_generator():
-            yield f"data: {json.dumps({'type': 'error', 'message': '症状描述需要在5-50字之间'})}\n\n"
+            yield INVALID_SYMPTOM_FRAME
         return StreamingResponse(
             error_generator(),
             media_type="text/event-stream",
             headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
         )
     
+    if (symptom not in diagnosis_cache and not (settings.dice_pool_enabled and dice_pool.ready(symptom))
+            and not (settings.local_classifier_fallback and local_available())):
+        try:
+            llm_admission.check()
+        except Overloaded as e:
+            raise _service_busy(e)
+    
     async def event_generator():
-        object_name = None
-        has_preset_image = False
+        started = time.perf_counter()
+        writer = SSEWriter(settings.sse_coalesce_interval, settings.sse_coalesce_bytes, settings.sse_heartbeat_interval)
+        image_task = None
+        image_sent = False
+        llm_events = _diagnosis_events(symptom).__aiter__()
+        llm_done = False
+        next_event = None
+        disconnect_task = asyncio.ensure_future(_wait_for_disconnect(request))
+        disconnected = False
+        object_name = ""
+        species = {}
+        diagnosis_parts = []
+        image_url = None
         
         try:
-            # 流式调用 LLM
-            async for event in diagnose_symptom_streaming(symptom):
+            # 流式调用 LLM；一旦拿到未命中预置图库的物种，立即并发启动图片生成，
+            # 图片结果在完成时插入到 SSE 流中（不必等诊断文案输出完）。
+            # 诊断文案按时间/大小窗口合并成帧，长时间没有输出时发送心跳
+            while True:
+                if next_event is None and not llm_done:
+                    next_event = asyncio.ensure_future(llm_events.__anext__())
+                waiting = set()
+                if next_event is not None:
+                    waiting.add(next_event)
+                if image_task is not None and not image_sent:
+                    waiting.add(image_task)
+                if not waiting:
+                    break
+                waiting.add(disconnect_task)
+                done, _ = await asyncio.wait(waiting, timeout=writer.timeout(), return_when=asyncio.FIRST_COMPLETED)
+                
+                if disconnect_task in done:
+                    disconnected = True
+                    return
+                
+                if not done:
+                    frame = writer.poll()
+                    if frame:
+                        yield frame
+                    continue
+                
+                if image_task in done and not image_sent:
+                    image_sent = True
+                    image_url = await _image_result(image_task, object_name)
+                    frame = writer.flush()
+                    if frame:
+                        yield frame
+                    yield writer.event({"type": "image", "url": image_url})
+                
+                if next_event not in done:
+                    continue
+                try:
+                    event = next_event.result()
+                except StopAsyncIteration:
+                    # 诊断文案已输出完，继续等待仍在进行的图片生成
+                    next_event = None
+                    llm_done = True
+                    frame = writer.flush()
+                    if frame:
+                        yield frame
+                    continue
+                next_event = None
                 event_type = event.get("type")
                 
                 if event_type == "species":
-                    object_name = event.get("object_name")
-                    has_preset_image = bool(event.get("image_url"))
-                    yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+                    # 之前生成过的物种直接带上图片，否则后台生成
+                    _resolve_species_image(event, started)
+                    species = event
+                    object_name = event["object_name"]
+                    image_url = event.get("image_url")
+                    if not event.get("image_url"):
+                        image_task = asyncio.create_task(generate_species_image(object_name))
+                    yield writer.event(event)
                     
                 elif event_type == "diagnosis_chunk":
-                    yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+                    diagnosis_parts.append(event["chunk"])
+                    frame = writer.chunk(event["chunk"])
+                    if frame:
+                        yield frame
                     
                 elif event_type == "error":
-                    yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+                    frame = writer.flush()
+                    if frame:
+                        yield frame
+                    yield writer.event(event)
                     return
             
-            # 如果没有预置图片，需要生成
-            if object_name and not has_preset_image:
-                try:
-                    logger.info(f"未命中预置图库，准备生成新图: object_name='{object_name}'")
-                    prompt = f"""极简涂鸦风格。画风潦草，甚至有点丑。{object_name}，
-粗线条手绘，简约卡通表情，背景颜色必须是纯白的。
-适合社交媒体分享的正方形构图"""
-                    
-                    temp_url = await generate_species_image_from_prompt(prompt)
-                    logger.info(f"图片生成成功，临时 URL: {temp_url}")
-                    
-                    # 上传到七牛云
-                    timestamp = int(time.time())
-                    object_name_safe = object_name.replace(" ", "_")
-                    key = f"species/{object_name_safe}_{timestamp}.png"
-                    
-                    image_url = await save_to_qiniu(temp_url, key)
-                    logger.info(f"七牛云上传成功: {image_url}")
-                    
-                    yield f"data: {json.dumps({'type': 'image', 'url': image_url}, ensure_ascii=False)}\n\n"
-                    
-                except Exception as img_error:
-                    logger.error(f"图片生成/上传失败: {img_error}")
-                    # 发送占位图
-                    yield f"data: {json.dumps({'type': 'image', 'url': 'https://placeholder.com/species/unknown.png'}, ensure_ascii=False)}\n\n"
-            
             # 获取序号并发送完成事件
-            sequence_no = get_next_sequence_no()
-            yield f"data: {json.dumps({'type': 'done', 'sequence_no': sequence_no}, ensure_ascii=False)}\n\n"
+            with metrics.stage("counter"):
+                sequence_no = sequence_counter.next()
+            archived = _archive_result(sequence_no, species, "".join(diagnosis_parts), image_url)
+            yield writer.done(sequence_no, archived, species.get("source"))
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, "stream")
             
+        except asyncio.CancelledError:
+            # 服务器检测到断开时会直接取消响应
+            disconnected = True
+            raise
+        except Overloaded as e:
+            logger.warning(f"流式诊断被拒绝: {e}")
+            frame = writer.flush()
+            if frame:
+                yield frame
+            yield writer.event({"type": "error", "message": _BUSY_MESSAGE.format(e.retry_after),
+                                "retry_after": e.retry_after})
         except Exception as e:
-            logger.error(f"流式诊断失败: {type(e).__name__}: {str(e)}")
-            logger.error(f"完整错误堆栈:\n{traceback.format_exc()}")
-            yield f"data: {json.dumps({'type': 'error', 'message': f'诊断失败: {str(e)}'}, ensure_ascii=False)}\n\n"
+            logger.exception(f"流式诊断失败: {type(e).__name__}: {str(e)}")
+            frame = writer.flush()
+            if frame:
+                yield frame
+            yield writer.event({"type": "error", "message": f"诊断失败: {str(e)}"})
+        finally:
+            # 客户端断开、LLM 出错或流提前结束时处理尚未完成的上游调用。
+            # 取消/转入后台必须在第一个 await 之前完成：响应被取消时 finally 中的 await 会再次被取消
+            disconnect_task.cancel()
+            if disconnected:
+                logger.info(f"客户端已断开: symptom='{symptom}'")
+                metrics.DISCONNECTS_TOTAL.inc("stream")
+            if next_event is not None and not next_event.done():
+                next_event.cancel()
+                metrics.CANCELLED_TOTAL.inc("llm")
+            if image_task is not None and not image_task.done():
+                # 新物种的图片生成后会进入图库，值得做完；后台已满时才取消
+                if not background_tasks.detach(image_task, f"物种图片 {object_name}"):
+                    image_task.cancel()
+                    metrics.CANCELLED_TOTAL.inc("image")
+            if next_event is not None:
+                # 用 wait 而不是 gather：响应被取消时 gather 会把取消再次传给 LLM 任务，
+                # 打断其中关闭上游连接的清理，导致连接一直占用
+                await asyncio.wait({next_event})
+            await llm_events.aclose()
     
     return StreamingResponse(
         event_generator(),
@@ -202,84 +531,91 @@ async def diagnose_stream(symptom: str):
 
 
 @app.post("/api/diagnose", response_model=DiagnoseResponse)
-async def diagnose(request: DiagnoseRequest):
+async def diagnose(request: DiagnoseRequest, response: Response):
     """
     诊断用户的情绪状态，返回对应的"物种"信息
+
+    响应头 Server-Timing 中带有各阶段耗时（llm_ttft、species、image_generate 等）；LLM 过载时返回 503 + Retry-After（开启本地分类器兜底时改由本地诊断）
     """
     logger.info(f"收到诊断请求: symptom='{request.symptom}'")
+    gallery_expander.note_activity()
     
     if len(request.symptom) < 5 or len(request.symptom) > 50:
         logger.warning(f"症状描述长度不符合要求: {len(request.symptom)}字")
         raise HTTPException(status_code=400, detail="症状描述需要在5-50字之间")
     
+    started = time.perf_counter()
+    timings = metrics.start_request_timing()
+    image_task = None
     try:
-        # 1. 调用 LLM 诊断
-        logger.info("开始调用 LLM 诊断...")
-        result = await diagnose_symptom(request.symptom)
-        logger.info(f"LLM 诊断结果: {result}")
+        # 1. 调用 LLM 诊断（流式接口，拿到物种后立即并发生成图片）
+        logger.debug("开始调用 LLM 诊断...")
+        result = {}
+        diagnosis_parts = []
+        async for event in _diagnosis_events(request.symptom):
+            event_type = event.get("type")
+            if event_type == "species":
+                result = event
+                _resolve_species_image(event, started)
+                # 2. 如果没有命中预置图库，则与诊断文案并行生成新图
+                if not event.get("image_url"):
+                    image_task = asyncio.create_task(generate_species_image(event["object_name"]))
+                else:
+                    logger.debug(f"命中预置图库: {event['image_url']}")
+            elif event_type == "diagnosis_chunk":
+                diagnosis_parts.append(event["chunk"])
+            elif event_type == "error":
+                raise ValueError(event.get("message", "诊断解析失败"))
+        if payload_sampled():
+            logger.info(f"LLM 诊断结果: {result}")
         
         # 获取序号（持久化）
-        sequence_no = get_next_sequence_no()
-        logger.info(f"诊断计数器: {sequence_no}")
+        with metrics.stage("counter"):
+            sequence_no = sequence_counter.next()
+        logger.debug(f"诊断计数器: {sequence_no}")
         
         image_url = result.get("image_url")
-        
-        # 2. 如果没有命中预置图库，则生成新图
-        if not image_url:
-            object_name = result.get("object_name", "未知物种")
-            logger.info(f"未命中预置图库，准备生成新图: object_name='{object_name}'")
-            try:
-                # Seedream 生成
-                prompt = f"""极简涂鸦风格。画风潦草，甚至有点丑。{object_name}，
-粗线条手绘，简约卡通表情，背景颜色必须是纯白的。
-适合社交媒体分享的正方形构图"""
-                logger.info(f"图片生成 Prompt: {prompt}")
-                temp_url = await generate_species_image_from_prompt(prompt)
-                logger.info(f"图片生成成功，临时 URL: {temp_url}")
-                
-                # 七牛云抓取存储
-                # 构造存储 key: species/{object_name}_{timestamp}.png
-                import time
-                timestamp = int(time.time())
-                object_name_safe = result.get('object_name', 'unknown').replace(" ", "_")
-                key = f"species/{object_name_safe}_{timestamp}.png"
-                
-                logger.info(f"开始上传到七牛云: key={key}")
-                image_url = await save_to_qiniu(temp_url, key)
-                logger.info(f"七牛云上传成功: {image_url}")
-                
-            except Exception as img_error:
-                logger.error(f"图片生成/上传失败: {type(img_error).__name__}: {str(img_error)}")
-                logger.error(f"完整错误堆栈:\n{traceback.format_exc()}")
-                # 降级方案：使用占位图
-                image_url = "https://placeholder.com/species/unknown.png"
-                logger.warning(f"使用占位图: {image_url}")
-        else:
-            logger.info(f"命中预置图库: {image_url}")
+        if image_task is not None:
+            image_url = await _image_result(image_task, result["object_name"])
         
         # 获取 display_name，如果没有则使用 object_name
         object_name = result.get("object_name", "未知物种")
         display_name = result.get("display_name") or object_name
-        logger.info(f"display_name: {display_name}, object_name: {object_name}")
+        logger.debug(f"display_name: {display_name}, object_name: {object_name}")
         
-        response = DiagnoseResponse(
+        elapsed = time.perf_counter() - started
+        metrics.REQUEST_SECONDS.observe(elapsed, "diagnose")
+        response.headers["Server-Timing"] = metrics.server_timing_header({**timings, "total": elapsed})
+        logger.info(f"诊断成功: sequence_no={sequence_no}, object_name='{object_name}'")
+        keywords = result.get("keywords", ["神秘", "未知", "待鉴定"])
+        diagnosis = "".join(diagnosis_parts) or "你的精神物种正在鉴定中..."
+        archived = _archive_result(sequence_no, {**result, "keywords": keywords}, diagnosis, image_url)
+        return DiagnoseResponse(
             object_name=object_name,
             display_name=display_name,
-            keywords=result.get("keywords", ["神秘", "未知", "待鉴定"]),
-            diagnosis=result.get("diagnosis", "你的精神物种正在鉴定中..."),
+            keywords=keywords,
+            diagnosis=diagnosis,
             image_url=image_url,
-            sequence_no=sequence_no
+            sequence_no=sequence_no,
+            source=result.get("source", "llm"),
+            archived=archived,
         )
-        logger.info(f"诊断成功，返回结果: sequence_no={sequence_no}")
-        return response
         
+    except Overloaded as e:
+        logger.warning(f"诊断被拒绝: {e}")
+        raise _service_busy(e)
     except Exception as e:
         # 记录详细的错误信息
-        logger.error(f"诊断失败: {type(e).__name__}: {str(e)}")
-        logger.error(f"完整错误堆栈:\n{traceback.format_exc()}")
+        logger.exception(f"诊断失败: {type(e).__name__}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"诊断失败: {str(e)}")
+    finally:
+        if image_task is not None and not image_task.done():
+            image_task.cancel()
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=9002)
+    # 日志由 configure_logging() 统一配置，uvicorn 不再另行添加同步输出的 handler；
+    # 在启动前配置，uvicorn 自己的启动日志也经由队列输出（lifespan 中再次调用无副作用）
+    configure_logging()
+    uvicorn.run(app, host="0.0.0.0", port=9002, log_config=None)
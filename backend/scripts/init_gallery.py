@@ -1,103 +1,320 @@
-"""图库批量初始化脚本"""
+"""图库批量初始化脚本
+
+生成与上传两个阶段流水线并发执行：
+- 生成阶段受令牌桶限速（--rate / --burst）和并发上限（--gen-concurrency）约束
+- 上传阶段并发上限为 --upload-concurrency（七牛抓取另有 QINIU_MAX_CONCURRENCY 限制）
+- 生成失败时按指数退避重试（--retries），4xx 等不可重试的错误直接放弃；上传的重试由 save_to_qiniu 完成（QINIU_MAX_RETRIES）
+- 上传 key 与请求路径相同（species_image_key，按名称内容寻址），重新运行不会产生重复对象，链接保持不变
+- 每完成一个阶段就向检查点文件追加一行，中断后重新运行会跳过已完成的物种；
+  已生成但未上传的图片在临时链接有效期内直接上传，不再重复生成
+- 图库中已有有效链接的物种默认跳过（--force 清空检查点，全部重新生成）
+- preset_species.json 每完成 --save-every 个物种以及结束（含中断）时原子写入一次
+
+物种定义默认使用下方的 SPECIES_LIST，也可以用 --species-file 从外部文件读取：
+- .json: [["名称", "描述"], ...] 或 [{"object_name": "名称", "description": "描述"}, ...]
+- .jsonl: 每行一个上述数组或对象
+
+    python scripts/init_gallery.py [--species-file species.json] [--rate 0.5] [--gen-concurrency 4]
+"""
+import argparse
 import asyncio
+import json
+import logging
 import os
+import random
 import sys
-import json
 import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
 
 # 将 backend 目录加入 sys.path 以便导入 services
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from services.catalog import PRESET_SPECIES_FILE, PresetCatalog
+from services.http_clients import clients
 from services.image_gen import generate_species_image_from_prompt
+from services.logging_setup import configure_logging
 from services.qiniu_storage import save_to_qiniu
+from services.rate_limit import TokenBucket
+from services.species_image import species_image_key
+
+logger = logging.getLogger("init_gallery")
+
 STYLE_SUFFIX="极简涂鸦风格。画风潦草，甚至有点丑。背景颜色必须是纯白的。"
-# 待生成物种列表：(物种名称, 图片描述后缀)
+# 待生成物种列表：(物种名称, 物种描述)
+# 描述会写入 preset_species.json 的 description 字段，供 services/species_index.py 检索候选物种
 SPECIES_LIST =  [
     (
         "马戏团遗落的红鼻子", 
-        "一个经典的红色海绵小丑鼻子，孤独地躺在聚光灯下的阴影里，表面有明显的磨损起球，透着一股滑稽后的凄凉感。"+STYLE_SUFFIX
+        "一个经典的红色海绵小丑鼻子，孤独地躺在聚光灯下的阴影里，表面有明显的磨损起球，透着一股滑稽后的凄凉感。"
     ),
     (
         "正在喷火的煤气罐", 
-        "一个锈迹斑斑的老式液化气罐，阀门处正猛烈喷射出红蓝相间的愤怒火焰，罐体因高温微微发红膨胀，濒临爆炸边缘。"+STYLE_SUFFIX
+        "一个锈迹斑斑的老式液化气罐，阀门处正猛烈喷射出红蓝相间的愤怒火焰，罐体因高温微微发红膨胀，濒临爆炸边缘。"
     ),
     (
         "死活解不开的耳机线", 
-        "一团纠缠得像乱麻一样的白色有线耳机，打了无数个复杂的死结，耳机头无奈地垂在两边，呈现出一种令人窒息的混乱美学。"+STYLE_SUFFIX
+        "一团纠缠得像乱麻一样的白色有线耳机，打了无数个复杂的死结，耳机头无奈地垂在两边，呈现出一种令人窒息的混乱美学。"
     ),
     (
         "一触即缩的含羞草", 
-        "一株叶片紧紧闭合、蜷缩成一团的含羞草，种在一个贴着'Do Not Disturb'标签的陶土花盆里，仿佛正在进行光合作用般的自闭。"+STYLE_SUFFIX
+        "一株叶片紧紧闭合、蜷缩成一团的含羞草，种在一个贴着'Do Not Disturb'标签的陶土花盆里，仿佛正在进行光合作用般的自闭。"
     ),
     (
         "不可名状的混沌", 
-        "一团无法被物理法则定义的灰黑色漩涡迷雾，仿佛是深渊的黑洞，隐约吞噬着周围的光线与色彩，充满神秘、虚无与未知的压迫感。"+STYLE_SUFFIX
+        "一团无法被物理法则定义的灰黑色漩涡迷雾，仿佛是深渊的黑洞，隐约吞噬着周围的光线与色彩，充满神秘、虚无与未知的压迫感。"
     )
 ]
-PRESET_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "preset_species.json")
+CHECKPOINT_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "init_gallery_checkpoint.jsonl")
 
+# Seedream 返回的临时链接有效期为 24 小时，超过一半时间的不再复用
+TEMP_URL_MAX_AGE = 12 * 3600
+# 占位链接（非真实图片）
+PLACEHOLDER_HOSTS = ("example.com", "placeholder.com")
 
-async def process_species(name: str, desc: str):
-    """处理单个物种：生成 -> 上传 -> 返回数据"""
-    print(f"🔄 Processing: {name}...")
-    try:
-        # 1. 生成图片
-        temp_url = await generate_species_image_from_prompt(desc)
-        print(f"  Canvas generated: {temp_url[:50]}...")
-        
-        # 2. 上传七牛云
-        timestamp = int(time.time())
-        name_safe = name.replace(" ", "_")
-        key = f"species/{name_safe}_{timestamp}.png"
-        
-        final_url = await save_to_qiniu(temp_url, key)
-        print(f"  Upload success: {final_url}")
-        
-        return {
-            "object_name": name,
-            "image_url": final_url
-        }
-    except Exception as e:
-        print(f"❌ Failed to process {name}: {e}")
+
+def has_valid_image(item: Optional[Dict]) -> bool:
+    url = (item or {}).get("image_url") or ""
+    return bool(url) and not any(host in url for host in PLACEHOLDER_HOSTS)
+
+
+def load_species_file(path: str) -> List[Tuple[str, str]]:
+    """从 .json / .jsonl 文件读取物种定义"""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            entries = [json.loads(line) for line in f if line.strip()]
+        else:
+            entries = json.load(f)
+
+    species = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            name, desc = entry["object_name"], entry.get("description", "")
+        else:
+            name, desc = entry
+        species.append((name.strip(), desc.strip()))
+    return species
+
+
+class Checkpoint:
+    """
+    追加写入的进度文件，每行一条记录，同名物种以最后一条为准
+
+    - {"object_name", "stage": "generated", "temp_url", "description", "at"}
+    - {"object_name", "stage": "uploaded", "image_url", "description", "at"}
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self.records[record["object_name"]] = record
+                    except (json.JSONDecodeError, KeyError):
+                        continue  # 中断时写到一半的行
+
+    def record(self, name: str, stage: str, **fields) -> Dict:
+        record = {"object_name": name, "stage": stage, **fields, "at": int(time.time())}
+        self.records[name] = record
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record
+
+    def clear(self):
+        """清空进度（--force），之后的记录重新追加"""
+        self.records = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def fresh_temp_url(self, name: str) -> Optional[str]:
+        """已生成但尚未上传、且临时链接仍在有效期内的图片"""
+        record = self.records.get(name)
+        if record and record["stage"] == "generated" and time.time() - record["at"] < TEMP_URL_MAX_AGE:
+            return record["temp_url"]
         return None
 
 
+def is_retryable(error: Exception) -> bool:
+    """网络错误、5xx、408 与 429 可以重试，其余 4xx（参数错误、鉴权失败、内容审核）重试也无用"""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status >= 500 or status in (408, 429)
+    return True
+
+
+async def with_retries(label: str, call, retries: int, base_delay: float):
+    """按指数退避（带随机抖动）重试 call()"""
+    for attempt in range(retries + 1):
+        try:
+            return await call()
+        except Exception as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+            delay = base_delay * (2 ** attempt) * random.uniform(0.5, 1.5)
+            logger.warning(f"{label} 失败 ({type(e).__name__}: {e})，{delay:.1f}s 后重试 ({attempt + 1}/{retries})")
+            await asyncio.sleep(delay)
+
+
+class GalleryBuilder:
+    """
+    生成 -> 上传 流水线
+
+    Args:
+        catalog: 写入的图库
+        data_map: object_name -> 图库条目（原地更新）
+        checkpoint: 进度文件
+        args: 命令行参数
+    """
+
+    def __init__(self, catalog: PresetCatalog, data_map: Dict[str, Dict], checkpoint: Checkpoint,
+                 args: argparse.Namespace):
+        self.catalog = catalog
+        self.data_map = data_map
+        self.checkpoint = checkpoint
+        self.args = args
+        self.bucket = TokenBucket(args.rate, args.burst)
+        self.uploaded = 0
+        self.failed: List[str] = []
+        self._unsaved = 0
+
+    async def _generate(self, desc: str) -> str:
+        await self.bucket.acquire()
+        return await generate_species_image_from_prompt(desc + STYLE_SUFFIX)
+
+    async def generate_worker(self, jobs: asyncio.Queue, uploads: asyncio.Queue):
+        while True:
+            try:
+                name, desc = jobs.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            temp_url = None if self.args.force else self.checkpoint.fresh_temp_url(name)
+            if temp_url:
+                print(f"⏩ {name}: 复用检查点中已生成的图片")
+            else:
+                print(f"🔄 Generating: {name}...")
+                try:
+                    temp_url = await with_retries(f"{name} 生成", lambda: self._generate(desc),
+                                                  self.args.retries, self.args.backoff)
+                except Exception as e:
+                    print(f"❌ Failed to generate {name}: {e}")
+                    self.failed.append(name)
+                    continue
+                self.checkpoint.record(name, "generated", temp_url=temp_url, description=desc)
+            await uploads.put((name, desc, temp_url))
+
+    async def upload_worker(self, uploads: asyncio.Queue):
+        while True:
+            job = await uploads.get()
+            if job is None:
+                return
+            name, desc, temp_url = job
+            try:
+                # 与请求路径相同的内容寻址 key：重新运行覆盖同一个对象，链接不变；失败重试由 save_to_qiniu 负责
+                final_url = await save_to_qiniu(temp_url, species_image_key(name))
+            except Exception as e:
+                print(f"❌ Failed to upload {name}: {e}")
+                self.failed.append(name)
+                continue
+            print(f"✅ {name}: {final_url}")
+            self.checkpoint.record(name, "uploaded", image_url=final_url, description=desc)
+            self.data_map[name] = {"object_name": name, "image_url": final_url, "description": desc}
+            self.uploaded += 1
+            self._unsaved += 1
+            if self._unsaved >= self.args.save_every:
+                self.save()
+
+    def save(self):
+        self.catalog.save(list(self.data_map.values()))
+        self._unsaved = 0
+
+    async def run(self, species: List[Tuple[str, str]]):
+        jobs: asyncio.Queue = asyncio.Queue()
+        for item in species:
+            jobs.put_nowait(item)
+        # 上传队列有界：上传跟不上时生成阶段暂停，避免临时链接堆积过期
+        uploads: asyncio.Queue = asyncio.Queue(maxsize=self.args.upload_concurrency * 2)
+
+        uploaders = [asyncio.create_task(self.upload_worker(uploads)) for _ in range(self.args.upload_concurrency)]
+        try:
+            await asyncio.gather(*(self.generate_worker(jobs, uploads) for _ in range(self.args.gen_concurrency)))
+            for _ in uploaders:
+                await uploads.put(None)
+            await asyncio.gather(*uploaders)
+        finally:
+            for task in uploaders:
+                task.cancel()
+
+
+def plan(species: List[Tuple[str, str]], data_map: Dict[str, Dict], checkpoint: Checkpoint,
+         force: bool) -> List[Tuple[str, str]]:
+    """合并检查点中已上传的结果，返回仍需处理的物种"""
+    todo = []
+    for name, desc in species:
+        record = checkpoint.records.get(name)
+        if not force and not has_valid_image(data_map.get(name)) and record and record["stage"] == "uploaded":
+            data_map[name] = {"object_name": name, "image_url": record["image_url"], "description": desc}
+        if not force and has_valid_image(data_map.get(name)):
+            # 已有图片的物种只同步描述
+            if desc:
+                data_map[name]["description"] = desc
+            continue
+        todo.append((name, desc))
+    return todo
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--species-file", help="物种定义文件（.json / .jsonl），默认使用脚本内置的 SPECIES_LIST")
+    parser.add_argument("--rate", type=float, default=0.5, help="每秒发起的生成请求数上限（<= 0 不限速）")
+    parser.add_argument("--burst", type=int, default=2, help="生成请求允许的突发数")
+    parser.add_argument("--gen-concurrency", type=int, default=4, help="同时进行的生成请求数")
+    parser.add_argument("--upload-concurrency", type=int, default=4, help="同时进行的上传数")
+    parser.add_argument("--retries", type=int, default=3, help="生成失败后的重试次数")
+    parser.add_argument("--backoff", type=float, default=2.0, help="首次重试的等待秒数（之后指数增长）")
+    parser.add_argument("--save-every", type=int, default=10, help="每完成多少个物种写入一次图库文件")
+    parser.add_argument("--output", default=PRESET_SPECIES_FILE, help="图库文件路径")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE, help="检查点文件路径")
+    parser.add_argument("--force", action="store_true", help="忽略已有链接和检查点，全部重新生成")
+    return parser.parse_args()
+
+
 async def main():
-    print("🚀 Starting Batch Generation...")
-    
+    args = parse_args()
+    configure_logging()
+    species = load_species_file(args.species_file) if args.species_file else SPECIES_LIST
+
     # 读取现有数据（避免覆盖未修改的）
-    existing_data = []
-    if os.path.exists(PRESET_FILE):
-        try:
-            with open(PRESET_FILE, "r", encoding="utf-8") as f:
-                existing_data = json.load(f)
-        except:
-            pass
-    
-    # 转换为字典方便更新
-    data_map = {item["object_name"]: item for item in existing_data}
-    
-    results = []
-    # 并发处理（或者为了稳妥起见，串行处理避免 API 限流）
-    # 这里选择串行，稳一点
-    for name, desc in SPECIES_LIST:
-        # 如果已经存在且有有效链接（非 example），也可以选择跳过
-        # if name in data_map and "example.com" not in data_map[name]["image_url"]:
-        #    print(f"⏩ Skipping {name} (already exists)")
-        #    continue
-            
-        item = await process_species(name, desc)
-        if item:
-            data_map[name] = item
-            # 实时保存，防止中断
-            with open(PRESET_FILE, "w", encoding="utf-8") as f:
-                json.dump(list(data_map.values()), f, ensure_ascii=False, indent=2)
-            
-            # 礼貌性延迟，避免 QPS 过高
-            time.sleep(1)
-
-    print("\n✅ All done! Preset species updated.")
+    catalog = PresetCatalog(args.output)
+    original = catalog.species
+    data_map = {item["object_name"]: dict(item) for item in original}
+    checkpoint = Checkpoint(args.checkpoint)
+    if args.force:
+        checkpoint.clear()
+    todo = plan(species, data_map, checkpoint, args.force)
+    print(f"🚀 Starting Batch Generation: {len(todo)} / {len(species)} 个物种待处理")
+
+    builder = GalleryBuilder(catalog, data_map, checkpoint, args)
+    started = time.perf_counter()
+    try:
+        await builder.run(todo)
+    finally:
+        # 中断时也把已完成的物种写入图库
+        if list(data_map.values()) != original:
+            builder.save()
+        await clients.aclose()
+        elapsed = time.perf_counter() - started
+        print(f"\n完成 {builder.uploaded} 个，失败 {len(builder.failed)} 个，耗时 {elapsed:.1f}s")
+        if builder.failed:
+            print(f"失败的物种（重新运行即可重试）: {', '.join(builder.failed)}")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("已中断，进度已保存，重新运行即可继续")
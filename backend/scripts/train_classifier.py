@@ -0,0 +1,71 @@
+"""本地物种分类器训练脚本
+
+读取 LLM 诊断决策日志（data/llm_decisions.jsonl 及轮转出的 .1），用 LLM 历史上的选择训练本地分类器：
+- 只保留仍在预置图库中的物种；同一症状出现多次时按出现次数计入
+- 先按 --holdout 比例留出一部分样本，输出训练后的准确率与只用种子关键词 + 物种描述时的准确率对比
+- 然后用全部样本重新训练，原子写入 --output；运行中的服务会在 10 秒内自动加载新模型
+
+    python scripts/train_classifier.py [--input data/llm_decisions.jsonl] [--output data/local_classifier.npz] [--holdout 0.2]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+# 将 backend 目录加入 sys.path 以便导入 services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.catalog import preset_catalog
+from services.local_classifier import DECISION_LOG_FILE, MODEL_FILE, LocalClassifier, load_decisions, save_model, train
+
+
+def accuracy(classifier: LocalClassifier, samples: list) -> float:
+    if not samples:
+        return 0.0
+    correct = sum(classifier.classify(entry["symptom"])[0] == entry["object_name"] for entry in samples)
+    return correct / len(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", nargs="+", default=[f"{DECISION_LOG_FILE}.1", DECISION_LOG_FILE],
+                        help="决策日志文件（可多个）")
+    parser.add_argument("--output", default=MODEL_FILE)
+    parser.add_argument("--holdout", type=float, default=0.2, help="留出评估的样本比例，0 表示不评估")
+    parser.add_argument("--dim", type=int, default=2048, help="哈希向量维度")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    names = preset_catalog.names
+    decisions = [entry for entry in load_decisions(args.input) if entry["object_name"] in preset_catalog.snapshot().by_name]
+    if not names or not decisions:
+        sys.exit(f"没有可用的训练数据（图库 {len(names)} 个物种，决策 {len(decisions)} 条）")
+
+    counts = Counter(entry["object_name"] for entry in decisions)
+    print(f"训练样本 {len(decisions)} 条，覆盖 {len(counts)}/{len(names)} 个物种")
+    for name, count in counts.most_common():
+        print(f"  {count:>6}  {name}")
+
+    if args.holdout > 0:
+        shuffled = decisions[:]
+        random.Random(args.seed).shuffle(shuffled)
+        split = int(len(shuffled) * (1 - args.holdout))
+        train_set, test_set = shuffled[:split], shuffled[split:]
+        with tempfile.TemporaryDirectory() as tmp:
+            model_path = os.path.join(tmp, "model.npz")
+            save_model(train(train_set, names, dim=args.dim), model_path)
+            trained = LocalClassifier(model_path=model_path)
+            baseline = LocalClassifier(model_path=os.path.join(tmp, "missing.npz"), dim=args.dim)
+            print(f"\n留出 {len(test_set)} 条评估: 训练后准确率 {accuracy(trained, test_set):.1%}，"
+                  f"仅种子关键词 {accuracy(baseline, test_set):.1%}")
+
+    started = time.perf_counter()
+    save_model(train(decisions, names, dim=args.dim), args.output)
+    print(f"\n已用全部样本训练并写入 {args.output}（{time.perf_counter() - started:.2f}s）")
+
+
+if __name__ == "__main__":
+    main()
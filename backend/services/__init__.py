@@ -1,11 +1,20 @@
-"""服务模块"""
-from .llm import diagnose_symptom
-from .image_gen import generate_species_image_from_prompt
-from .qiniu_storage import save_to_qiniu, get_image_url
-
-__all__ = [
-    "diagnose_symptom",
-    "generate_species_image_from_prompt", 
-    "save_to_qiniu",
-    "get_image_url"
-]
+"""服务模块
+
+导出的函数按需导入（PEP 562），`from services.xxx import ...` 不会连带加载其他服务模块
+"""
+import importlib
+
+_EXPORTS = {
+    "generate_species_image_from_prompt": ".image_gen",
+    "save_to_qiniu": ".qiniu_storage",
+    "get_image_url": ".qiniu_storage",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module, __name__), name)
@@ -0,0 +1,112 @@
+"""准入控制 - 按上游限制并发数与排队长度，过载时快速拒绝
+
+每个上游（LLM、图片生成、七牛存储）一个 AdmissionLimiter：
+- 同时进行的调用数不超过 max_concurrency，其余调用方排队等待
+- 排队人数达到 max_queue 或等待超过 queue_timeout 时抛出 Overloaded，由调用方降级
+  （LLM 返回 503 + Retry-After；图片生成改用最相近的预置物种图片）
+- 在途数、排队数、拒绝次数导出到 /metrics，排队耗时记为 queue_<上游> 阶段
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from .metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE, ADMISSION_SHED, observe_stage
+from .settings import settings
+
+
+class Overloaded(Exception):
+    """上游已饱和，本次调用被拒绝"""
+
+    def __init__(self, upstream: str, retry_after: int):
+        super().__init__(f"{upstream} 繁忙，请 {retry_after} 秒后重试")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class AdmissionLimiter:
+    """
+    有界并发 + 有界等待队列
+
+    Args:
+        name: 上游名称（指标标签）
+        max_concurrency: 同时进行的调用数上限，<= 0 表示不限制
+        max_queue: 排队等待的调用数上限
+        queue_timeout: 排队的最长时间（秒）
+        retry_after: 拒绝时建议客户端重试的间隔（秒）
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float,
+                 retry_after: int = 5):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self.in_flight = 0
+        self.waiting = 0
+
+    def saturated(self) -> bool:
+        """没有空闲名额（新调用需要排队）"""
+        return self._semaphore is not None and self._semaphore.locked()
+
+    def full(self) -> bool:
+        """排队也已满（新调用会被立即拒绝）"""
+        return self.saturated() and self.waiting >= self.max_queue
+
+    def check(self):
+        """排队已满时立即抛出 Overloaded（用于在开始响应之前拒绝）"""
+        if self.full():
+            self._shed("queue_full")
+
+    def _shed(self, reason: str):
+        ADMISSION_SHED.inc(self.name, reason)
+        raise Overloaded(self.name, self.retry_after)
+
+    async def _acquire(self):
+        if self._semaphore is None:
+            return
+        if not self.saturated():
+            await self._semaphore.acquire()
+            return
+        if self.waiting >= self.max_queue:
+            self._shed("queue_full")
+        self.waiting += 1
+        ADMISSION_QUEUE.set(self.waiting, self.name)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._shed("timeout")
+        finally:
+            self.waiting -= 1
+            ADMISSION_QUEUE.set(self.waiting, self.name)
+            observe_stage(f"queue_{self.name}", time.perf_counter() - started)
+
+    @asynccontextmanager
+    async def slot(self):
+        """在名额内执行 with 块；过载时抛出 Overloaded"""
+        await self._acquire()
+        self.in_flight += 1
+        ADMISSION_IN_FLIGHT.set(self.in_flight, self.name)
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            ADMISSION_IN_FLIGHT.set(self.in_flight, self.name)
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+
+llm_admission = AdmissionLimiter(
+    "llm", settings.llm_max_concurrency, settings.llm_max_queue, settings.llm_queue_timeout,
+    settings.admission_retry_after,
+)
+image_admission = AdmissionLimiter(
+    "image", settings.image_max_concurrency, settings.image_max_queue, settings.image_queue_timeout,
+    settings.admission_retry_after,
+)
+storage_admission = AdmissionLimiter(
+    "storage", settings.qiniu_max_concurrency, settings.storage_max_queue, settings.storage_queue_timeout,
+    settings.admission_retry_after,
+)
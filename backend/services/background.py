@@ -0,0 +1,72 @@
+"""后台任务 - 客户端断开后仍值得完成的工作（如新物种图片）
+
+- 请求被取消时，调用方把尚未完成的任务交给 background_tasks.detach()，
+  由这里持有引用并记录结果；任务数达到上限时拒绝接收，由调用方取消任务
+- 关闭服务时 drain() 等待后台任务完成（超时后取消），避免生成到一半的图片丢失
+"""
+import asyncio
+import logging
+from typing import Set
+
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundTasks:
+    """
+    有上限的后台任务集合
+
+    Args:
+        max_pending: 同时在后台运行的任务数上限，<= 0 表示不接收后台任务
+    """
+
+    def __init__(self, max_pending: int = 16):
+        self.max_pending = max_pending
+        self._tasks: Set[asyncio.Task] = set()
+        self.detached = 0
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def detach(self, task: asyncio.Task, name: str = "") -> bool:
+        """
+        接管一个仍在运行的任务
+
+        Returns:
+            是否接管成功；返回 False 时调用方应自行取消任务
+        """
+        if task.done():
+            return True
+        if len(self._tasks) >= self.max_pending:
+            self.rejected += 1
+            logger.warning(f"后台任务已满（{self.max_pending}），放弃: {name}")
+            return False
+        self.detached += 1
+        self._tasks.add(task)
+        task.add_done_callback(lambda t: self._finished(t, name))
+        logger.info(f"客户端已断开，转入后台继续执行: {name}")
+        return True
+
+    def _finished(self, task: asyncio.Task, name: str):
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            logger.error(f"后台任务失败: {name}: {type(error).__name__}: {error}")
+
+    async def drain(self, timeout: float = 10.0):
+        """等待后台任务完成，超时后取消剩余任务"""
+        if not self._tasks:
+            return
+        logger.info(f"等待 {len(self._tasks)} 个后台任务完成")
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+background_tasks = BackgroundTasks(settings.background_max_pending)
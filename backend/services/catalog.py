@@ -0,0 +1,125 @@
+"""预置物种目录服务 - 进程内共享的图库索引
+
+preset_species.json 只在文件变化时解析一次：
+- 按 object_name 建立字典索引，查询 O(1)
+- /api/preset-species 的响应体预先序列化为 bytes，并计算 ETag
+- 文件 mtime/size 变化时重新加载，构建好新快照后整体替换（读者不会看到半更新的状态）
+- save() 先写临时文件再原子替换，其它进程不会读到写到一半的文件
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PRESET_SPECIES_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "preset_species.json")
+
+
+class CatalogSnapshot:
+    """某一时刻的图库内容（只读）"""
+
+    def __init__(self, species: List[Dict], version: tuple):
+        self.version = version
+        self.species = species
+        self.by_name: Dict[str, Dict] = {s["object_name"]: s for s in species}
+        self.names: List[str] = [s["object_name"] for s in species]
+        # 对外接口只暴露 object_name 与 image_url
+        public = [{"object_name": s["object_name"], "image_url": s["image_url"]} for s in species]
+        self.payload: bytes = json.dumps(public, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = f'"{hashlib.sha1(self.payload).hexdigest()[:16]}"'
+
+
+class PresetCatalog:
+    """
+    预置物种目录
+
+    Args:
+        path: preset_species.json 路径
+        check_interval: 两次检查文件 mtime 的最小间隔（秒）
+    """
+
+    def __init__(self, path: str = PRESET_SPECIES_FILE, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._failed_version: Optional[tuple] = None
+        self._next_check = 0.0
+
+    def snapshot(self) -> CatalogSnapshot:
+        """返回当前快照，必要时检查文件是否变化并重新加载"""
+        now = time.monotonic()
+        if self._snapshot is None or now >= self._next_check:
+            self._next_check = now + self.check_interval
+            self._refresh()
+        return self._snapshot
+
+    @property
+    def species(self) -> List[Dict]:
+        return self.snapshot().species
+
+    @property
+    def names(self) -> List[str]:
+        return self.snapshot().names
+
+    def get(self, object_name: str) -> Optional[Dict]:
+        return self.snapshot().by_name.get(object_name)
+
+    def get_image_url(self, object_name: str) -> Optional[str]:
+        """检查是否命中预置物种，返回图片 URL"""
+        species = self.snapshot().by_name.get(object_name)
+        return species["image_url"] if species else None
+
+    def reload(self) -> CatalogSnapshot:
+        """强制重新加载"""
+        self._snapshot = None
+        return self.snapshot()
+
+    def save(self, species: List[Dict]) -> CatalogSnapshot:
+        """原子地写入整个图库（临时文件 + fsync + os.replace），并立即重新加载"""
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp.{os.getpid()}"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(species, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return self.reload()
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError as e:
+            if self._snapshot is None:
+                logger.warning(f"Failed to load preset species: {e}")
+                self._snapshot = CatalogSnapshot([], (0, 0))
+            return
+
+        version = (stat.st_mtime_ns, stat.st_size)
+        if self._snapshot is not None and version in (self._snapshot.version, self._failed_version):
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                species = json.load(f)
+            snapshot = CatalogSnapshot(species, version)
+        except Exception as e:
+            # 文件写到一半或格式错误时保留旧快照
+            logger.warning(f"Failed to load preset species: {e}")
+            self._failed_version = version
+            if self._snapshot is None:
+                self._snapshot = CatalogSnapshot([], (0, 0))
+            return
+
+        self._snapshot = snapshot
+        logger.info(f"预置图库已加载: {len(snapshot.species)} 个物种")
+
+
+preset_catalog = PresetCatalog()
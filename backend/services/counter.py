@@ -0,0 +1,173 @@
+"""诊断序号计数器 - 跨进程原子递增
+
+计数值保存在一个 8 字节的内存映射文件中（小端 uint64）：
+- 递增时持有文件锁（flock），只读写映射内存，不产生磁盘 I/O，多个 worker 进程也不会拿到重复序号
+- 可按块预留序号（block_size > 1），每个进程在内存中分发自己的区间，进一步减少加锁次数
+- 后台任务定期 msync 落盘，并同步写回旧的文本计数文件，便于人工查看
+"""
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import threading
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows 本地开发：退化为进程内锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_COUNTER = struct.Struct("<Q")
+
+
+class SequenceCounter:
+    """
+    基于 mmap 的序号计数器
+
+    Args:
+        path: 二进制计数文件路径
+        legacy_path: 旧版文本计数文件路径，首次创建时用于迁移初始值，落盘时同步写回
+        block_size: 每次从共享计数中预留的序号数量
+        flush_interval: 后台落盘间隔（秒）
+    """
+
+    def __init__(self, path: str, legacy_path: Optional[str] = None, block_size: int = 1,
+                 flush_interval: float = 1.0):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.block_size = max(1, block_size)
+        self.flush_interval = flush_interval
+
+        self._fd: Optional[int] = None
+        self._mm: Optional[mmap.mmap] = None
+        self._pid: Optional[int] = None
+        self._local_lock = threading.Lock()
+        self._next = 0
+        self._limit = 0  # 当前预留区间的上界（不含）
+        self._dirty = False
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def open(self):
+        """打开（必要时创建并迁移）计数文件"""
+        if self._mm is not None:
+            if self._pid == os.getpid():
+                return
+            # fork 出的子进程与父进程共享打开的文件描述，flock 无法互斥，需要重新打开
+            self._mm = None
+            self._fd = None
+            self._next = self._limit = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            self._lock(fd)
+            try:
+                if os.fstat(fd).st_size < _COUNTER.size:
+                    os.ftruncate(fd, _COUNTER.size)
+                    os.pwrite(fd, _COUNTER.pack(self._read_legacy()), 0)
+                    os.fsync(fd)
+            finally:
+                self._unlock(fd)
+            self._mm = mmap.mmap(fd, _COUNTER.size)
+        except Exception:
+            os.close(fd)
+            raise
+        self._fd = fd
+        self._pid = os.getpid()
+
+    def next(self) -> int:
+        """获取下一个序号（只访问内存与文件锁，可以在事件循环中直接调用）"""
+        with self._local_lock:
+            if self._next >= self._limit or self._pid != os.getpid():
+                self._reserve()
+            value = self._next
+            self._next += 1
+            return value
+
+    def current(self) -> int:
+        """共享计数的当前值（已分配出去的最大序号）"""
+        self.open()
+        return _COUNTER.unpack_from(self._mm, 0)[0]
+
+    def flush(self):
+        """把映射内存写回磁盘，并同步旧的文本计数文件"""
+        if self._mm is None or not self._dirty:
+            return
+        self._dirty = False
+        self._mm.flush()
+        if self.legacy_path:
+            value = self.current()
+            tmp_path = f"{self.legacy_path}.tmp.{os.getpid()}"
+            with open(tmp_path, "w") as f:
+                f.write(str(value))
+            os.replace(tmp_path, self.legacy_path)
+
+    async def start(self):
+        """打开计数文件并启动后台落盘任务"""
+        await asyncio.to_thread(self.open)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """停止后台任务并做最后一次落盘"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await asyncio.to_thread(self.flush)
+
+    def close(self):
+        self.flush()
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"计数器落盘失败: {e}")
+
+    def _reserve(self):
+        """从共享计数中预留 block_size 个序号"""
+        self.open()
+        self._lock(self._fd)
+        try:
+            current = _COUNTER.unpack_from(self._mm, 0)[0]
+            _COUNTER.pack_into(self._mm, 0, current + self.block_size)
+        finally:
+            self._unlock(self._fd)
+        self._next = current + 1
+        self._limit = current + 1 + self.block_size
+        self._dirty = True
+
+    def _read_legacy(self) -> int:
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return 0
+        try:
+            with open(self.legacy_path, "r") as f:
+                content = f.read().strip()
+            return int(content) if content else 0
+        except Exception as e:
+            logger.error(f"读取计数器文件失败: {e}")
+            return 0
+
+    @staticmethod
+    def _lock(fd: int):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+    @staticmethod
+    def _unlock(fd: int):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
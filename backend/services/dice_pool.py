@@ -0,0 +1,186 @@
+"""骰子文案与预生成结果池 - 点骰子的诊断不再等待 LLM
+
+首页骰子按钮随机填入的是一组固定文案（data/dice_symptoms.json），这些文案的诊断可以提前做好：
+- 每条文案保留最多 pool_size 份预生成的完整诊断结果，每份只发出一次（同一句话每次点到的结果仍然不同）
+- GET /api/dice 优先挑一条池中有现成结果的文案；诊断接口收到骰子文案时直接回放池中的结果
+  （species / diagnosis_chunk 事件与缓存命中时相同），不经过 LLM 与准入排队
+- 后台任务按令牌桶限速（refill_per_minute）补充被取走的结果，优先补最空的文案；
+  LLM 名额已满时让路给用户请求，稍后再补。新物种的图片在补充时一并生成，回放时直接命中登记表
+- 结果池只在进程内，多 worker 各自维护；重启后按补充速率重新填满
+- 骰子文案在 lifespan 启动时于线程中读取（load()），导入本模块不读文件
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+from collections import deque
+from typing import AsyncGenerator, Deque, Dict, List, Optional
+
+from .admission import image_admission, llm_admission
+from .llm_streaming import generate_diagnosis, replay_events
+from .rate_limit import TokenBucket
+from .result_cache import normalize_symptom
+from .settings import settings
+from .species_image import generate_species_image, lookup_species_image
+
+logger = logging.getLogger(__name__)
+
+DICE_SYMPTOMS_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "dice_symptoms.json")
+
+
+def load_dice_symptoms(path: str = DICE_SYMPTOMS_FILE) -> List[str]:
+    """读取骰子文案列表（文件缺失或损坏时返回空列表）"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [text for text in json.load(f) if isinstance(text, str) and text.strip()]
+    except FileNotFoundError:
+        return []
+    except (json.JSONDecodeError, TypeError) as e:
+        logger.warning(f"骰子文案文件损坏: {e}")
+        return []
+
+
+class DicePool:
+    """
+    骰子文案的预生成诊断结果池
+
+    Args:
+        path: 骰子文案文件
+        pool_size: 每条文案预生成的结果数，<= 0 表示关闭结果池（仍然提供骰子文案）
+        refill_per_minute: 每分钟最多预生成的结果数，<= 0 表示不限速
+        busy_backoff: LLM 名额已满时推迟补充的时间（秒）
+    """
+
+    def __init__(self, path: str = DICE_SYMPTOMS_FILE, pool_size: int = 3, refill_per_minute: float = 6.0,
+                 busy_backoff: float = 5.0):
+        self.path = path
+        self.pool_size = pool_size
+        self.busy_backoff = busy_backoff
+        self.bucket = TokenBucket(refill_per_minute / 60)
+        self._symptoms: Optional[List[str]] = None
+        # 规范化文案 -> 原文案 / 预生成结果
+        self._texts: Dict[str, str] = {}
+        self._pools: Dict[str, Deque[dict]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.failed = 0
+
+    @property
+    def symptoms(self) -> List[str]:
+        return self._load()
+
+    def __len__(self) -> int:
+        return sum(len(pool) for pool in self._pools.values())
+
+    def load(self):
+        """立即读取骰子文案（启动时在线程中调用，避免首个请求承担文件读取）"""
+        self._load()
+
+    def _load(self) -> List[str]:
+        if self._symptoms is None:
+            symptoms = load_dice_symptoms(self.path)
+            self._texts = {normalize_symptom(text): text for text in symptoms}
+            self._pools = {key: deque() for key in self._texts}
+            self._symptoms = symptoms
+        return self._symptoms
+
+    def roll(self) -> dict:
+        """随机挑一条骰子文案，优先挑池中有现成结果的：{"symptom", "pooled"}"""
+        self._load()
+        ready = [self._texts[key] for key, pool in self._pools.items() if pool]
+        if ready:
+            return {"symptom": random.choice(ready), "pooled": True}
+        return {"symptom": random.choice(self.symptoms) if self.symptoms else "", "pooled": False}
+
+    def ready(self, symptom: str) -> bool:
+        """是否有现成的结果可以回放（不取走）"""
+        self._load()
+        return bool(self._pools.get(normalize_symptom(symptom)))
+
+    def take(self, symptom: str) -> Optional[dict]:
+        """取走一份预生成结果；不是骰子文案或池已空时返回 None"""
+        self._load()
+        pool = self._pools.get(normalize_symptom(symptom))
+        if pool is None:
+            return None
+        if not pool:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return pool.popleft()
+
+    async def replay(self, result: dict) -> AsyncGenerator[dict, None]:
+        """把预生成结果还原为流式事件（与 diagnose_symptom_streaming 的输出相同）"""
+        for event in replay_events(result):
+            yield event
+
+    def _most_needed(self) -> Optional[str]:
+        """结果最少且未满的文案（规范化键）"""
+        key = min(self._pools, key=lambda k: len(self._pools[k]), default=None)
+        if key is None or len(self._pools[key]) >= self.pool_size:
+            return None
+        return key
+
+    async def refill_once(self, key: str) -> bool:
+        """为一条文案预生成一份结果"""
+        result = await generate_diagnosis(self._texts[key])
+        if result is None:
+            self.failed += 1
+            return False
+        object_name = result["object_name"]
+        if not lookup_species_image(object_name) and not image_admission.saturated():
+            # 新物种：现在把图片生成好，回放时直接命中登记表；失败或图片上游繁忙时留给请求路径
+            try:
+                await generate_species_image(object_name)
+            except Exception as e:
+                logger.warning(f"骰子结果池图片生成失败: {object_name}: {type(e).__name__}: {e}")
+        self._pools[key].append(result)
+        self.generated += 1
+        return True
+
+    def start(self):
+        if self._task is None and self.pool_size > 0 and self._load():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+
+    async def _loop(self):
+        while True:
+            key = self._most_needed()
+            if key is None:
+                # 全部填满，等有结果被取走
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self.bucket.acquire()
+            if llm_admission.saturated():
+                # 用户请求优先
+                await asyncio.sleep(self.busy_backoff)
+                continue
+            try:
+                await self.refill_once(key)
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"骰子结果池补充失败: {type(e).__name__}: {e}")
+                await asyncio.sleep(self.busy_backoff)
+
+
+dice_pool = DicePool(
+    pool_size=settings.dice_pool_size,
+    refill_per_minute=settings.dice_pool_refill_per_minute,
+)
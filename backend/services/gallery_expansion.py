@@ -0,0 +1,297 @@
+"""按需扩充图库 - 记录未命中预置图库的物种，空闲时生成并发布到图库
+
+PRD 4.1：未命中预置图库的物种先记下来，空闲时再补进图库。
+- MissStore: 物种名 -> [未命中次数, 最近一次时间] 的持久化计数表。
+  record() 只更新内存，后台任务按间隔批量合并到 JSON 文件（持有文件锁读-合并-原子替换，多 worker 不会互相覆盖），
+  条目数超过上限时只保留次数最多的物种
+- GalleryExpander: 空闲（一段时间内没有诊断请求、也没有后台任务）时，挑选未命中次数最多的 top-N 物种，
+  已生成过的直接复用登记表中的图片，否则按令牌桶限速生成，然后原子写入 preset_species.json。
+  多个 worker 同时运行时由文件锁保证只有一个在发布
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 本地开发：不做跨进程互斥
+    fcntl = None
+
+from .background import background_tasks
+from .catalog import PresetCatalog, preset_catalog
+from .rate_limit import TokenBucket
+from .settings import settings
+from .species_image import generate_species_image
+from .species_registry import normalize_object_name, species_registry
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+MISS_FILE = os.path.join(DATA_DIR, "species_misses.json")
+EXPANSION_LOCK_FILE = os.path.join(DATA_DIR, "gallery_expansion.lock")
+
+
+@contextmanager
+def _exclusive(path: str, blocking: bool = True):
+    """跨进程文件锁；非阻塞模式下锁被占用时返回 False"""
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+    finally:
+        os.close(fd)
+
+
+class MissStore:
+    """
+    未命中物种的计数表（写回式批量落盘）
+
+    Args:
+        path: JSON 文件路径
+        max_entries: 保留的物种数上限
+        flush_interval: 后台合并落盘间隔（秒）
+    """
+
+    def __init__(self, path: str = MISS_FILE, max_entries: int = 5000, flush_interval: float = 5.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        # 文件中的计数（上次合并时读到的） + 本进程尚未落盘的增量
+        self._counts: Dict[str, List[int]] = {}
+        self._pending: Dict[str, List[int]] = {}
+        self._removed: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self.recorded = 0
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def record(self, object_name: str):
+        """记录一次未命中（只更新内存）"""
+        name = normalize_object_name(object_name)
+        now = int(time.time())
+        for table in (self._pending, self._counts):
+            entry = table.setdefault(name, [0, 0])
+            entry[0] += 1
+            entry[1] = now
+        self.recorded += 1
+
+    def top(self, n: int, min_count: int = 1) -> List[Tuple[str, int]]:
+        """未命中次数最多的 n 个物种"""
+        ranked = sorted(self._counts.items(), key=lambda item: (-item[1][0], -item[1][1]))
+        return [(name, entry[0]) for name, entry in ranked[:n] if entry[0] >= min_count]
+
+    def forget(self, object_name: str):
+        """物种已进入图库，不再计数"""
+        name = normalize_object_name(object_name)
+        self._counts.pop(name, None)
+        self._pending.pop(name, None)
+        self._removed.add(name)
+
+    async def flush(self):
+        """把增量合并到文件，并读回其它 worker 的计数"""
+        pending, self._pending = self._pending, {}
+        removed, self._removed = self._removed, set()
+        try:
+            merged = await asyncio.to_thread(self._merge, pending, removed)
+        except Exception:
+            # 合并失败时把增量放回去，下次再试
+            for name, (count, seen) in pending.items():
+                entry = self._pending.setdefault(name, [0, 0])
+                entry[0] += count
+                entry[1] = max(entry[1], seen)
+            self._removed |= removed
+            raise
+        # 合并期间新记录的增量仍要计入
+        for name, (count, seen) in self._pending.items():
+            entry = merged.setdefault(name, [0, 0])
+            entry[0] += count
+            entry[1] = max(entry[1], seen)
+        for name in self._removed:
+            merged.pop(name, None)
+        self._counts = merged
+
+    def _merge(self, pending: Dict[str, List[int]], removed: Set[str]) -> Dict[str, List[int]]:
+        with _exclusive(f"{self.path}.lock"):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    counts = json.load(f)
+            except FileNotFoundError:
+                counts = {}
+            except json.JSONDecodeError as e:
+                logger.warning(f"未命中计数文件损坏，重新开始计数: {e}")
+                counts = {}
+            if not pending and not removed:
+                return counts
+
+            for name in removed:
+                counts.pop(name, None)
+            for name, (count, seen) in pending.items():
+                entry = counts.setdefault(name, [0, 0])
+                entry[0] += count
+                entry[1] = max(entry[1], seen)
+            if len(counts) > self.max_entries:
+                ranked = sorted(counts.items(), key=lambda item: (-item[1][0], -item[1][1]))
+                counts = dict(ranked[:self.max_entries])
+
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp.{os.getpid()}"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(counts, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+            return counts
+
+    async def start(self):
+        """读取已有计数并启动后台落盘任务"""
+        await self.flush()
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """停止后台任务并做最后一次落盘（未启动时什么都不做）"""
+        if self._flush_task is None:
+            return
+        self._flush_task.cancel()
+        try:
+            await self._flush_task
+        except asyncio.CancelledError:
+            pass
+        self._flush_task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"未命中计数落盘失败: {e}")
+
+
+class GalleryExpander:
+    """
+    空闲时把高频未命中的物种补进预置图库
+
+    Args:
+        store: 未命中计数表
+        catalog: 发布到的预置图库
+        interval: 检查间隔（秒）
+        idle_after: 距离上一个诊断请求多久算空闲（秒）
+        top_n: 每轮最多发布的物种数
+        min_misses: 进入图库所需的最少未命中次数
+        per_hour: 每小时最多生成的图片数（已生成过的物种不占额度），<= 0 表示不限速
+    """
+
+    def __init__(self, store: MissStore, catalog: PresetCatalog = preset_catalog, interval: float = 60.0,
+                 idle_after: float = 30.0, top_n: int = 5, min_misses: int = 3, per_hour: float = 30.0,
+                 lock_path: str = EXPANSION_LOCK_FILE):
+        self.store = store
+        self.catalog = catalog
+        self.interval = interval
+        self.idle_after = idle_after
+        self.top_n = top_n
+        self.min_misses = min_misses
+        self.lock_path = lock_path
+        self.bucket = TokenBucket(per_hour / 3600, burst=max(1, top_n))
+        self._last_activity = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.generated = 0
+        self.failed = 0
+
+    def note_activity(self):
+        """收到诊断请求时调用"""
+        self._last_activity = time.monotonic()
+
+    def idle(self) -> bool:
+        return time.monotonic() - self._last_activity >= self.idle_after and not len(background_tasks)
+
+    async def run_once(self) -> int:
+        """发布一轮，返回发布的物种数"""
+        candidates = [name for name, _ in self.store.top(self.top_n, self.min_misses)
+                      if self.catalog.get(name) is None]
+        if not candidates:
+            return 0
+        with _exclusive(self.lock_path, blocking=False) as locked:
+            if not locked:
+                return 0
+            published = []
+            for name in candidates:
+                image_url = species_registry.get_image_url(name)
+                if not image_url:
+                    await self.bucket.acquire()
+                    if not self.idle():
+                        # 等待额度期间来了新请求，留到下次空闲
+                        break
+                    try:
+                        image_url = await generate_species_image(name)
+                    except Exception as e:
+                        self.failed += 1
+                        logger.warning(f"图库扩充生成失败: {name}: {type(e).__name__}: {e}")
+                        continue
+                    self.generated += 1
+                published.append({"object_name": name, "image_url": image_url})
+            if not published:
+                return 0
+
+            # 以文件中的最新内容为准（可能被 init_gallery 或其它 worker 改过）
+            snapshot = await asyncio.to_thread(self.catalog.reload)
+            added = [item for item in published if item["object_name"] not in snapshot.by_name]
+            if added:
+                await asyncio.to_thread(self.catalog.save, list(snapshot.species) + added)
+        for item in published:
+            self.store.forget(item["object_name"])
+        if added:
+            self.published += len(added)
+            logger.info(f"图库扩充: 新增 {len(added)} 个物种: {', '.join(item['object_name'] for item in added)}")
+        return len(added)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.idle():
+                continue
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"图库扩充失败: {type(e).__name__}: {e}")
+
+
+miss_store = MissStore(
+    max_entries=settings.miss_store_max_entries,
+    flush_interval=settings.miss_store_flush_interval,
+)
+
+gallery_expander = GalleryExpander(
+    miss_store,
+    interval=settings.gallery_expansion_interval,
+    idle_after=settings.gallery_expansion_idle,
+    top_n=settings.gallery_expansion_top_n,
+    min_misses=settings.gallery_expansion_min_misses,
+    per_hour=settings.gallery_expansion_per_hour,
+)
@@ -0,0 +1,160 @@
+"""上游 HTTP 客户端注册表 - 连接池复用与预热
+
+所有上游（LLM、Seedream、七牛云）共用进程级的 httpx.AsyncClient：
+- 每个上游独立的连接池上限、keep-alive 与超时配置
+- 可选 HTTP/2（需要安装 h2）
+- 所有客户端共用一个 SSL 上下文（加载 CA 证书约 40ms，不必每个上游各加载一次）
+- FastAPI lifespan 启动时预先建立连接，部署后的第一个请求不再承担 DNS/TCP/TLS 握手
+- 未经过 lifespan 的调用方（如 scripts/）会在首次使用时惰性创建
+- 多个 LLM 后端共用 openai 连接池，预热时逐一建立连接
+"""
+import asyncio
+import importlib.util
+import logging
+from typing import Dict, List
+
+import httpx
+
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class UpstreamConfig:
+    """单个上游的连接配置（取值见 settings.upstream_http，可通过 <NAME>_HTTP_<KEY> 环境变量覆盖）"""
+
+    def __init__(self, name: str, base_url: str, timeout: float, connect_timeout: float = 5.0,
+                 max_connections: int = 50, max_keepalive: int = 20, keepalive_expiry: float = 60.0,
+                 http2: bool = False, warmup_connections: int = 2, warmup_urls: List[str] = None):
+        self.name = name
+        self.base_url = base_url
+        # 预热的地址（同一个连接池访问多个主机时逐一预热）
+        self.warmup_urls = warmup_urls or [base_url]
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self.warmup_connections = warmup_connections
+
+
+class ClientRegistry:
+    """按上游名称管理共享的 httpx.AsyncClient 与 AsyncOpenAI 客户端"""
+
+    def __init__(self, configs: Dict[str, UpstreamConfig]):
+        self.configs = configs
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._openai: Dict[tuple, object] = {}
+        self._openai_http = None
+        self._ssl_context = None
+
+    def http(self, name: str) -> httpx.AsyncClient:
+        """获取指定上游的共享客户端"""
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._create(self.configs[name])
+            self._clients[name] = client
+        return client
+
+    def openai(self, base_url: str = None, api_key: str = None, max_retries: int = 2):
+        """
+        获取共享的 AsyncOpenAI 客户端（复用 openai 上游的连接池）
+
+        多个 LLM 后端（不同 base_url / api_key）各自一个实例，共用同一个连接池
+        """
+        http_client = self.http("openai")
+        if self._openai_http is not http_client:
+            self._openai = {}
+            self._openai_http = http_client
+        config = self.configs["openai"]
+        key = (base_url or config.base_url, api_key if api_key is not None else settings.openai_api_key, max_retries)
+        client = self._openai.get(key)
+        if client is None:
+            from openai import AsyncOpenAI
+
+            client = self._openai[key] = AsyncOpenAI(
+                base_url=key[0],
+                api_key=key[1],
+                http_client=http_client,
+                timeout=self._timeout(config),
+                max_retries=max_retries,
+            )
+        return client
+
+    async def start(self, warmup: bool = True):
+        """创建所有客户端并预热连接"""
+        for name in self.configs:
+            self.http(name)
+        if warmup:
+            await self.warmup()
+
+    async def warmup(self):
+        """预先建立到各上游的连接（失败不影响启动）"""
+        tasks = []
+        for name, config in self.configs.items():
+            if config.warmup_connections <= 0:
+                continue
+            # HTTP/2 多路复用，一条连接即可
+            count = 1 if config.http2 and HTTP2_AVAILABLE else config.warmup_connections
+            client = self.http(name)
+            for url in filter(None, config.warmup_urls):
+                tasks.extend(self._warmup_one(name, client, url) for _ in range(count))
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        self._openai = {}
+        self._openai_http = None
+        for client in clients.values():
+            await client.aclose()
+
+    async def _warmup_one(self, name: str, client: httpx.AsyncClient, url: str):
+        try:
+            await client.head(url, timeout=5.0)
+        except Exception as e:
+            logger.warning(f"上游 {name} 连接预热失败: {type(e).__name__}: {e}")
+
+    @staticmethod
+    def _timeout(config: UpstreamConfig) -> httpx.Timeout:
+        return httpx.Timeout(config.timeout, connect=config.connect_timeout)
+
+    def _create(self, config: UpstreamConfig) -> httpx.AsyncClient:
+        if self._ssl_context is None:
+            self._ssl_context = httpx.create_ssl_context()
+        http2 = config.http2
+        if http2 and not HTTP2_AVAILABLE:
+            logger.warning(f"上游 {config.name} 配置了 HTTP/2，但未安装 h2，回退到 HTTP/1.1")
+            http2 = False
+        return httpx.AsyncClient(
+            timeout=self._timeout(config),
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+            http2=http2,
+            verify=self._ssl_context,
+        )
+
+
+def _origin(url: str) -> str:
+    """https://host/path -> https://host/"""
+    parsed = httpx.URL(url)
+    return f"{parsed.scheme}://{parsed.netloc.decode()}/" if parsed.host else ""
+
+
+clients = ClientRegistry({
+    "openai": UpstreamConfig(
+        "openai",
+        base_url=settings.openai_base_url,
+        warmup_urls=[backend["base_url"] for backend in settings.llm_backends],
+        **settings.upstream_http["openai"],
+    ),
+    "ark": UpstreamConfig("ark", base_url=_origin(settings.ark_api_url), **settings.upstream_http["ark"]),
+    "cdn": UpstreamConfig("cdn", base_url=settings.qiniu_domain, **settings.upstream_http["cdn"]),
+    "qiniu": UpstreamConfig("qiniu", base_url=settings.qiniu_io_host, **settings.upstream_http["qiniu"]),
+})
@@ -1,12 +1,13 @@
 """图像生成服务 - Seedream"""
-import os
-import httpx
-from dotenv import load_dotenv
+import logging
 
-load_dotenv()
+from .http_clients import clients
+from .logging_setup import payload_sampled
+from .metrics import UPSTREAM_ERRORS
+from .settings import settings
+
+logger = logging.getLogger(__name__)
 
-ARK_API_KEY = os.getenv("ARK_API_KEY", "")
-ARK_API_URL = "https://ark.cn-beijing.volces.com/api/v3/images/generations"
 MODEL_NAME = "doubao-seedream-4-5-251128"
 async def generate_species_image_from_prompt(prompt:str) -> str:
     """
@@ -18,26 +19,28 @@ async def generate_species_image_from_prompt(prompt:str) -> str:
     Returns:
         生成的图片临时 URL
     """
-    async with httpx.AsyncClient(timeout=60.0) as client:
+    client = clients.http("ark")
+    try:
         response = await client.post(
-            ARK_API_URL,
+            settings.ark_api_url,
             headers={
                 "Content-Type": "application/json",
-                "Authorization": f"Bearer {ARK_API_KEY}"
+                "Authorization": f"Bearer {settings.ark_api_key}"
             },
             json={
                 "model": MODEL_NAME,
                 "prompt": prompt,
-        
                 "response_format": "url",
                 "watermark": False
             }
         )
         if response.status_code != 200:
-            print(f"❌ API Error Response: {response.text}")
+            logger.error(f"Seedream 返回 {response.status_code}: {response.text[:500]}")
         response.raise_for_status()
-        result = response.json()
-        print(result)
-        return result["data"][0]["url"]
-
-
+    except Exception:
+        UPSTREAM_ERRORS.inc("seedream")
+        raise
+    result = response.json()
+    if payload_sampled():
+        logger.info(f"Seedream 响应: {result}")
+    return result["data"][0]["url"]
@@ -0,0 +1,396 @@
+"""增量 JSON 解析器 - 逐块解析 LLM 流式输出的诊断 JSON
+
+LLM 流式返回形如下面的 JSON（可能被 ```json 代码块包裹）：
+
+    {"object_name": "...", "display_name": "...", "keywords": [...], "diagnosis": "..."}
+
+解析器是一个状态机，每个 delta 只扫描一次：
+- object_name / display_name / keywords 都闭合后立即产出 species 事件
+- diagnosis 字符串的内容随到随发，产出 diagnosis_chunk 事件（正确处理转义、跨块的 \\uXXXX 与代理对）
+"""
+import json
+import re
+from typing import Dict, List, Optional
+
+DEFAULT_KEYWORDS = ["神秘", "未知", "待鉴定"]
+SPECIES_FIELDS = ("object_name", "display_name", "keywords")
+STREAM_FIELD = "diagnosis"
+
+_WHITESPACE = " \t\r\n"
+_SKIP_WHITESPACE = re.compile(r"[ \t\r\n]*").match
+_INVALID_ESCAPE = re.compile(r'\\(?![\\"/bfnrtu])')
+_LONE_SURROGATE = re.compile("[\ud800-\udfff]")
+_scanstring = json.decoder.scanstring
+
+# 解析状态
+_PREAMBLE = 0      # 等待顶层 '{'（跳过代码块标记等前缀）
+_KEY = 1           # 等待 key 或 '}'
+_COLON = 2         # 等待 ':'
+_VALUE = 3         # 等待值的开始
+_STRING = 4        # 字符串内部
+_ARRAY = 5         # 数组内部，等待元素或 ']'
+_LITERAL = 6       # 数字 / true / false / null
+_NESTED = 7        # 嵌套对象，整体跳过
+_AFTER_VALUE = 8   # 值结束，等待 ',' 或 '}'
+_DONE = 9          # 顶层对象已闭合
+
+
+def _find_closing_quote(raw: str) -> int:
+    """查找未被转义的结束引号位置，找不到返回 -1"""
+    j = raw.find('"')
+    while j != -1:
+        k = j
+        while k > 0 and raw[k - 1] == "\\":
+            k -= 1
+        if (j - k) % 2 == 0:
+            return j
+        j = raw.find('"', j + 1)
+    return -1
+
+
+def _safe_prefix_length(raw: str) -> int:
+    """
+    返回可以安全解码的前缀长度
+
+    末尾未完整的转义（单个反斜杠、不足 4 位的 \\uXXXX）以及可能与下一段
+    组成代理对的高位代理 \\uD800-\\uDBFF 都需要留到下一段再解码。
+    """
+    start = raw.rfind("\\", max(0, len(raw) - 12))
+    while start != -1:
+        # 反斜杠本身被转义（\\\\）时不是转义序列的开头
+        k = start
+        while k > 0 and raw[k - 1] == "\\":
+            k -= 1
+        if (start - k) % 2 == 0:
+            tail = raw[start:]
+            if len(tail) == 1 or (tail[1] == "u" and len(tail) < 6):
+                # 转义不完整；若前面紧跟高位代理，一并保留
+                return _surrogate_start(raw, start)
+            if len(tail) == 6 and tail[1] == "u" and tail[2] in "dD" and tail[3] in "89abAB":
+                return start
+            return len(raw)
+        start = raw.rfind("\\", max(0, start - 6), start)
+    return len(raw)
+
+
+def _surrogate_start(raw: str, start: int) -> int:
+    prev = start - 6
+    if prev >= 0 and raw[prev:prev + 2] == "\\u" and raw[prev + 2] in "dD" and raw[prev + 3] in "89abAB":
+        return prev
+    return start
+
+
+def _decode_string(raw: str) -> str:
+    """用 json 的 C 实现解码字符串内容，容忍控制字符和非法转义"""
+    if "\\" not in raw:
+        return raw
+    try:
+        value = _scanstring('"' + raw + '"', 1, False)[0]
+    except ValueError:
+        # 非法转义（如 \\x）按字面保留
+        try:
+            value = _scanstring('"' + _INVALID_ESCAPE.sub(r"\\\\", raw) + '"', 1, False)[0]
+        except ValueError:
+            value = raw
+    return _LONE_SURROGATE.sub("\ufffd", value)
+
+
+class DiagnosisStreamParser:
+    """
+    诊断 JSON 的增量解析器
+
+    用法：
+        parser = DiagnosisStreamParser()
+        for delta in stream:
+            for event in parser.feed(delta):
+                ...
+        for event in parser.close():
+            ...
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, object] = {}
+        self.species_sent = False
+
+        self._state = _PREAMBLE
+        # 字符串解析状态
+        self._str_parts: List[str] = []
+        self._str_role = None          # "key" / "value" / "item"
+        self._streaming = False        # 当前字符串是否为需要流式输出的 diagnosis
+        self._raw_tail = ""            # 跨 delta 的未完整转义序列（原始文本）
+        # 当前字段
+        self._key: Optional[str] = None
+        self._array: Optional[list] = None
+        self._literal: List[str] = []
+        self._literal_in_array = False
+        # 嵌套对象跳过
+        self._nested_depth = 0
+        self._nested_in_string = False
+        self._nested_escape = False
+        # species 发送前到达的 diagnosis 内容
+        self._pending_chunks: List[str] = []
+
+    @property
+    def done(self) -> bool:
+        return self._state == _DONE
+
+    def feed(self, text: str) -> List[dict]:
+        """输入一段增量文本，返回本次产生的事件列表"""
+        # 快速路径：正处于字符串内部且本段不含引号/反斜杠（诊断文案流式输出的绝大多数 delta）
+        if self._state == _STRING and not self._raw_tail and '"' not in text and "\\" not in text:
+            self._str_parts.append(text)
+            if self._streaming and text:
+                if self.species_sent:
+                    return [{"type": "diagnosis_chunk", "chunk": text}]
+                self._pending_chunks.append(text)
+            return []
+
+        events: List[dict] = []
+        i = 0
+        n = len(text)
+        while i < n:
+            state = self._state
+
+            if state == _STRING:
+                i = self._scan_string(text, i, events)
+                continue
+
+            if state != _LITERAL and state != _NESTED:
+                # 结构字符之间的空白（缩进、换行）整段跳过
+                i = _SKIP_WHITESPACE(text, i).end()
+                if i >= n:
+                    break
+
+            c = text[i]
+
+            if state == _PREAMBLE:
+                idx = text.find("{", i)
+                if idx == -1:
+                    return events
+                self._state = _KEY
+                i = idx + 1
+
+            elif state == _KEY:
+                if c == '"':
+                    self._begin_string("key")
+                elif c == "}":
+                    self._finish_object(events)
+                i += 1
+
+            elif state == _COLON:
+                if c == ":":
+                    self._state = _VALUE
+                i += 1
+
+            elif state == _VALUE:
+                if c == '"':
+                    self._begin_string("value")
+                    i += 1
+                elif c == "[":
+                    self._array = []
+                    self._state = _ARRAY
+                    i += 1
+                elif c == "{":
+                    self._nested_depth = 1
+                    self._nested_in_string = False
+                    self._nested_escape = False
+                    self._state = _NESTED
+                    i += 1
+                elif c in _WHITESPACE:
+                    i += 1
+                else:
+                    self._literal = []
+                    self._literal_in_array = False
+                    self._state = _LITERAL
+
+            elif state == _ARRAY:
+                if c == '"':
+                    self._begin_string("item")
+                    i += 1
+                elif c == "]":
+                    self._set_field(self._key, self._array, events)
+                    self._array = None
+                    self._state = _AFTER_VALUE
+                    i += 1
+                elif c in _WHITESPACE or c == ",":
+                    i += 1
+                else:
+                    self._literal = []
+                    self._literal_in_array = True
+                    self._state = _LITERAL
+
+            elif state == _LITERAL:
+                if c in _WHITESPACE or c in ",}]":
+                    value = self._parse_literal("".join(self._literal))
+                    if self._literal_in_array:
+                        self._array.append(value)
+                        self._state = _ARRAY
+                    else:
+                        self._set_field(self._key, value, events)
+                        self._state = _AFTER_VALUE
+                    # 结束符交给下一个状态处理
+                else:
+                    self._literal.append(c)
+                    i += 1
+
+            elif state == _NESTED:
+                i = self._skip_nested(text, i)
+
+            elif state == _AFTER_VALUE:
+                if c == ",":
+                    self._state = _KEY
+                elif c == "}":
+                    self._finish_object(events)
+                i += 1
+
+            else:  # _DONE：忽略闭合后的内容（如结尾的代码块标记）
+                return events
+
+        return events
+
+    def close(self) -> List[dict]:
+        """输入结束，补发未发出的事件；若从未解析出物种信息则返回 error 事件"""
+        events: List[dict] = []
+        if self._state == _STRING and self._key == STREAM_FIELD and self._str_role == "value":
+            # 诊断文案未闭合（输出被截断），已流出的部分即为结果
+            self.fields.setdefault(STREAM_FIELD, "".join(self._str_parts))
+        if not self.species_sent:
+            if "object_name" not in self.fields:
+                events.append({"type": "error", "message": "诊断解析失败，请重试"})
+                return events
+            self._emit_species(events)
+        return events
+
+    def result(self) -> dict:
+        """返回已解析出的完整结果（字段缺失时使用默认值）"""
+        object_name = self.fields.get("object_name") or "未知物种"
+        return {
+            "object_name": object_name,
+            "display_name": self.fields.get("display_name") or object_name,
+            "keywords": self.fields.get("keywords") or list(DEFAULT_KEYWORDS),
+            "diagnosis": self.fields.get(STREAM_FIELD) or "",
+        }
+
+    # ------------------------------------------------------------------
+    # 字符串
+
+    def _begin_string(self, role: str):
+        self._str_parts = []
+        self._str_role = role
+        self._streaming = role == "value" and self._key == STREAM_FIELD
+        self._raw_tail = ""
+        self._state = _STRING
+
+    def _scan_string(self, text: str, i: int, events: List[dict]) -> int:
+        """扫描字符串内容，返回新的位置"""
+        held = self._raw_tail
+        raw = held + text[i:] if held else text[i:]
+        end = raw.find('"')
+        if end > 0 and raw[end - 1] == "\\":
+            end = _find_closing_quote(raw)
+
+        if end == -1:
+            # 字符串尚未结束：解码安全前缀，未完整的转义序列留到下一段
+            if "\\" in raw:
+                cut = _safe_prefix_length(raw)
+                self._raw_tail = raw[cut:]
+                decoded = _decode_string(raw[:cut])
+            else:
+                decoded = raw
+            consumed = len(text)
+        else:
+            self._raw_tail = ""
+            decoded = _decode_string(raw[:end])
+            consumed = i + end - len(held) + 1
+
+        if decoded:
+            self._str_parts.append(decoded)
+            if self._streaming:
+                self._emit_chunk(decoded, events)
+        if end != -1:
+            self._end_string(events)
+        return consumed
+
+    def _emit_chunk(self, chunk: str, events: List[dict]):
+        if not chunk:
+            return
+        if self.species_sent:
+            events.append({"type": "diagnosis_chunk", "chunk": chunk})
+        else:
+            self._pending_chunks.append(chunk)
+
+    def _end_string(self, events: List[dict]):
+        role = self._str_role
+        if role == "key":
+            self._key = "".join(self._str_parts)
+            self._state = _COLON
+        elif role == "item":
+            self._array.append("".join(self._str_parts))
+            self._state = _ARRAY
+        else:
+            self._set_field(self._key, "".join(self._str_parts), events)
+            self._state = _AFTER_VALUE
+        self._str_parts = []
+        self._str_role = None
+        self._streaming = False
+
+    # ------------------------------------------------------------------
+    # 其它值
+
+    @staticmethod
+    def _parse_literal(raw: str):
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            return raw
+
+    def _skip_nested(self, text: str, i: int) -> int:
+        n = len(text)
+        while i < n:
+            c = text[i]
+            i += 1
+            if self._nested_in_string:
+                if self._nested_escape:
+                    self._nested_escape = False
+                elif c == "\\":
+                    self._nested_escape = True
+                elif c == '"':
+                    self._nested_in_string = False
+            elif c == '"':
+                self._nested_in_string = True
+            elif c == "{":
+                self._nested_depth += 1
+            elif c == "}":
+                self._nested_depth -= 1
+                if self._nested_depth == 0:
+                    self._state = _AFTER_VALUE
+                    return i
+        return i
+
+    # ------------------------------------------------------------------
+    # 字段与事件
+
+    def _set_field(self, key: Optional[str], value, events: List[dict]):
+        if key is None:
+            return
+        self.fields[key] = value
+        if not self.species_sent and all(f in self.fields for f in SPECIES_FIELDS):
+            self._emit_species(events)
+
+    def _emit_species(self, events: List[dict]):
+        result = self.result()
+        events.append({
+            "type": "species",
+            "object_name": result["object_name"],
+            "display_name": result["display_name"],
+            "keywords": result["keywords"],
+        })
+        self.species_sent = True
+        if self._pending_chunks:
+            events.append({"type": "diagnosis_chunk", "chunk": "".join(self._pending_chunks)})
+            self._pending_chunks = []
+
+    def _finish_object(self, events: List[dict]):
+        self._state = _DONE
+        if not self.species_sent and "object_name" in self.fields:
+            self._emit_species(events)
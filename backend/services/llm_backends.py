@@ -0,0 +1,307 @@
+"""多个 OpenAI 兼容 LLM 后端 - 健康跟踪、熔断、故障转移与对冲请求
+
+- 后端按 LLM_BACKENDS 中的顺序排优先级；连续失败 breaker_failures 次后熔断 cooldown 秒，
+  冷却结束后进入半开状态：只放行一个试探请求，其余请求仍然跳过该后端，试探成功即恢复，失败则重新熔断；
+  所有后端都在熔断中（或正在试探）时直接抛出 BackendsUnavailable，不再把请求发给可能仍然故障的后端
+- 流式请求 open_stream(): 先向首选后端发起请求，首个 token 超过该后端近期 TTFT 的 p95 仍未到达时，
+  向下一个可用后端发起对冲请求，先收到首个 token 的一方胜出，另一方立即取消（关闭上游连接）；
+  某个后端在首个 token 之前失败时立即转到下一个后端
+- 首个 token 之后的失败无法转移（内容已经发给客户端），照常抛出
+- 非流式请求 complete() 只做故障转移；fast=True 时使用后端的快速模型（拆分模式的物种归类）
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Set
+
+from .http_clients import clients
+from .metrics import LLM_ATTEMPTS, LLM_CIRCUIT_OPEN, LLM_HEDGES
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+class BackendsUnavailable(Exception):
+    """所有 LLM 后端都在熔断中"""
+
+
+# 计算 TTFT 分位数所需的最少样本数，不足时使用默认对冲延迟
+MIN_TTFT_SAMPLES = 20
+
+
+class LLMBackend:
+    """
+    单个 OpenAI 兼容后端及其健康状态
+
+    Args:
+        name: 名称（日志与指标标签）
+        base_url: 接口地址
+        model: 模型名
+        api_key: API Key
+        fast_model: 快速模型名（省略时与 model 相同）
+        breaker_failures: 连续失败多少次后熔断
+        cooldown: 熔断时长（秒）
+        window: 保留的最近 TTFT 样本数
+    """
+
+    def __init__(self, name: str, base_url: str, model: str, api_key: str, breaker_failures: int = 3,
+                 cooldown: float = 30.0, window: int = 200, fast_model: str = ""):
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        self.fast_model = fast_model or model
+        self.api_key = api_key
+        self.breaker_failures = breaker_failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        # 半开状态下是否已有试探请求在途
+        self._probing = False
+        self._ttft: Deque[float] = deque(maxlen=window)
+        # 首个 token 之前被取消的请求数（对冲落选、客户端断开）：只知道 TTFT 的下界，不计入样本
+        self.censored = 0
+
+    def tripped(self) -> bool:
+        return self.failures >= self.breaker_failures
+
+    def available(self) -> bool:
+        """未熔断，或熔断已冷却且还没有试探请求在途（不占用试探名额）"""
+        if not self.tripped():
+            return True
+        return time.monotonic() >= self.open_until and not self._probing
+
+    def acquire(self) -> bool:
+        """发起请求前调用：未熔断时总是放行；半开状态只放行一个试探请求，结果由 record_* 释放"""
+        if not self.available():
+            return False
+        if self.tripped():
+            self._probing = True
+            logger.info(f"LLM 后端 {self.name} 熔断冷却结束，发送试探请求")
+        return True
+
+    def record_success(self, ttft: Optional[float] = None):
+        if ttft is not None:
+            self._ttft.append(ttft)
+        if self.tripped():
+            logger.info(f"LLM 后端 {self.name} 已恢复")
+            LLM_CIRCUIT_OPEN.set(0, self.name)
+        self.failures = 0
+        self.open_until = 0.0
+        self._probing = False
+
+    def record_failure(self, error: BaseException):
+        self.failures += 1
+        probe, self._probing = self._probing, False
+        if not self.tripped():
+            return
+        self.open_until = time.monotonic() + self.cooldown
+        LLM_CIRCUIT_OPEN.set(1, self.name)
+        if self.failures > self.breaker_failures and not probe:
+            # 熔断前已经发出的请求陆续失败，只延长熔断时间
+            return
+        logger.warning(f"LLM 后端 {self.name} {'试探失败' if probe else f'连续失败 {self.failures} 次'}，"
+                       f"熔断 {self.cooldown:.0f}s: {type(error).__name__}: {error}")
+
+    def record_cancelled(self):
+        """首个 token 之前被取消：不计入 TTFT 样本（只是下界，会把分位数拉低、对冲提前）；试探被取消时释放名额"""
+        self.censored += 1
+        self._probing = False
+
+    def ttft_quantile(self, q: float) -> Optional[float]:
+        if len(self._ttft) < MIN_TTFT_SAMPLES:
+            return None
+        ordered = sorted(self._ttft)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class LLMStream:
+    """已经收到首个 token 的流式响应"""
+
+    def __init__(self, backend: LLMBackend, response, chunks: AsyncIterator, first: str):
+        self.backend = backend
+        self.response = response
+        self._chunks = chunks
+        self._first = first
+
+    async def contents(self) -> AsyncIterator[str]:
+        """依次产出文本片段（从首个 token 开始）"""
+        yield self._first
+        try:
+            async for chunk in self._chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            self.backend.record_failure(e)
+            raise
+
+    async def close(self):
+        await self.response.close()
+
+
+class LLMBackendPool:
+    """
+    按优先级排列的后端集合
+
+    Args:
+        backends: 后端列表（第一个为首选）
+        hedge_enabled: 是否启用对冲请求
+        hedge_quantile: 对冲时机取首选后端近期 TTFT 的分位数
+        hedge_default_delay: TTFT 样本不足时的对冲延迟（秒）
+        hedge_min_delay: 对冲延迟下限（秒）
+    """
+
+    def __init__(self, backends: List[LLMBackend], hedge_enabled: bool = True, hedge_quantile: float = 0.95,
+                 hedge_default_delay: float = 2.0, hedge_min_delay: float = 0.3):
+        self.backends = backends
+        self.hedge_enabled = hedge_enabled
+        self.hedge_quantile = hedge_quantile
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_min_delay = hedge_min_delay
+        # 被取消、尚在关闭上游连接的请求（保留引用直到结束）
+        self._abandoned: Set[asyncio.Task] = set()
+
+    def candidates(self) -> List[LLMBackend]:
+        """可用的后端（按优先级）；全部熔断时抛出 BackendsUnavailable。发起请求时还要经过 acquire()（半开只放行一个）"""
+        available = [backend for backend in self.backends if backend.available()]
+        if not available:
+            raise BackendsUnavailable("所有 LLM 后端都在熔断中")
+        return available
+
+    def healthy(self) -> bool:
+        """至少有一个后端未处于熔断中"""
+        return any(backend.available() for backend in self.backends)
+
+    def hedge_delay(self, backend: LLMBackend) -> float:
+        quantile = backend.ttft_quantile(self.hedge_quantile)
+        return max(self.hedge_min_delay, self.hedge_default_delay if quantile is None else quantile)
+
+    def client(self, backend: LLMBackend):
+        # 多个后端时由这里做故障转移，SDK 不再自行重试同一个后端
+        return clients.openai(backend.base_url, backend.api_key, max_retries=0 if len(self.backends) > 1 else 2)
+
+    async def complete(self, messages: List[Dict], fast: bool = False, **kwargs):
+        """非流式调用，失败时依次转到下一个后端"""
+        last_error: BaseException = BackendsUnavailable("所有 LLM 后端都在熔断中")
+        for backend in self.candidates():
+            if not backend.acquire():
+                continue
+            try:
+                response = await self.client(backend).chat.completions.create(
+                    model=backend.fast_model if fast else backend.model, messages=messages, **kwargs)
+            except asyncio.CancelledError:
+                backend.record_cancelled()
+                raise
+            except Exception as e:
+                backend.record_failure(e)
+                LLM_ATTEMPTS.inc(backend.name, "failed")
+                logger.warning(f"LLM 后端 {backend.name} 调用失败: {type(e).__name__}: {e}")
+                last_error = e
+                continue
+            backend.record_success()
+            LLM_ATTEMPTS.inc(backend.name, "won")
+            return response
+        raise last_error
+
+    async def open_stream(self, messages: List[Dict], **kwargs) -> LLMStream:
+        """发起流式调用，返回最先收到首个 token 的流（失败转移 + 对冲）"""
+        candidates = self.candidates()
+        pending: Dict[asyncio.Task, LLMBackend] = {}
+        hedged = False
+        last_error: Optional[BaseException] = None
+
+        def take() -> Optional[LLMBackend]:
+            """下一个放行的候选后端（半开的后端只放行一个试探请求）"""
+            while candidates:
+                backend = candidates.pop(0)
+                if backend.acquire():
+                    return backend
+            return None
+
+        def launch(backend: LLMBackend) -> Optional[float]:
+            """向 backend 发起请求，返回对冲截止时间（不再对冲时为 None）"""
+            task = asyncio.create_task(self._first_token(backend, messages, kwargs))
+            # 在回调里记录取消：任务可能在开始执行之前就被取消，协程内部的 except 不会运行
+            task.add_done_callback(lambda t: backend.record_cancelled() if t.cancelled() else None)
+            pending[task] = backend
+            if self.hedge_enabled and not hedged and candidates:
+                return self.hedge_delay(backend)
+            return None
+
+        first = take()
+        if first is None:
+            raise BackendsUnavailable("所有 LLM 后端都在熔断中")
+        deadline = launch(first)
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, timeout=deadline, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    backend = take()
+                    if backend is not None:
+                        slow = next(iter(pending.values()))
+                        logger.info(f"LLM 后端 {slow.name} 首个 token 超过 {deadline:.2f}s，向 {backend.name} 发起对冲请求")
+                        LLM_HEDGES.inc(slow.name)
+                        launch(backend)
+                    deadline = None
+                    continue
+                for task in done:
+                    backend = pending.pop(task)
+                    if task.exception() is None:
+                        LLM_ATTEMPTS.inc(backend.name, "won")
+                        return task.result()
+                    last_error = task.exception()
+                    LLM_ATTEMPTS.inc(backend.name, "failed")
+                    logger.warning(f"LLM 后端 {backend.name} 调用失败: {type(last_error).__name__}: {last_error}")
+                if not pending:
+                    backend = take()
+                    if backend is not None:
+                        deadline = launch(backend)
+            raise last_error
+        finally:
+            # 落选或调用方已取消：立即取消其余请求（不 await，调用方可能正被取消）
+            for task, backend in pending.items():
+                LLM_ATTEMPTS.inc(backend.name, "lost")
+                if not task.done():
+                    task.cancel()
+                elif task.cancelled() or task.exception() is not None:
+                    continue
+                else:
+                    # 同一轮里也收到了首个 token 的另一个后端
+                    task = asyncio.create_task(task.result().close())
+                self._abandoned.add(task)
+                task.add_done_callback(self._abandoned.discard)
+
+    async def _first_token(self, backend: LLMBackend, messages: List[Dict], kwargs: Dict) -> LLMStream:
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await self.client(backend).chat.completions.create(
+                model=backend.model, messages=messages, stream=True, **kwargs)
+            chunks = response.__aiter__()
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    backend.record_success(time.perf_counter() - started)
+                    return LLMStream(backend, response, chunks, chunk.choices[0].delta.content)
+            raise ValueError(f"LLM 后端 {backend.name} 没有返回任何内容")
+        except BaseException as e:
+            if response is not None:
+                await response.close()
+            if not isinstance(e, asyncio.CancelledError):
+                backend.record_failure(e)
+            raise
+
+
+llm_pool = LLMBackendPool(
+    [
+        LLMBackend(
+            backend["name"], backend["base_url"], backend["model"], backend["api_key"],
+            breaker_failures=settings.llm_breaker_failures, cooldown=settings.llm_breaker_cooldown,
+            fast_model=backend["fast_model"],
+        )
+        for backend in settings.llm_backends
+    ],
+    hedge_enabled=settings.llm_hedge_enabled,
+    hedge_quantile=settings.llm_hedge_quantile,
+    hedge_default_delay=settings.llm_hedge_default_delay,
+    hedge_min_delay=settings.llm_hedge_min_delay,
+)
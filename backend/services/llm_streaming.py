@@ -1,73 +1,95 @@
-"""流式 LLM 服务 - 支持 SSE 输出"""
-import os
-import json
-from typing import AsyncGenerator
-from openai import AsyncOpenAI
-from dotenv import load_dotenv
-import logging
-
-# 配置日志
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+"""流式 LLM 服务 - 支持 SSE 输出
 
-load_dotenv()
+两种调用方式（LLM_SPLIT_MODE）：
+- 单次调用（默认）：一次流式调用输出完整 JSON，物种字段写完后才能发出 species 事件
+- 拆分模式：先用快速模型做一次短的非流式物种归类，拿到物种后立即发出 species 事件（图片流水线随即开始），
+  再以该物种为条件流式生成诊断文案；归类失败、超时或无法解析时退回单次调用
 
-# 获取环境变量
-base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
-api_key = os.getenv("OPENAI_API_KEY", "")
+本地分类器（见 local_classifier）：LOCAL_CLASSIFIER_SHARE 比例的请求、以及所有后端都在熔断中时的请求直接由本地诊断；
+LLM 在发出物种之前失败、无法解析或排队已满时也改由本地诊断（LOCAL_CLASSIFIER_FALLBACK）
+"""
+import asyncio
+import os
+import random
+import time
+from contextlib import aclosing
+from functools import lru_cache
+from typing import AsyncGenerator, List, Optional
+import logging
 
-# 可配置的 OpenAI 兼容接口
-client = AsyncOpenAI(
-    base_url=base_url,
-    api_key=api_key
-)
+from .admission import llm_admission
+from .catalog import preset_catalog
+from .json_stream import DiagnosisStreamParser
+from .llm_backends import llm_pool
+from .local_classifier import decision_log, local_classifier
+from .metrics import LOCAL_DIAGNOSES, UPSTREAM_ERRORS, observe_stage
+from .result_cache import diagnosis_cache
+from .settings import settings
+from .similar_cache import similar_cache
+from .species_index import species_index
 
-MODEL_NAME = os.getenv("OPENAI_MODEL_NAME", "gpt-4o-mini")
+logger = logging.getLogger(__name__)
 
-# 加载预置图库数据
-PRESET_SPECIES_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "preset_species.json")
-SYSTEM_PROMPT_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "prompts", "system_prompt_streaming.md")
+# System Prompt 模板（首次调用 get_system_prompt() 等时读取）
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "prompts")
+SYSTEM_PROMPT_FILE = os.path.join(PROMPTS_DIR, "system_prompt_streaming.md")
+# 拆分模式：物种归类 / 诊断文案
+CLASSIFY_PROMPT_FILE = os.path.join(PROMPTS_DIR, "system_prompt_classify.md")
+DIAGNOSIS_PROMPT_FILE = os.path.join(PROMPTS_DIR, "system_prompt_diagnosis.md")
 
-def load_preset_species() -> list:
-    """加载预置物种数据"""
-    try:
-        with open(PRESET_SPECIES_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Warning: Failed to load preset species: {e}")
-        return []
-
-def load_system_prompt_template() -> str:
+def load_system_prompt_template(path: str = SYSTEM_PROMPT_FILE) -> str:
     """加载 System Prompt 模板"""
     try:
-        with open(SYSTEM_PROMPT_FILE, "r", encoding="utf-8") as f:
+        with open(path, "r", encoding="utf-8") as f:
             return f.read()
     except Exception as e:
-        print(f"Warning: Failed to load system prompt template: {e}")
+        logger.warning(f"Failed to load system prompt template: {e}")
         # 返回一个基础的提示词作为后备
         return """你是精神物种鉴定所的首席鉴定官。请将用户的情绪状态鉴定为一种离谱的物种。
 
-现有馆藏物种：
-{species_list}
+候选物种见用户消息中的【现存馆藏列表】。
 
 请严格按照要求的格式输出结果。"""
 
-PRESET_SPECIES = load_preset_species()
-PRESET_SPECIES_NAMES = [s["object_name"] for s in PRESET_SPECIES]
-SYSTEM_PROMPT_TEMPLATE = load_system_prompt_template()
 
+@lru_cache(maxsize=None)
 def get_system_prompt() -> str:
-    """构建动态 System Prompt，包含预置物种列表"""
-    species_list_str = "、".join(PRESET_SPECIES_NAMES)
-    return SYSTEM_PROMPT_TEMPLATE.replace("{species_list}", species_list_str)
+    """System Prompt 是静态的，所有请求共享同一前缀（上游可命中 prompt 前缀缓存）"""
+    return load_system_prompt_template()
+
+
+@lru_cache(maxsize=None)
+def get_classify_prompt() -> str:
+    return load_system_prompt_template(CLASSIFY_PROMPT_FILE)
+
+
+@lru_cache(maxsize=None)
+def get_diagnosis_prompt() -> str:
+    return load_system_prompt_template(DIAGNOSIS_PROMPT_FILE)
+
+
+def build_user_message(symptom: str) -> str:
+    """用户消息：本次请求的候选物种短名单 + 症状"""
+    species_list_str = "、".join(species_index.shortlist(symptom))
+    return f"【现存馆藏列表】{species_list_str}\n\n请鉴定这个人的精神物种：{symptom}"
+
+
+def build_diagnosis_message(symptom: str, species: dict) -> str:
+    """拆分模式的诊断文案请求：已选定的物种 + 症状"""
+    return (f"【鉴定结果】物种：{species['object_name']}；展示名：{species['display_name']}；"
+            f"标签：{'、'.join(species['keywords'])}\n\n{symptom}")
 
 
 def get_preset_image_url(object_name: str) -> str | None:
     """检查是否命中预置物种，返回图片 URL"""
-    for species in PRESET_SPECIES:
-        if species["object_name"] == object_name:
-            return species["image_url"]
-    return None
+    return preset_catalog.get_image_url(object_name)
+
+
+def _attach_preset_image(event: dict) -> dict:
+    """为 species 事件补充预置图库 URL（命中则前端可直接展示）"""
+    if event["type"] == "species":
+        event["image_url"] = get_preset_image_url(event["object_name"])
+    return event
 
 
 async def diagnose_symptom_streaming(symptom: str) -> AsyncGenerator[dict, None]:
@@ -78,153 +100,232 @@ async def diagnose_symptom_streaming(symptom: str) -> AsyncGenerator[dict, None]
     1. 先输出物种基础信息（object_name, display_name, keywords）
     2. 再流式输出诊断文案（diagnosis）
     
+    相同（或足够相似的）症状命中缓存时，直接回放缓存的 species / diagnosis_chunk 事件，不调用 LLM；
+    否则在 llm_admission 的名额内调用 LLM（过载时抛出 Overloaded）；
+    分流到本地分类器或 LLM 在发出物种之前失败时，由本地分类器给出诊断（见 local_classifier）
+    
     Yields:
         dict: 包含 type 字段的事件数据
     """
-    logger.info(f"开始流式调用 LLM，模型: {MODEL_NAME}")
-    
-    response = await client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[
-            {"role": "system", "content": get_system_prompt()},
-            {"role": "user", "content": f"请鉴定这个人的精神物种：{symptom}"}
-        ],
-        temperature=1.0,
-        stream=True,
-    )
+    cached = diagnosis_cache.get(symptom) or similar_cache.get(symptom)
+    if cached is not None:
+        logger.info(f"命中诊断缓存: object_name='{cached['object_name']}'")
+        for event in replay_events(cached):
+            yield event
+        return
+
+    if local_available():
+        reason = None
+        if not llm_pool.healthy() and settings.local_classifier_fallback:
+            reason = "outage"
+        elif settings.local_classifier_share > 0 and random.random() < settings.local_classifier_share:
+            reason = "share"
+        if reason is not None:
+            for event in _local_events(symptom, reason):
+                yield event
+            return
     
-    # 用于累积完整响应
-    full_content = ""
-    species_info_sent = False
-    diagnosis_started = False
-    diagnosis_buffer = ""
+    species_sent = False
+    try:
+        # 并发已满时排队，排队也满（或超时）时抛出 Overloaded；调用方提前关闭时先关闭上游流，再归还名额
+        async with llm_admission.slot(), aclosing(_stream_llm(symptom)) as events:
+            async for event in events:
+                if event["type"] == "error" and not species_sent and _fallback_enabled():
+                    logger.warning("LLM 诊断无法解析，改用本地分类器")
+                    break
+                species_sent = species_sent or event["type"] == "species"
+                yield event
+            else:
+                return
+    except Exception as e:
+        if species_sent or not _fallback_enabled():
+            raise
+        logger.warning(f"LLM 诊断失败，改用本地分类器: {type(e).__name__}: {e}")
+    for event in _local_events(symptom, "fallback"):
+        yield event
+
+
+def local_available() -> bool:
+    """本地分类器是否可用（已开启且已安装 numpy、图库非空）"""
+    return settings.local_classifier_enabled and local_classifier.ready()
+
+
+def _fallback_enabled() -> bool:
+    return settings.local_classifier_fallback and local_available()
+
+
+def _local_events(symptom: str, reason: str) -> List[dict]:
+    """本地分类器的诊断结果（不写入缓存与决策日志）；species 事件带 source="local"，前端与调用方可据此区分模板文案"""
+    started = time.perf_counter()
+    result = local_classifier.diagnose(symptom)
+    observe_stage("local_classify", time.perf_counter() - started)
+    LOCAL_DIAGNOSES.inc(reason)
+    logger.info(f"本地分类器诊断({reason}): object_name='{result['object_name']}'")
+    events = replay_events(result)
+    events[0]["source"] = "local"
+    return events
+
+
+async def generate_diagnosis(symptom: str) -> Optional[dict]:
+    """
+    完整调用一次 LLM（不查也不写诊断缓存），返回 {object_name, display_name, keywords, diagnosis}
+
+    用于后台预生成（见 dice_pool），解析失败时返回 None；在 llm_admission 的名额内执行
+    """
+    result, parts = None, []
+    async with llm_admission.slot(), aclosing(_stream_llm(symptom, remember=False)) as events:
+        async for event in events:
+            if event["type"] == "species":
+                result = {key: event[key] for key in ("object_name", "display_name", "keywords")}
+            elif event["type"] == "diagnosis_chunk":
+                parts.append(event["chunk"])
+    if result is None:
+        return None
+    result["diagnosis"] = "".join(parts)
+    return result
+
+
+async def _stream_llm(symptom: str, remember: bool = True) -> AsyncGenerator[dict, None]:
+    """调用 LLM（单次调用或拆分模式），完整结果写入缓存（remember=False 时不写）"""
+    species = await _classify(symptom) if settings.llm_split_mode else None
+    if species is not None:
+        events = _stream_split(symptom, species, remember)
+    else:
+        events = _stream_single(symptom, remember)
+    async with aclosing(events):
+        async for event in events:
+            yield event
+
+
+def _remember(symptom: str, result: dict):
+    diagnosis_cache.put(symptom, result)
+    similar_cache.put(symptom, result)
+    species_index.reinforce(symptom, result["object_name"])
+    if settings.decision_log_enabled:
+        decision_log.record(symptom, result)
+
+
+async def _classify(symptom: str) -> Optional[dict]:
+    """拆分模式的物种归类：快速模型一次短的非流式调用，返回 species 事件；失败、超时或无法解析时返回 None"""
+    started = time.perf_counter()
+    try:
+        response = await asyncio.wait_for(llm_pool.complete(
+            [
+                {"role": "system", "content": get_classify_prompt()},
+                {"role": "user", "content": build_user_message(symptom)}
+            ],
+            fast=True,
+            temperature=1.0,
+            max_tokens=settings.llm_classify_max_tokens,
+        ), settings.llm_classify_timeout)
+    except asyncio.TimeoutError:
+        UPSTREAM_ERRORS.inc("openai")
+        logger.warning(f"物种归类超过 {settings.llm_classify_timeout:.1f}s，改用单次调用")
+        return None
+    except Exception as e:
+        UPSTREAM_ERRORS.inc("openai")
+        logger.warning(f"物种归类失败，改用单次调用: {type(e).__name__}: {e}")
+        return None
+    parser = DiagnosisStreamParser()
+    content = response.choices[0].message.content or ""
+    species = next((event for event in parser.feed(content) + parser.close() if event["type"] == "species"), None)
+    if species is None:
+        logger.warning(f"物种归类结果无法解析，改用单次调用: {content[:200]}")
+        return None
+    observe_stage("llm_classify", time.perf_counter() - started)
+    return species
+
+
+async def _stream_split(symptom: str, species: dict, remember: bool) -> AsyncGenerator[dict, None]:
+    """拆分模式：先发出已归类的物种，再按该物种流式生成诊断文案（纯文本）"""
+    yield _attach_preset_image(dict(species))
+    parts = []
+    started = time.perf_counter()
+    try:
+        stream = await llm_pool.open_stream(
+            [
+                {"role": "system", "content": get_diagnosis_prompt()},
+                {"role": "user", "content": build_diagnosis_message(symptom, species)}
+            ],
+            temperature=1.0,
+        )
+        observe_stage("llm_ttft", time.perf_counter() - started)
+        logger.info(f"LLM 后端 {stream.backend.name} 开始输出诊断文案，模型: {stream.backend.model}")
+
+        try:
+            async with aclosing(stream.contents()) as contents:
+                async for content in contents:
+                    if not parts:
+                        content = content.lstrip()
+                        if not content:
+                            continue
+                    parts.append(content)
+                    yield {"type": "diagnosis_chunk", "chunk": content}
+        finally:
+            await stream.close()
+    except Exception:
+        UPSTREAM_ERRORS.inc("openai")
+        raise
+    observe_stage("llm_total", time.perf_counter() - started)
+
+    if remember:
+        _remember(symptom, {
+            "object_name": species["object_name"],
+            "display_name": species["display_name"],
+            "keywords": species["keywords"],
+            "diagnosis": "".join(parts).strip(),
+        })
+
+
+async def _stream_single(symptom: str, remember: bool) -> AsyncGenerator[dict, None]:
+    """单次调用：一次流式调用输出完整 JSON，增量解析"""
+    parser = DiagnosisStreamParser()
+    started = time.perf_counter()
     
-    async for chunk in response:
-        if not chunk.choices:
-            continue
-            
-        delta = chunk.choices[0].delta
-        if not delta.content:
-            continue
-            
-        full_content += delta.content
+    try:
+        # 多个后端时失败转移，首个 token 过慢时对冲（见 llm_backends）
+        stream = await llm_pool.open_stream(
+            [
+                {"role": "system", "content": get_system_prompt()},
+                {"role": "user", "content": build_user_message(symptom)}
+            ],
+            temperature=1.0,
+        )
+        observe_stage("llm_ttft", time.perf_counter() - started)
+        logger.info(f"LLM 后端 {stream.backend.name} 开始输出，模型: {stream.backend.model}")
         
-        # 尝试解析已累积的内容
-        if not species_info_sent:
-            # 尝试提取物种信息（在 diagnosis 字段之前）
-            try:
-                # 清理 markdown 代码块标记
-                clean_content = full_content
-                if clean_content.startswith("```json"):
-                    clean_content = clean_content.replace("```json", "", 1)
-                if clean_content.startswith("```"):
-                    clean_content = clean_content.replace("```", "", 1)
-                
-                # 检查是否已经有了 diagnosis 字段的开始部分
-                if '"diagnosis"' in clean_content:
-                    # 提取 diagnosis 之前的部分，构造有效 JSON
-                    diagnosis_idx = clean_content.index('"diagnosis"')
-                    before_diagnosis = clean_content[:diagnosis_idx].rstrip().rstrip(',')
-                    
-                    # 尝试构造完整的 JSON 对象来提取物种信息
-                    try:
-                        # 添加闭合括号尝试解析
-                        partial_json = before_diagnosis + "}"
-                        partial_data = json.loads(partial_json)
-                        
-                        # 成功解析，发送物种基础信息
-                        object_name = partial_data.get("object_name", "未知物种")
-                        display_name = partial_data.get("display_name") or object_name
-                        keywords = partial_data.get("keywords", ["神秘", "未知", "待鉴定"])
-                        
-                        # 检查是否命中预置图库
-                        preset_image = get_preset_image_url(object_name)
-                        
-                        yield {
-                            "type": "species",
-                            "object_name": object_name,
-                            "display_name": display_name,
-                            "keywords": keywords,
-                            "image_url": preset_image  # 如果命中预置图库则直接返回
-                        }
-                        
-                        species_info_sent = True
-                        diagnosis_started = True
-                        
-                        # 提取 diagnosis 字段已经生成的内容
-                        after_diagnosis_key = clean_content[diagnosis_idx + len('"diagnosis"'):]
-                        # 跳过冒号和引号
-                        colon_idx = after_diagnosis_key.find(':')
-                        if colon_idx != -1:
-                            after_colon = after_diagnosis_key[colon_idx + 1:].lstrip()
-                            if after_colon.startswith('"'):
-                                diagnosis_buffer = after_colon[1:]  # 跳过开头引号
-                                # 移除结尾引号（如果有）
-                                if diagnosis_buffer.endswith('"'):
-                                    diagnosis_buffer = diagnosis_buffer[:-1]
-                                if diagnosis_buffer.endswith('"}'):
-                                    diagnosis_buffer = diagnosis_buffer[:-2]
-                                if diagnosis_buffer:
-                                    yield {"type": "diagnosis_chunk", "chunk": diagnosis_buffer}
-                        
-                    except json.JSONDecodeError:
-                        # 还不够完整，继续累积
-                        pass
-                        
-            except Exception as e:
-                logger.warning(f"解析物种信息时出错: {e}")
-                
-        elif diagnosis_started:
-            # 流式输出 diagnosis 内容
-            # 直接输出新增的 delta
-            new_text = delta.content
-            
-            # 过滤掉 JSON 结构字符
-            if '"}' in new_text or '```' in new_text:
-                # 到达结尾，清理
-                new_text = new_text.replace('"}', '').replace('```', '').replace('"', '')
-            
-            # 额外清理仅包含 } 或 ] 的残留
-            if new_text.strip() in ['}', ']', '"}', '"]']:
-                new_text = ""
-            
-            # 清理末尾可能的残留
-            if new_text.endswith('"}'):
-                 new_text = new_text[:-2]
-            elif new_text.endswith('}'):
-                 new_text = new_text[:-1]
-
-            if new_text.strip():
-                yield {"type": "diagnosis_chunk", "chunk": new_text}
-    
-    # 如果没有成功流式解析，尝试解析完整响应
-    if not species_info_sent:
-        logger.warning("流式解析失败，尝试解析完整响应")
         try:
-            clean_content = full_content
-            if clean_content.startswith("```json"):
-                clean_content = clean_content.replace("```json", "").replace("```", "").strip()
-            elif clean_content.startswith("```"):
-                clean_content = clean_content.replace("```", "").strip()
-            
-            result = json.loads(clean_content)
-            object_name = result.get("object_name", "未知物种")
-            display_name = result.get("display_name") or object_name
-            preset_image = get_preset_image_url(object_name)
-            
-            yield {
-                "type": "species",
-                "object_name": object_name,
-                "display_name": display_name,
-                "keywords": result.get("keywords", ["神秘", "未知", "待鉴定"]),
-                "image_url": preset_image
-            }
-            
-            # 一次性发送完整诊断
-            diagnosis = result.get("diagnosis", "你的精神物种正在鉴定中...")
-            yield {"type": "diagnosis_chunk", "chunk": diagnosis}
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"完整响应解析失败: {e}")
-            logger.error(f"原始内容: {full_content}")
-            yield {"type": "error", "message": "诊断解析失败，请重试"}
+            async with aclosing(stream.contents()) as contents:
+                async for content in contents:
+                    for event in parser.feed(content):
+                        yield _attach_preset_image(event)
+        finally:
+            # 被取消（客户端断开）或提前关闭时立即断开上游连接，不再继续生成 token
+            await stream.close()
+    except Exception:
+        UPSTREAM_ERRORS.inc("openai")
+        raise
+    observe_stage("llm_total", time.perf_counter() - started)
+    
+    # 流结束：补发未发出的物种信息，或在完全无法解析时返回错误
+    for event in parser.close():
+        if event["type"] == "error":
+            logger.error(f"诊断解析失败，已解析字段: {parser.fields}")
+        yield _attach_preset_image(event)
+    
+    # 完整输出且解析成功的结果才写入缓存（调用方提前关闭生成器时不会执行到这里）
+    if parser.species_sent and remember:
+        _remember(symptom, parser.result())
+
+
+def replay_events(result: dict) -> List[dict]:
+    """把一条完整的诊断结果还原为流式事件"""
+    events = [_attach_preset_image({
+        "type": "species",
+        "object_name": result["object_name"],
+        "display_name": result["display_name"],
+        "keywords": result["keywords"],
+    })]
+    if result.get("diagnosis"):
+        events.append({"type": "diagnosis_chunk", "chunk": result["diagnosis"]})
+    return events
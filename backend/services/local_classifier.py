@@ -0,0 +1,367 @@
+"""本地物种分类器 - 不调用 LLM，把症状归到预置图库中的一个物种
+
+用作快速通道（LOCAL_CLASSIFIER_SHARE 比例的请求直接走本地）和 LLM 故障时的兜底：
+所有 LLM 后端都在熔断中、LLM 调用失败 / 无法解析、排队已满被拒绝时，改由本地给出诊断，不再返回错误。
+- 特征：规范化症状的哈希字符 n-gram 向量（1~3 字，L2 归一化）
+- 每个物种一行权重：物种名 + description 的 n-gram 向量，加上训练得到的"症状质心"（LLM 历史上为该物种选中的症状）
+- 关键词：data/species_keywords.json 中手写的种子词，加上训练时从 LLM 历史中挑出的区分度高的词；症状包含关键词时加分
+- 打分是一次矩阵-向量乘法加关键词加分，取最高分的物种（单次推理几十微秒）
+- 文案：固定模板 + 该物种在 LLM 历史中出现过的展示名与标签（没有训练数据时用物种名与命中的关键词）
+- 训练：DecisionLog 把每次完整的 LLM 诊断（症状、物种、展示名、标签）追加到 data/llm_decisions.jsonl，
+  scripts/train_classifier.py 读取后生成 data/local_classifier.npz；服务运行中模型文件变化时自动重新加载
+- 未安装 numpy 时不可用（照常调用 LLM）
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 本地开发：不做跨进程互斥
+    fcntl = None
+
+from .catalog import PresetCatalog, preset_catalog
+from .result_cache import normalize_symptom
+from .settings import settings
+from .similar_cache import NUMPY_AVAILABLE, ngram_vector
+from .sse import encode_json
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+MODEL_FILE = os.path.join(DATA_DIR, "local_classifier.npz")
+KEYWORDS_FILE = os.path.join(DATA_DIR, "species_keywords.json")
+DECISION_LOG_FILE = os.path.join(DATA_DIR, "llm_decisions.jsonl")
+
+NGRAMS = (1, 2, 3)
+DEFAULT_KEYWORDS = ["本所认证", "症状典型", "建议原地躺平"]
+
+# 兜底诊断文案模板：{name} 物种名、{display_name} 展示名、{keyword} 一个标签、{symptom} 症状摘录
+FALLBACK_TEMPLATES = [
+    "「{symptom}」——这不是你的问题，是宇宙把你调成了{name}模式。「{keyword}」是高阶生命体的标准配置，建议原地保持，别让世界看出破绽。",
+    "经本所显微镜下反复比对，你与{display_name}的相似度高达 99.9%。「{keyword}」并非缺陷，而是进化给你留的省电开关。",
+    "检测到典型的{name}体征：「{keyword}」。根据伪热力学第三定律，你此刻的状态恰好是能量最低、最稳定的解，不建议任何人类打扰。",
+    "「{symptom}」，翻译成物理学就是{display_name}正在自我保护。这是你与这个草台班子世界之间最后的体面，请继续保持。",
+    "鉴定完毕：{display_name}。你的「{keyword}」已经超越了个人情绪，属于不可抗力范畴，责任请一律推给水逆和周一。",
+]
+
+
+def _symptom_excerpt(symptom: str, limit: int = 16) -> str:
+    text = symptom.strip()
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def load_decisions(paths: Iterable[str]) -> List[Dict]:
+    """读取 LLM 决策日志（忽略损坏的行）"""
+    decisions = []
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if entry.get("symptom") and entry.get("object_name"):
+                        decisions.append(entry)
+        except FileNotFoundError:
+            continue
+    return decisions
+
+
+def train(decisions: List[Dict], names: List[str], dim: int = 2048, keywords_per_species: int = 12,
+          min_keyword_count: int = 3, min_precision: float = 0.6, labels_per_species: int = 10) -> Dict:
+    """
+    用 LLM 的历史选择训练模型，返回可传给 save_model() 的字典
+
+    - 每个物种的症状质心：该物种所有症状 n-gram 向量之和（L2 归一化）
+    - 关键词：2~4 字的片段，在该物种的症状中至少出现 min_keyword_count 次，且出现时属于该物种的比例不低于 min_precision
+    - 展示名与标签：该物种在 LLM 输出中最常见的几个
+    """
+    import numpy as np
+
+    rows = {name: i for i, name in enumerate(names)}
+    centroids = np.zeros((len(names), dim), dtype=np.float32)
+    counts = np.zeros(len(names), dtype=np.int64)
+    fragment_by_species: Dict[str, Counter] = {name: Counter() for name in names}
+    fragment_total: Counter = Counter()
+    display_names: Dict[str, Counter] = {name: Counter() for name in names}
+    label_keywords: Dict[str, Counter] = {name: Counter() for name in names}
+
+    for entry in decisions:
+        name = entry["object_name"]
+        row = rows.get(name)
+        if row is None:
+            continue
+        text = normalize_symptom(entry["symptom"])
+        centroids[row] += ngram_vector(text, dim, NGRAMS)
+        counts[row] += 1
+        fragments = {text[i:i + n] for n in (2, 3, 4) for i in range(len(text) - n + 1)}
+        fragment_by_species[name].update(fragments)
+        fragment_total.update(fragments)
+        if entry.get("display_name"):
+            display_names[name][entry["display_name"]] += 1
+        label_keywords[name].update(k for k in entry.get("keywords") or [] if isinstance(k, str))
+
+    norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+    centroids = np.divide(centroids, norms, out=np.zeros_like(centroids), where=norms > 0)
+
+    keywords, labels = {}, {}
+    for name in names:
+        picked = []
+        for fragment, count in fragment_by_species[name].most_common():
+            if count < min_keyword_count or len(picked) >= keywords_per_species:
+                break
+            if count / fragment_total[fragment] >= min_precision and not any(fragment in p for p in picked):
+                picked.append(fragment)
+        if picked:
+            keywords[name] = picked
+        if counts[rows[name]]:
+            labels[name] = {
+                "display_names": [n for n, _ in display_names[name].most_common(labels_per_species)],
+                "keywords": [k for k, _ in label_keywords[name].most_common(labels_per_species)],
+            }
+    return {
+        "names": names, "centroids": centroids, "counts": counts,
+        "meta": {"dim": dim, "keywords": keywords, "labels": labels, "samples": int(counts.sum()),
+                 "trained_at": int(time.time())},
+    }
+
+
+def save_model(model: Dict, path: str = MODEL_FILE):
+    """原子写入模型文件"""
+    import numpy as np
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}.npz"
+    np.savez(tmp_path, names=np.array(model["names"]), centroids=model["centroids"], counts=model["counts"],
+             meta=np.array(json.dumps(model["meta"], ensure_ascii=False)))
+    os.replace(tmp_path, path)
+
+
+class LocalClassifier:
+    """
+    症状 -> 预置物种的本地分类器
+
+    Args:
+        catalog: 预置物种目录（只在其中的物种里选）
+        model_path: 训练好的模型文件（不存在时只用物种名、描述与种子关键词）
+        keywords_path: 手写的种子关键词 {object_name: [关键词, ...]}
+        dim: 未训练时的哈希向量维度（有模型时以模型为准）
+        base_weight: 物种名 + 描述向量的权重
+        keyword_weight: 每命中一个关键词的加分
+        check_interval: 检查模型文件是否变化的最小间隔（秒）
+    """
+
+    def __init__(self, catalog: PresetCatalog = preset_catalog, model_path: str = MODEL_FILE,
+                 keywords_path: str = KEYWORDS_FILE, dim: int = 2048, base_weight: float = 0.5,
+                 keyword_weight: float = 0.35, check_interval: float = 10.0):
+        self.catalog = catalog
+        self.model_path = model_path
+        self.keywords_path = keywords_path
+        self.dim = dim
+        self.base_weight = base_weight
+        self.keyword_weight = keyword_weight
+        self.check_interval = check_interval
+
+        self._snapshot = None
+        self._model_version: Optional[tuple] = None
+        self._next_check = 0.0
+        self._names: List[str] = []
+        self._weights = None
+        # (关键词, 物种行号数组)
+        self._keywords: List[Tuple[str, "numpy.ndarray"]] = []
+        self._labels: Dict[str, Dict] = {}
+        self._seed_labels: Dict[str, List[str]] = {}
+        self.trained_samples = 0
+
+    def ready(self) -> bool:
+        return NUMPY_AVAILABLE and bool(self.catalog.names)
+
+    def classify(self, symptom: str) -> Tuple[str, List[str]]:
+        """返回 (物种名, 症状中命中的该物种关键词)"""
+        self._ensure()
+        text = normalize_symptom(symptom)
+        scores = self._weights @ ngram_vector(text, self.dim, NGRAMS)
+        matched = []
+        for keyword, rows in self._keywords:
+            if keyword in text:
+                scores[rows] += self.keyword_weight
+                matched.append((keyword, rows))
+        best = int(scores.argmax())
+        if scores[best] <= 0:
+            # 没有任何线索：随便挑一个，总比报错好
+            return random.choice(self._names), []
+        return self._names[best], [keyword for keyword, rows in matched if best in rows]
+
+    def diagnose(self, symptom: str) -> Dict:
+        """本地生成一份完整诊断 {object_name, display_name, keywords, diagnosis}"""
+        object_name, matched = self.classify(symptom)
+        labels = self._labels.get(object_name, {})
+        display_name = random.choice(labels.get("display_names") or [object_name])
+        # 单字的关键词（如"骂"）只用于打分，不当作标签；标签依次取命中的关键词、LLM 用过的标签、种子关键词
+        pool = [k for k in matched + (labels.get("keywords") or []) + self._seed_labels.get(object_name, [])
+                if len(k) > 1]
+        pool = list(dict.fromkeys(pool))
+        keywords = (pool[:1] + random.sample(pool[1:], 2)) if len(pool) >= 3 else (pool + DEFAULT_KEYWORDS)[:3]
+        diagnosis = random.choice(FALLBACK_TEMPLATES).format(
+            name=object_name, display_name=display_name, keyword=keywords[0], symptom=_symptom_excerpt(symptom))
+        return {"object_name": object_name, "display_name": display_name, "keywords": keywords, "diagnosis": diagnosis}
+
+    def _ensure(self):
+        """图库或模型文件变化时重建权重矩阵"""
+        snapshot = self.catalog.snapshot()
+        now = time.monotonic()
+        if snapshot is self._snapshot and now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        try:
+            stat = os.stat(self.model_path)
+            model_version = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            model_version = None
+        if snapshot is self._snapshot and model_version == self._model_version:
+            return
+        self._build(snapshot, model_version)
+
+    def _build(self, snapshot, model_version: Optional[tuple]):
+        import numpy as np
+
+        trained, meta = {}, {}
+        if model_version is not None:
+            try:
+                with np.load(self.model_path, allow_pickle=False) as data:
+                    meta = json.loads(str(data["meta"]))
+                    trained = {str(name): (row, int(count)) for name, row, count
+                               in zip(data["names"], data["centroids"], data["counts"])}
+            except Exception as e:
+                logger.warning(f"本地分类器模型加载失败，只使用种子关键词: {type(e).__name__}: {e}")
+                trained, meta = {}, {}
+        dim = int(meta.get("dim", self.dim))
+
+        seeds: Dict[str, List[str]] = {}
+        try:
+            with open(self.keywords_path, "r", encoding="utf-8") as f:
+                seeds = json.load(f)
+        except FileNotFoundError:
+            pass
+        except json.JSONDecodeError as e:
+            logger.warning(f"种子关键词文件损坏: {e}")
+
+        names = list(snapshot.names)
+        weights = np.zeros((len(names), dim), dtype=np.float32)
+        keyword_rows: Dict[str, List[int]] = {}
+        for row, name in enumerate(names):
+            description = snapshot.by_name[name].get("description", "")
+            weights[row] = self.base_weight * ngram_vector(normalize_symptom(name + description), dim, NGRAMS)
+            centroid, count = trained.get(name, (None, 0))
+            if count:
+                weights[row] += centroid
+            for keyword in seeds.get(name, []) + meta.get("keywords", {}).get(name, []):
+                keyword = normalize_symptom(keyword)
+                if keyword and row not in keyword_rows.setdefault(keyword, []):
+                    keyword_rows[keyword].append(row)
+
+        self.dim = dim
+        self._names = names
+        self._weights = weights
+        self._keywords = [(keyword, np.array(rows)) for keyword, rows in keyword_rows.items()]
+        self._labels = meta.get("labels", {})
+        self._seed_labels = {name: seeds.get(name, []) for name in names}
+        self.trained_samples = int(meta.get("samples", 0))
+        self._snapshot = snapshot
+        self._model_version = model_version
+        logger.info(f"本地分类器已构建: {len(names)} 个物种，{len(self._keywords)} 个关键词，"
+                    f"训练样本 {self.trained_samples} 条")
+
+
+class DecisionLog:
+    """
+    LLM 诊断决策日志（写回式批量追加到 JSONL），供 scripts/train_classifier.py 训练本地分类器
+
+    Args:
+        path: JSONL 文件路径（超过 max_bytes 时轮转为 <path>.1，只保留一份旧文件）
+        flush_interval: 后台追加间隔（秒）
+        max_bytes: 单个文件的大小上限
+    """
+
+    def __init__(self, path: str = DECISION_LOG_FILE, flush_interval: float = 5.0, max_bytes: int = 64 * 2 ** 20):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self._pending: List[bytes] = []
+        self._task: Optional[asyncio.Task] = None
+        self.recorded = 0
+
+    def record(self, symptom: str, result: Dict):
+        """记录一次完整的 LLM 诊断（只进内存）"""
+        self._pending.append(encode_json({
+            "symptom": symptom,
+            "object_name": result["object_name"],
+            "display_name": result.get("display_name"),
+            "keywords": result.get("keywords"),
+            "created_at": int(time.time()),
+        }) + b"\n")
+        self.recorded += 1
+
+    async def flush(self):
+        if not self._pending:
+            return
+        lines, self._pending = self._pending, []
+        try:
+            await asyncio.to_thread(self._append, b"".join(lines))
+        except Exception:
+            self._pending = lines + self._pending
+            raise
+
+    def _append(self, data: bytes):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = self._open_locked()
+        try:
+            if os.fstat(fd).st_size + len(data) > self.max_bytes:
+                # 轮转：其它 worker 此后打开的是新文件
+                os.replace(self.path, f"{self.path}.1")
+                os.close(fd)
+                fd = self._open_locked()
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+
+    def _open_locked(self) -> int:
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"LLM 决策日志写入失败: {e}")
+
+
+local_classifier = LocalClassifier()
+decision_log = DecisionLog(max_bytes=settings.decision_log_max_mb * 2 ** 20)
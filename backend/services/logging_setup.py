@@ -0,0 +1,151 @@
+"""日志配置 - 队列化输出、结构化记录、按请求采样与关联 ID
+
+- 所有日志先放进有界队列（QueueHandler 只做一次内存拷贝），由后台线程格式化并写到 stderr，
+  事件循环不会因为终端/管道/日志采集端写得慢而阻塞；队列满时丢弃并计数，不反压请求
+- LOG_FORMAT=json 时每条日志输出一行 JSON（time、level、logger、message、request_id、exc），默认仍是文本格式
+- 每个 HTTP 请求分配一个关联 ID（沿用请求头 X-Request-ID，否则随机生成），写入该请求产生的所有日志
+  （包括转入后台的任务）并通过响应头 X-Request-ID 返回
+- 完整的 LLM 结果、Seedream 响应等大段内容只在被采样的请求中输出（LOG_PAYLOAD_SAMPLE_RATE），
+  调用方先检查 payload_sampled()，未采样时连字符串都不拼接
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import secrets
+import sys
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from .settings import settings
+
+request_id: ContextVar[str] = ContextVar("request_id", default="-")
+_payload_sampled: ContextVar[bool] = ContextVar("payload_sampled", default=False)
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+
+def payload_sampled() -> bool:
+    """当前请求是否输出大段内容日志"""
+    return _payload_sampled.get()
+
+
+def start_request(incoming_id: Optional[str] = None) -> str:
+    """为当前上下文分配关联 ID 并决定是否采样，返回关联 ID"""
+    rid = (incoming_id or "")[:64] or secrets.token_hex(6)
+    request_id.set(rid)
+    _payload_sampled.set(random.random() < settings.log_payload_sample_rate)
+    return rid
+
+
+class RequestContextMiddleware:
+    """为每个 HTTP 请求设置关联 ID（纯 ASGI 中间件，不包装响应体）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        incoming = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                incoming = value.decode("latin-1")
+                break
+        rid = start_request(incoming).encode("latin-1")
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", rid)]
+            await send(message)
+
+        await self.app(scope, receive, send_with_id)
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _ContextQueueHandler(logging.handlers.QueueHandler):
+    """在调用方线程里只记下关联 ID、拼好 message；格式化与写出留给后台线程。队列满时丢弃"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = request_id.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # traceback 对象不能跨线程保留，这里先转成文本
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler: Optional[_ContextQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler is not None else 0
+
+
+def configure_logging(stream=None):
+    """
+    把根 logger 的输出改为经由队列的后台线程（重复调用无副作用）
+
+    uvicorn 自己的 logger 也改为传给根 logger，访问日志同样不在事件循环上写
+    """
+    global _handler, _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if settings.log_format == "json" else logging.Formatter(TEXT_FORMAT))
+    _handler = _ContextQueueHandler(queue.Queue(maxsize=settings.log_queue_size))
+    _listener = logging.handlers.QueueListener(_handler.queue, output)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(settings.log_level.upper())
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """写完队列中剩余的日志并停止后台线程"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,192 @@
+"""请求各阶段耗时统计 - Prometheus 文本格式的 /metrics 与 Server-Timing
+
+- Histogram / Counter 都是进程内的简单实现（不依赖 prometheus_client），
+  记录一次只是一次 bisect 加几次整数加法，对热路径的开销可以忽略
+- 每个请求可以开启一份 timings 字典（ContextVar），stage() 记录的耗时同时写入其中，
+  用于生成 Server-Timing 响应头；请求内创建的子任务会继承同一个字典
+- 多 worker 部署时每个进程各自统计，由 Prometheus 按实例聚合
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 秒；覆盖从缓存命中（毫秒级）到图片生成（十几秒）的范围
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0)
+
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def _format_labels(labelnames: Tuple[str, ...], labelvalues: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """单调递增计数器"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1.0):
+        self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def get(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labelvalues, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value:g}")
+        return lines
+
+
+class Gauge:
+    """可增可减的瞬时值"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labelvalues: str):
+        self._values[labelvalues] = value
+
+    def get(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for labelvalues, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """累积分桶直方图"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # labelvalues -> [各桶计数（最后一个为 +Inf）, 总和, 总数]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labelvalues, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _format_labels(self.labelnames, labelvalues, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {total:.6f}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "diagnosis_stage_seconds",
+    "Duration of each diagnosis stage (llm_ttft, llm_total, species, image_generate, image_upload, counter)",
+    ("stage",),
+)
+REQUEST_SECONDS = Histogram("diagnosis_request_seconds", "End-to-end diagnosis request duration", ("endpoint",))
+SPECIES_TOTAL = Counter(
+    "diagnosis_species_total",
+    "Species results by image source (preset hit, registry hit, nearest preset substitute, generated cold species)",
+    ("source",),
+)
+UPSTREAM_ERRORS = Counter("upstream_errors_total", "Failed upstream calls", ("upstream",))
+CANCELLED_TOTAL = Counter(
+    "diagnosis_cancelled_total",
+    "Upstream work cancelled after the client disconnected (llm stream, image generation)",
+    ("work",),
+)
+DISCONNECTS_TOTAL = Counter("client_disconnects_total", "Clients that disconnected before the diagnosis finished", ("endpoint",))
+
+ADMISSION_IN_FLIGHT = Gauge("admission_in_flight", "Upstream calls currently admitted", ("upstream",))
+ADMISSION_QUEUE = Gauge("admission_queue_depth", "Callers waiting for an upstream slot", ("upstream",))
+ADMISSION_SHED = Counter(
+    "admission_shed_total",
+    "Upstream calls rejected because the wait queue was full or the wait timed out",
+    ("upstream", "reason"),
+)
+LLM_ATTEMPTS = Counter(
+    "llm_backend_attempts_total",
+    "LLM requests per backend by outcome (won, lost to a hedge or failover, failed)",
+    ("backend", "outcome"),
+)
+LLM_HEDGES = Counter("llm_hedges_total", "Hedged LLM requests fired because the first token was late", ("backend",))
+LLM_CIRCUIT_OPEN = Gauge("llm_backend_circuit_open", "1 while the backend's circuit breaker is open", ("backend",))
+LOCAL_DIAGNOSES = Counter(
+    "local_diagnoses_total",
+    "Diagnoses produced by the local classifier instead of the LLM (share, outage, fallback)",
+    ("reason",),
+)
+
+_metrics = [STAGE_SECONDS, REQUEST_SECONDS, SPECIES_TOTAL, UPSTREAM_ERRORS, CANCELLED_TOTAL, DISCONNECTS_TOTAL,
+            ADMISSION_IN_FLIGHT, ADMISSION_QUEUE, ADMISSION_SHED, LLM_ATTEMPTS, LLM_HEDGES, LLM_CIRCUIT_OPEN,
+            LOCAL_DIAGNOSES]
+# 额外的指标来源（如缓存统计），渲染时调用，返回 {指标名: (类型, 说明, 值)}
+_collectors: List[Callable[[], Dict[str, Tuple[str, str, float]]]] = []
+
+
+def register_collector(collector: Callable[[], Dict[str, Tuple[str, str, float]]]):
+    _collectors.append(collector)
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    """记录 with 块的耗时（异常时同样记录）"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - started)
+
+
+def start_request_timing() -> Dict[str, float]:
+    """为当前请求开启 timings 记录（此后在当前上下文及子任务中的 stage() 都会写入）"""
+    timings: Dict[str, float] = {}
+    _timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        for name, (kind, documentation, value) in collector().items():
+            lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} {kind}", f"{name} {value:g}"])
+    return "\n".join(lines) + "\n"
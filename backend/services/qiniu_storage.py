@@ -1,48 +1,108 @@
-"""七牛云存储服务 - 异步抓取"""
-import os
-import time
-from qiniu import Auth, BucketManager
-from dotenv import load_dotenv
+"""七牛云存储服务 - 异步抓取
 
-load_dotenv()
+直接调用七牛管理接口 /fetch（QBox 签名），走共享的 httpx 连接池，不再阻塞事件循环：
+- 并发上限（QINIU_MAX_CONCURRENCY）与排队上限由 admission.storage_admission 控制，排队已满时抛出 Overloaded
+- 网络错误、5xx 与限流状态码按指数退避重试（QINIU_MAX_RETRIES）
+- 存储区域的 IO 域名通过 UC 接口查询并缓存，也可用 QINIU_IO_HOST 直接指定
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
 
-QINIU_ACCESS_KEY = os.getenv("QINIU_ACCESS_KEY", "")
-QINIU_SECRET_KEY = os.getenv("QINIU_SECRET_KEY", "")
-QINIU_BUCKET = os.getenv("QINIU_BUCKET", "species-images")
-QINIU_DOMAIN = os.getenv("QINIU_DOMAIN", "https://cdn.example.com")
+import httpx
+
+from .admission import storage_admission
+from .http_clients import clients
+from .metrics import UPSTREAM_ERRORS
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+# 478: 源站返回错误；573: 请求过于频繁；5xx/599: 七牛服务端错误
+RETRYABLE_STATUS = {478, 573}
+
+_io_host = settings.qiniu_io_host.rstrip("/")
+_io_host_lock = asyncio.Lock()
+
+
+def _urlsafe_b64(data: str | bytes) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+
+def _management_token(path: str) -> str:
+    """管理凭证：对 path?query + '\\n' 做 HMAC-SHA1（无请求体）"""
+    digest = hmac.new(settings.qiniu_secret_key.encode("utf-8"), f"{path}\n".encode("utf-8"), hashlib.sha1).digest()
+    return f"QBox {settings.qiniu_access_key}:{_urlsafe_b64(digest)}"
+
+
+async def _get_io_host() -> str:
+    """查询存储空间所在区域的 IO 域名（进程内缓存）"""
+    global _io_host
+    if _io_host:
+        return _io_host
+    async with _io_host_lock:
+        if _io_host:
+            return _io_host
+        response = await clients.http("qiniu").get(
+            f"{settings.qiniu_uc_host.rstrip('/')}/v4/query",
+            params={"ak": settings.qiniu_access_key, "bucket": settings.qiniu_bucket},
+        )
+        response.raise_for_status()
+        domains = response.json()["hosts"][0]["io"]["domains"]
+        host = domains[0]
+        _io_host = host if host.startswith("http") else f"https://{host}"
+        logger.info(f"七牛云 IO 域名: {_io_host}")
+        return _io_host
 
 
 async def save_to_qiniu(source_url: str, key: str) -> str:
     """
-    将远程图片抓取到七牛云 (使用官方 SDK)
-    
+    将远程图片抓取到七牛云
+
     Args:
         source_url: 源图片 URL
         key: 存储的 key
-    
+
     Returns:
         CDN 访问链接
     """
-    # 构建鉴权对象
-    q = Auth(QINIU_ACCESS_KEY, QINIU_SECRET_KEY)
-    
-    # 构建 BucketManager 对象
-    bucket = BucketManager(q)
-    
-    # 调用 fetch 方法 grab 远程资源
-    # 注意：SDK 的 fetch 方法是同步的，但在 async 函数中调用通常问题不大，
-    # 除非并发量极高需要完全非阻塞。
-    # fetch(url, bucket, key)
-    ret, info = bucket.fetch(source_url, QINIU_BUCKET, key)
-    
-    if info.status_code == 200:
-        return f"{QINIU_DOMAIN}/{key}"
-    else:
-        error_msg = f"Qiniu Fetch Failed: {info.text_body}"
-        print(f"❌ {error_msg}")
-        raise Exception(error_msg)
+    path = f"/fetch/{_urlsafe_b64(source_url)}/to/{_urlsafe_b64(f'{settings.qiniu_bucket}:{key}')}"
+
+    async with storage_admission.slot():
+        io_host = await _get_io_host()
+        client = clients.http("qiniu")
+        for attempt in range(settings.qiniu_max_retries + 1):
+            last_error = None
+            try:
+                response = await client.post(
+                    f"{io_host}{path}",
+                    headers={
+                        "Authorization": _management_token(path),
+                        "Content-Type": "application/x-www-form-urlencoded",
+                    },
+                )
+                if response.status_code == 200:
+                    return get_image_url(key)
+                last_error = f"Qiniu Fetch Failed: {response.status_code} {response.text}"
+                if response.status_code < 500 and response.status_code not in RETRYABLE_STATUS:
+                    break
+            except httpx.TransportError as e:
+                last_error = f"Qiniu Fetch Failed: {type(e).__name__}: {e}"
+
+            if attempt < settings.qiniu_max_retries:
+                delay = 0.5 * (2 ** attempt)
+                logger.warning(f"{last_error}，{delay:.1f}s 后重试 ({attempt + 1}/{settings.qiniu_max_retries})")
+                await asyncio.sleep(delay)
+
+    UPSTREAM_ERRORS.inc("qiniu")
+    logger.error(f"❌ {last_error}")
+    raise Exception(last_error)
 
 
 def get_image_url(key: str) -> str:
     """获取图片的 CDN 访问链接"""
-    return f"{QINIU_DOMAIN}/{key}"
+    return f"{settings.qiniu_domain}/{key}"
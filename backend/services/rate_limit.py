@@ -0,0 +1,41 @@
+"""令牌桶限速器 - 把对上游的调用速率限制在配额以内
+
+- 令牌按 rate（个/秒）匀速补充，最多累积 burst 个，允许短时突发
+- acquire() 在令牌不足时异步等待，不阻塞事件循环
+- 等待方按到达顺序依次获得令牌
+"""
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    异步令牌桶
+
+    Args:
+        rate: 每秒补充的令牌数，<= 0 表示不限速
+        burst: 桶容量（允许的最大突发数）
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0):
+        """取走 tokens 个令牌，不足时等待补充"""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
@@ -0,0 +1,260 @@
+"""诊断结果存档 - 按序号 O(1) 读取，用于分享链接
+
+每个诊断结果在拿到 sequence_no 后追加写入存档，GET /api/result/{sequence_no} 直接返回存档中的 JSON：
+- 存档按序号分段，第 k 段保存 [k*N, (k+1)*N) 的结果（N = segment_records），单段文件大小有限，
+  总量到千万级也只是多几个段文件
+- 每段两个文件：
+  - seg-<k>.log: 只追加的记录（16 字节头：长度、CRC32、序号 + JSON），读取时内存映射
+  - seg-<k>.idx: 定长索引，第 i 个槽位（12 字节：偏移 uint64、长度 uint32）对应序号 k*N+i，
+    创建时 ftruncate 到 N 个槽位（稀疏文件，只有写过的页占用磁盘），读取时内存映射，查询是一次定位
+- append() 只把记录放进内存（读取时先查这里），后台任务攒一小段时间后成组写入：
+  在线程中持有文件锁追加整批记录、fdatasync，再写索引并 msync；请求路径不等待 fsync。
+  多个 worker 进程写同一段时由文件锁互斥，索引通过共享映射对所有进程可见
+- 读取时校验记录头的序号与 CRC，崩溃留下的半截记录视为不存在
+"""
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 本地开发：不做跨进程互斥
+    fcntl = None
+
+from .settings import settings
+from .sse import encode_json
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "archive")
+
+_HEADER = struct.Struct("<IIQ")  # JSON 长度、CRC32、序号
+_ENTRY = struct.Struct("<QI")  # 记录偏移、记录总长度（含头）；长度为 0 表示空槽位
+
+
+class _Segment:
+    """一个存档段（日志文件 + 定长索引）"""
+
+    def __init__(self, directory: str, number: int, records: int, create: bool):
+        self.records = records
+        path = os.path.join(directory, f"seg-{number:06d}")
+        flags = os.O_RDWR | (os.O_CREAT if create else 0)
+        self._index_fd = os.open(f"{path}.idx", flags, 0o644)
+        try:
+            self._log_fd = os.open(f"{path}.log", flags | os.O_APPEND, 0o644)
+        except OSError:
+            os.close(self._index_fd)
+            raise
+        index_size = records * _ENTRY.size
+        if os.fstat(self._index_fd).st_size < index_size:
+            os.ftruncate(self._index_fd, index_size)
+        self.index = mmap.mmap(self._index_fd, index_size)
+        self._log: Optional[mmap.mmap] = None
+        self._mapped = 0
+
+    def read(self, slot: int, sequence_no: int) -> Optional[bytes]:
+        offset, length = _ENTRY.unpack_from(self.index, slot * _ENTRY.size)
+        if not length:
+            return None
+        end = offset + length
+        if end > self._mapped:
+            # 日志文件在增长（本进程或其它 worker 追加了记录），按当前大小重新映射
+            size = os.fstat(self._log_fd).st_size
+            if end > size:
+                return None
+            if self._log is not None:
+                self._log.close()
+            self._log = mmap.mmap(self._log_fd, size, access=mmap.ACCESS_READ)
+            self._mapped = size
+        size, crc, stored_no = _HEADER.unpack_from(self._log, offset)
+        payload = self._log[offset + _HEADER.size:end]
+        if stored_no != sequence_no or size != len(payload) or zlib.crc32(payload) != crc:
+            return None
+        return payload
+
+    def write(self, batch: List[Tuple[int, int, bytes]]):
+        """追加一批 (槽位, 序号, JSON) 并写入索引（在线程中调用）"""
+        if fcntl is not None:
+            fcntl.flock(self._log_fd, fcntl.LOCK_EX)
+        try:
+            offset = os.fstat(self._log_fd).st_size
+            buffer = bytearray()
+            entries = []
+            for slot, sequence_no, payload in batch:
+                entries.append((slot, offset + len(buffer), _HEADER.size + len(payload)))
+                buffer += _HEADER.pack(len(payload), zlib.crc32(payload), sequence_no)
+                buffer += payload
+            view = memoryview(buffer)
+            while view:
+                view = view[os.write(self._log_fd, view):]
+            # 先让记录落盘，再写指向它们的索引
+            os.fdatasync(self._log_fd)
+            for slot, record_offset, length in entries:
+                _ENTRY.pack_into(self.index, slot * _ENTRY.size, record_offset, length)
+            self.index.flush()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._log_fd, fcntl.LOCK_UN)
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+        self.index.close()
+        os.close(self._log_fd)
+        os.close(self._index_fd)
+
+
+class ResultArchive:
+    """
+    诊断结果存档
+
+    Args:
+        directory: 存档目录
+        segment_records: 每段容纳的序号数
+        commit_interval: 成组提交的等待时间（秒）
+        max_open_segments: 同时保持打开（映射）的段数
+    """
+
+    def __init__(self, directory: str = ARCHIVE_DIR, segment_records: int = 1_000_000,
+                 commit_interval: float = 0.05, max_open_segments: int = 8):
+        self.directory = directory
+        self.segment_records = segment_records
+        self.commit_interval = commit_interval
+        self.max_open_segments = max_open_segments
+        # 读、写各自打开段文件：读只发生在事件循环线程，写只发生在提交线程，互不关闭对方正在用的段
+        self._readers: "OrderedDict[int, _Segment]" = OrderedDict()
+        self._writers: "OrderedDict[int, _Segment]" = OrderedDict()
+        self._write_lock = threading.Lock()
+        # 尚未提交的记录，以及正在提交的一批（两者都可被读取）
+        self._pending: Dict[int, bytes] = {}
+        self._committing: Dict[int, bytes] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.appended = 0
+        self.committed = 0
+        self.commits = 0
+        self.failed = 0
+
+    def append(self, sequence_no: int, record: dict):
+        """加入一条结果（只进内存，由后台任务成组落盘）"""
+        payload = encode_json({**record, "sequence_no": sequence_no})
+        self._pending[sequence_no] = payload
+        self.appended += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+        elif self._task is None:
+            # 没有启动后台任务（脚本、基准测试）：直接同步写入
+            try:
+                self._commit(self._take())
+            finally:
+                self._committing = {}
+
+    def get(self, sequence_no: int) -> Optional[bytes]:
+        """按序号读取结果 JSON（bytes），不存在时返回 None"""
+        payload = self._pending.get(sequence_no) or self._committing.get(sequence_no)
+        if payload is not None:
+            return payload
+        number, slot = divmod(sequence_no, self.segment_records)
+        segment = self._segment(self._readers, number, create=False)
+        return segment.read(slot, sequence_no) if segment is not None else None
+
+    def _segment(self, cache: "OrderedDict[int, _Segment]", number: int, create: bool) -> Optional[_Segment]:
+        segment = cache.get(number)
+        if segment is not None:
+            cache.move_to_end(number)
+            return segment
+        if create:
+            os.makedirs(self.directory, exist_ok=True)
+        try:
+            segment = _Segment(self.directory, number, self.segment_records, create)
+        except FileNotFoundError:
+            return None
+        cache[number] = segment
+        while len(cache) > self.max_open_segments:
+            _, evicted = cache.popitem(last=False)
+            evicted.close()
+        return segment
+
+    def _take(self) -> Dict[int, bytes]:
+        batch, self._pending = self._pending, {}
+        self._committing = batch
+        return batch
+
+    def _commit(self, batch: Dict[int, bytes]):
+        """把一批记录按段写入（在线程中调用）"""
+        by_segment: Dict[int, List[Tuple[int, int, bytes]]] = {}
+        for sequence_no, payload in sorted(batch.items()):
+            number, slot = divmod(sequence_no, self.segment_records)
+            by_segment.setdefault(number, []).append((slot, sequence_no, payload))
+        with self._write_lock:
+            for number, entries in by_segment.items():
+                self._segment(self._writers, number, create=True).write(entries)
+            self.committed += len(batch)
+            self.commits += 1
+
+    async def flush(self):
+        """提交所有待写入的记录"""
+        if not self._pending:
+            return
+        batch = self._take()
+        try:
+            await asyncio.to_thread(self._commit, batch)
+        except Exception:
+            # 写入失败时放回去，下一轮重试
+            self._pending = {**batch, **self._pending}
+            raise
+        finally:
+            self._committing = {}
+
+    async def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+        await self.flush()
+        with self._write_lock:
+            for cache in (self._readers, self._writers):
+                for segment in cache.values():
+                    segment.close()
+                cache.clear()
+
+    async def _loop(self):
+        while True:
+            await self._wakeup.wait()
+            # 等一小段时间，让同一时段的结果合并成一次 fsync
+            await asyncio.sleep(self.commit_interval)
+            self._wakeup.clear()
+            started = time.perf_counter()
+            try:
+                await self.flush()
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"诊断结果存档写入失败: {type(e).__name__}: {e}")
+                await asyncio.sleep(1.0)
+                self._wakeup.set()
+                continue
+            elapsed = time.perf_counter() - started
+            if elapsed > 1.0:
+                logger.warning(f"诊断结果存档写入耗时 {elapsed:.2f}s")
+
+
+result_archive = ResultArchive(
+    segment_records=settings.archive_segment_records,
+    commit_interval=settings.archive_commit_interval,
+)
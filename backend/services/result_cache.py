@@ -0,0 +1,153 @@
+"""诊断结果缓存 - 重复症状直接复用已有诊断
+
+以规范化后的症状文本为键，每个键保存若干条不同的诊断结果（variant）：
+- 某个键攒满 variants 条结果之前，请求仍然调用 LLM，并把新结果追加进去
+- 攒满之后随机返回其中一条，保证同一句话的结果仍然有随机性
+- 每条结果有独立的 TTL；键按 LRU 淘汰，同时限制键数量与估算的总字节数
+"""
+import json
+import logging
+import random
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+# 规范化时从首尾去掉的标点（用户常在同一句话后加不同的语气符号）
+_TRIM_CHARS = " .,!?~。，！？～…、；;:：\"'“”‘’"
+
+
+def normalize_symptom(symptom: str) -> str:
+    """规范化症状文本：全半角统一、小写、去掉空白与首尾标点"""
+    text = unicodedata.normalize("NFKC", symptom).lower()
+    return "".join(text.split()).strip(_TRIM_CHARS)
+
+
+def _estimate_size(key: str, result: Dict) -> int:
+    return len(key.encode("utf-8")) + len(json.dumps(result, ensure_ascii=False).encode("utf-8"))
+
+
+class DiagnosisCache:
+    """
+    LRU + TTL 的诊断结果缓存（进程内）
+
+    Args:
+        max_entries: 最多缓存的症状键数量
+        max_bytes: 缓存内容的估算总字节数上限
+        ttl: 每条结果的有效期（秒），<= 0 表示关闭缓存
+        variants: 每个键保存的结果条数
+    """
+
+    def __init__(self, max_entries: int = 2000, max_bytes: int = 16 * 1024 * 1024,
+                 ttl: float = 3600.0, variants: int = 3):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.variants = max(1, variants)
+
+        # key -> [(expires_at, result, size), ...]
+        self._entries: "OrderedDict[str, List[Tuple[float, Dict, int]]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, symptom: str) -> Optional[Dict]:
+        """命中时返回一条缓存结果的副本；结果条数未攒满时视为未命中"""
+        if not self.enabled:
+            return None
+        key = normalize_symptom(symptom)
+        variants = self._live_variants(key)
+        if variants is None or len(variants) < self.variants:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        _, result, _ = random.choice(variants)
+        return dict(result, keywords=list(result["keywords"]))
+
+    def __contains__(self, symptom: str) -> bool:
+        """get() 是否会命中（不计入命中率）"""
+        if not self.enabled:
+            return False
+        variants = self._live_variants(normalize_symptom(symptom))
+        return variants is not None and len(variants) >= self.variants
+
+    def put(self, symptom: str, result: Dict):
+        """记录一条新的诊断结果（只保存物种信息与诊断文案）"""
+        if not self.enabled:
+            return
+        key = normalize_symptom(symptom)
+        result = {
+            "object_name": result["object_name"],
+            "display_name": result.get("display_name") or result["object_name"],
+            "keywords": list(result.get("keywords") or []),
+            "diagnosis": result.get("diagnosis") or "",
+        }
+        size = _estimate_size(key, result)
+        if size > self.max_bytes:
+            return
+
+        variants = self._live_variants(key)
+        if variants is None:
+            variants = self._entries[key] = []
+        variants.append((time.monotonic() + self.ttl, result, size))
+        self._bytes += size
+        # 并发填充时可能超出 variants 条，丢弃最旧的
+        while len(variants) > self.variants:
+            self._bytes -= variants.pop(0)[2]
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _live_variants(self, key: str) -> Optional[List[Tuple[float, Dict, int]]]:
+        """返回键下未过期的结果，顺带清理过期项"""
+        variants = self._entries.get(key)
+        if variants is None:
+            return None
+        now = time.monotonic()
+        live = [v for v in variants if v[0] > now]
+        if len(live) == len(variants):
+            return variants
+        self._bytes -= sum(v[2] for v in variants if v[0] <= now)
+        if not live:
+            del self._entries[key]
+            return None
+        self._entries[key] = live
+        return live
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, variants = self._entries.popitem(last=False)
+            self._bytes -= sum(v[2] for v in variants)
+            self.evictions += 1
+
+
+diagnosis_cache = DiagnosisCache(
+    max_entries=settings.diagnosis_cache_max_entries,
+    max_bytes=settings.diagnosis_cache_max_bytes,
+    ttl=settings.diagnosis_cache_ttl,
+    variants=settings.diagnosis_cache_variants,
+)
@@ -0,0 +1,209 @@
+"""应用配置 - 进程内只读取一次 .env 与环境变量
+
+所有模块都从 settings 单例读取配置，不再各自调用 load_dotenv() / os.getenv()。
+环境变量名与含义见 .env.example；测试或压测脚本需要覆盖配置时，在导入 services 之前设置环境变量即可
+（load_dotenv 不会覆盖已设置的变量）。
+"""
+import json
+import os
+from typing import Dict, List
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _str(name: str, default: str = "") -> str:
+    return os.getenv(name) or default
+
+
+def _int(name: str, default: int) -> int:
+    return int(os.getenv(name) or default)
+
+
+def _float(name: str, default: float) -> float:
+    return float(os.getenv(name) or default)
+
+
+def _bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if not value:
+        return default
+    return value.lower() in ("1", "true", "yes")
+
+
+def _llm_backends(default_url: str, default_model: str, default_key: str,
+                  default_fast_model: str = "") -> List[Dict[str, str]]:
+    """
+    LLM_BACKENDS: 按优先级排列的 OpenAI 兼容后端（JSON 列表），例如
+    [{"name": "a", "base_url": "https://...", "model": "...", "fast_model": "...", "api_key_env": "A_API_KEY"}, ...]
+    model / api_key 省略时使用 OPENAI_MODEL_NAME / OPENAI_API_KEY；未设置时只有 OPENAI_BASE_URL 一个后端。
+    fast_model（拆分模式下物种归类用的快速模型）省略时使用 LLM_FAST_MODEL，再省略则与 model 相同
+    """
+    raw = os.getenv("LLM_BACKENDS")
+    entries = json.loads(raw) if raw else [{"name": "primary", "base_url": default_url}]
+    return [{
+        "name": entry.get("name") or f"backend{i}",
+        "base_url": entry["base_url"],
+        "model": entry.get("model") or default_model,
+        "fast_model": entry.get("fast_model") or default_fast_model or entry.get("model") or default_model,
+        "api_key": entry.get("api_key") or os.getenv(entry.get("api_key_env") or "") or default_key,
+    } for i, entry in enumerate(entries)]
+
+
+def _upstream_http(name: str, timeout: float, max_connections: int, max_keepalive: int,
+                   connect_timeout: float = 5.0, keepalive_expiry: float = 60.0, http2: bool = False,
+                   warmup_connections: int = 2) -> Dict:
+    """单个上游的连接池与超时配置，均可通过 <NAME>_HTTP_<KEY> 覆盖（如 OPENAI_HTTP_MAX_CONNECTIONS）"""
+    prefix = f"{name.upper()}_HTTP_"
+    return {
+        "timeout": _float(prefix + "TIMEOUT", timeout),
+        "connect_timeout": _float(prefix + "CONNECT_TIMEOUT", connect_timeout),
+        "max_connections": _int(prefix + "MAX_CONNECTIONS", max_connections),
+        "max_keepalive": _int(prefix + "MAX_KEEPALIVE", max_keepalive),
+        "keepalive_expiry": _float(prefix + "KEEPALIVE_EXPIRY", keepalive_expiry),
+        "http2": _bool(prefix + "HTTP2", http2),
+        "warmup_connections": _int(prefix + "WARMUP_CONNECTIONS", warmup_connections),
+    }
+
+
+class Settings:
+    """应用配置（创建时读取环境变量）"""
+
+    def __init__(self):
+        # OpenAI 兼容接口
+        self.openai_base_url = _str("OPENAI_BASE_URL", "https://api.openai.com/v1")
+        self.openai_api_key = _str("OPENAI_API_KEY")
+        self.openai_model_name = _str("OPENAI_MODEL_NAME", "gpt-4o-mini")
+        self.llm_fast_model = _str("LLM_FAST_MODEL")
+        self.llm_backends = _llm_backends(self.openai_base_url, self.openai_model_name, self.openai_api_key,
+                                          self.llm_fast_model)
+        # 拆分模式：先用快速模型做一次短的物种归类（CLASSIFY_MAX_TOKENS、CLASSIFY_TIMEOUT 秒内），拿到物种后
+        # 立即发出 species 事件，同时按该物种流式生成诊断文案；归类失败或超时时退回单次调用
+        self.llm_split_mode = _bool("LLM_SPLIT_MODE", False)
+        self.llm_classify_max_tokens = _int("LLM_CLASSIFY_MAX_TOKENS", 150)
+        self.llm_classify_timeout = _float("LLM_CLASSIFY_TIMEOUT", 3)
+        # 多后端：首个 token 超过近期 p95（HEDGE_QUANTILE）仍未到达时向下一个后端发起对冲请求；
+        # 连续失败 BREAKER_FAILURES 次的后端熔断 BREAKER_COOLDOWN 秒
+        self.llm_hedge_enabled = _bool("LLM_HEDGE_ENABLED", True)
+        self.llm_hedge_quantile = _float("LLM_HEDGE_QUANTILE", 0.95)
+        self.llm_hedge_default_delay = _float("LLM_HEDGE_DEFAULT_DELAY", 2.0)
+        self.llm_hedge_min_delay = _float("LLM_HEDGE_MIN_DELAY", 0.3)
+        self.llm_breaker_failures = _int("LLM_BREAKER_FAILURES", 3)
+        self.llm_breaker_cooldown = _float("LLM_BREAKER_COOLDOWN", 30)
+
+        # 火山引擎 Seedream
+        self.ark_api_key = _str("ARK_API_KEY")
+        self.ark_api_url = _str("ARK_API_URL", "https://ark.cn-beijing.volces.com/api/v3/images/generations")
+
+        # 七牛云
+        self.qiniu_access_key = _str("QINIU_ACCESS_KEY")
+        self.qiniu_secret_key = _str("QINIU_SECRET_KEY")
+        self.qiniu_bucket = _str("QINIU_BUCKET", "species-images")
+        self.qiniu_domain = _str("QINIU_DOMAIN", "https://cdn.example.com")
+        self.qiniu_uc_host = _str("QINIU_UC_HOST", "https://uc.qbox.me")
+        self.qiniu_io_host = _str("QINIU_IO_HOST")
+        self.qiniu_max_concurrency = _int("QINIU_MAX_CONCURRENCY", 8)
+        self.qiniu_max_retries = _int("QINIU_MAX_RETRIES", 3)
+
+        # 诊断序号计数器
+        self.counter_block_size = _int("COUNTER_BLOCK_SIZE", 1)
+        self.counter_flush_interval = _float("COUNTER_FLUSH_INTERVAL", 1.0)
+
+        # 日志：text / json；大段内容（LLM 结果、Seedream 响应）只在按比例采样的请求中输出
+        self.log_level = _str("LOG_LEVEL", "INFO")
+        self.log_format = _str("LOG_FORMAT", "text")
+        self.log_payload_sample_rate = _float("LOG_PAYLOAD_SAMPLE_RATE", 0.01)
+        self.log_queue_size = _int("LOG_QUEUE_SIZE", 10000)
+
+        # 诊断结果存档（分享链接）：每段 SEGMENT_RECORDS 个序号，攒 COMMIT_INTERVAL 秒成组落盘
+        self.archive_enabled = _bool("ARCHIVE_ENABLED", True)
+        self.archive_segment_records = _int("ARCHIVE_SEGMENT_RECORDS", 1_000_000)
+        self.archive_commit_interval = _float("ARCHIVE_COMMIT_INTERVAL", 0.05)
+        self.archive_max_age = _int("ARCHIVE_MAX_AGE", 86400)
+
+        # 上游连接：启动时是否预热；各上游的连接池与超时
+        self.upstream_warmup = _bool("UPSTREAM_WARMUP", True)
+        self.upstream_http = {
+            "openai": _upstream_http("openai", timeout=120.0, max_connections=100, max_keepalive=50),
+            "ark": _upstream_http("ark", timeout=60.0, max_connections=20, max_keepalive=10),
+            # 图库原图（CDN），只在后台生成剪影图集时使用，不预热
+            "cdn": _upstream_http("cdn", timeout=30.0, max_connections=10, max_keepalive=4, warmup_connections=0),
+            # 七牛的远程抓取由服务端完成，单次请求可能持续数秒
+            "qiniu": _upstream_http("qiniu", timeout=30.0, max_connections=20, max_keepalive=10),
+        }
+
+        # 诊断结果缓存
+        self.diagnosis_cache_max_entries = _int("DIAGNOSIS_CACHE_MAX_ENTRIES", 2000)
+        self.diagnosis_cache_max_bytes = _int("DIAGNOSIS_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+        self.diagnosis_cache_ttl = _float("DIAGNOSIS_CACHE_TTL", 3600)
+        self.diagnosis_cache_variants = _int("DIAGNOSIS_CACHE_VARIANTS", 3)
+
+        # 近似症状缓存
+        self.similar_cache_capacity = _int("SIMILAR_CACHE_CAPACITY", 10000)
+        self.similar_cache_dim = _int("SIMILAR_CACHE_DIM", 512)
+        self.similar_cache_threshold = _float("SIMILAR_CACHE_THRESHOLD", 0.88)
+        self.similar_cache_min_length = _int("SIMILAR_CACHE_MIN_LENGTH", 8)
+        self.similar_cache_ttl = _float("SIMILAR_CACHE_TTL", 3600)
+
+        # 候选物种短名单
+        self.species_shortlist_size = _int("SPECIES_SHORTLIST_SIZE", 12)
+        self.species_shortlist_explore = _int("SPECIES_SHORTLIST_EXPLORE", 3)
+
+        # HTTP 接口
+        self.preset_species_max_age = _int("PRESET_SPECIES_MAX_AGE", 300)
+        self.sse_coalesce_interval = _float("SSE_COALESCE_INTERVAL", 0.05)
+        self.sse_coalesce_bytes = _int("SSE_COALESCE_BYTES", 256)
+        self.sse_heartbeat_interval = _float("SSE_HEARTBEAT_INTERVAL", 15)
+
+        # 首页剪影图集：每个物种一个 TILE_SIZE 见方的格子，与白色背景差异超过 THRESHOLD 的像素为剪影
+        # 默认关闭：每个 worker 各自下载全部预置图片并生成一份图集
+        self.silhouette_atlas_enabled = _bool("SILHOUETTE_ATLAS_ENABLED", False)
+        self.silhouette_tile_size = _int("SILHOUETTE_TILE_SIZE", 128)
+        self.silhouette_threshold = _int("SILHOUETTE_THRESHOLD", 40)
+        self.silhouette_refresh_interval = _float("SILHOUETTE_REFRESH_INTERVAL", 30)
+        self.silhouette_download_concurrency = _int("SILHOUETTE_DOWNLOAD_CONCURRENCY", 4)
+        self.silhouette_atlas_max_age = _int("SILHOUETTE_ATLAS_MAX_AGE", 31536000)
+
+        # 准入控制：各上游的并发上限、排队上限与排队超时（存储的并发上限即 QINIU_MAX_CONCURRENCY）
+        self.llm_max_concurrency = _int("LLM_MAX_CONCURRENCY", 64)
+        self.llm_max_queue = _int("LLM_MAX_QUEUE", 64)
+        self.llm_queue_timeout = _float("LLM_QUEUE_TIMEOUT", 5)
+        self.image_max_concurrency = _int("IMAGE_MAX_CONCURRENCY", 8)
+        self.image_max_queue = _int("IMAGE_MAX_QUEUE", 16)
+        self.image_queue_timeout = _float("IMAGE_QUEUE_TIMEOUT", 10)
+        self.storage_max_queue = _int("STORAGE_MAX_QUEUE", 32)
+        self.storage_queue_timeout = _float("STORAGE_QUEUE_TIMEOUT", 30)
+        self.admission_retry_after = _int("ADMISSION_RETRY_AFTER", 5)
+
+        # 客户端断开后的后台任务
+        self.background_max_pending = _int("BACKGROUND_MAX_PENDING", 16)
+        self.background_drain_timeout = _float("BACKGROUND_DRAIN_TIMEOUT", 10)
+
+        # 未命中预置图库的物种：generate 在请求中生成新图，nearest 返回最相近的预置物种图片（新图留给空闲时生成）
+        self.species_image_on_miss = _str("SPECIES_IMAGE_ON_MISS", "generate")
+        self.miss_store_max_entries = _int("MISS_STORE_MAX_ENTRIES", 5000)
+        self.miss_store_flush_interval = _float("MISS_STORE_FLUSH_INTERVAL", 5)
+        # 空闲时扩充图库（调用付费的图片生成接口，默认关闭）
+        self.gallery_expansion_enabled = _bool("GALLERY_EXPANSION_ENABLED", False)
+        self.gallery_expansion_interval = _float("GALLERY_EXPANSION_INTERVAL", 60)
+        self.gallery_expansion_idle = _float("GALLERY_EXPANSION_IDLE", 30)
+        self.gallery_expansion_top_n = _int("GALLERY_EXPANSION_TOP_N", 5)
+        self.gallery_expansion_min_misses = _int("GALLERY_EXPANSION_MIN_MISSES", 3)
+        self.gallery_expansion_per_hour = _float("GALLERY_EXPANSION_PER_HOUR", 30)
+        # 骰子文案的预生成诊断结果池（每条文案 DICE_POOL_SIZE 份，每分钟最多补充 DICE_POOL_REFILL_PER_MINUTE 份）
+        # 默认关闭：每个 worker 各自预生成一份，LLM / 图片费用乘以 worker 数
+        self.dice_pool_enabled = _bool("DICE_POOL_ENABLED", False)
+        self.dice_pool_size = _int("DICE_POOL_SIZE", 3)
+        self.dice_pool_refill_per_minute = _float("DICE_POOL_REFILL_PER_MINUTE", 6)
+        # 本地物种分类器（不调用 LLM）：LOCAL_CLASSIFIER_SHARE 比例的请求直接走本地；
+        # LOCAL_CLASSIFIER_FALLBACK 开启时 LLM 全部熔断、调用失败或排队已满的请求改由本地诊断（默认关闭：过载时照常返回 503）
+        self.local_classifier_enabled = _bool("LOCAL_CLASSIFIER_ENABLED", True)
+        self.local_classifier_share = _float("LOCAL_CLASSIFIER_SHARE", 0)
+        self.local_classifier_fallback = _bool("LOCAL_CLASSIFIER_FALLBACK", False)
+        # LLM 诊断决策日志（本地分类器的训练数据，包含用户输入的症状原文，默认关闭）
+        self.decision_log_enabled = _bool("DECISION_LOG_ENABLED", False)
+        self.decision_log_max_mb = _int("DECISION_LOG_MAX_MB", 64)
+
+
+settings = Settings()
@@ -0,0 +1,314 @@
+"""首页剪影图集 - 把预置物种图片预先处理为黑色剪影，拼成一张雪碧图
+
+首页轮播只展示物种的黑色剪影（PRD 3.1），不需要浏览器逐张下载原图：
+- 原图下载到 data/silhouettes/sources/ 缓存，每个图片链接只下载一次
+- 剪影用 NumPy 向量化计算：与白色背景的差异超过阈值的像素为前景，
+  再从图片边缘向内传播背景，被轮廓包围的空白（涂鸦内部）一并填黑；
+  裁掉空白边后等比缩放居中到 tile_size 见方的格子（缩放时得到抗锯齿的边缘）
+- 每个物种的剪影格子缓存为 data/silhouettes/tiles/<键>.png，图库变化时只处理新增/更换的图片，
+  再把所有格子拼成一张图集（黑色 + 透明度的 PNG）
+- 图集文件名带内容哈希，可以永久缓存；偏移表（物种 -> 格子坐标）指向当前图集
+- 未安装 numpy 或 Pillow 时不生成图集，前端继续使用原图
+"""
+import asyncio
+import hashlib
+import importlib.util
+import io
+import json
+import logging
+import math
+import os
+import re
+from typing import Dict, List, Optional
+
+from .catalog import PresetCatalog, preset_catalog
+from .http_clients import clients
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+ATLAS_AVAILABLE = all(importlib.util.find_spec(name) is not None for name in ("numpy", "PIL"))
+
+SILHOUETTE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "silhouettes")
+ATLAS_NAME = re.compile(r"^atlas-[0-9a-f]{16}\.png$")
+# 磁盘上保留的历史图集数（拿着旧偏移表的客户端仍能取到对应的图集）
+KEEP_ATLASES = 3
+
+
+def _source_url(image_url: str) -> str:
+    """图库中的链接可能没有协议（七牛测试域名只支持 http）"""
+    return image_url if "://" in image_url else f"http://{image_url}"
+
+
+def silhouette_tile(data: bytes, tile_size: int, threshold: int):
+    """
+    把一张图片处理为 tile_size x tile_size 的剪影透明度（uint8，255 为不透明）
+
+    Args:
+        data: 原图文件内容
+        tile_size: 格子边长（像素）
+        threshold: 与白色背景的差异超过多少（0~255）算作前景
+    """
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        # 在 2 倍格子尺寸上计算，既足够精细又不必处理原图的全部像素（先缩小再转换颜色模式）
+        image.draft("RGB", (tile_size * 2, tile_size * 2))
+        image.thumbnail((tile_size * 2, tile_size * 2), Image.Resampling.BOX)
+        pixels = np.asarray(image.convert("RGBA"))
+
+    ink = 255 - pixels[..., :3].min(axis=2)
+    foreground = (ink > threshold) & (pixels[..., 3] >= 128)
+
+    # 从边缘向内传播背景：与边缘连通的非前景像素才是背景，其余（轮廓内部）填为前景
+    background = ~foreground
+    outside = np.zeros_like(background)
+    outside[0, :], outside[-1, :], outside[:, 0], outside[:, -1] = (
+        background[0, :], background[-1, :], background[:, 0], background[:, -1])
+    while True:
+        grown = outside.copy()
+        grown[1:, :] |= outside[:-1, :]
+        grown[:-1, :] |= outside[1:, :]
+        grown[:, 1:] |= outside[:, :-1]
+        grown[:, :-1] |= outside[:, 1:]
+        grown &= background
+        if np.array_equal(grown, outside):
+            break
+        outside = grown
+    mask = ~outside
+
+    tile = np.zeros((tile_size, tile_size), dtype=np.uint8)
+    rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+    if not len(rows):
+        return tile
+    mask = mask[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    height, width = mask.shape
+    scale = tile_size / max(height, width)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    scaled = np.asarray(Image.fromarray(mask.astype(np.uint8) * 255).resize(size, Image.Resampling.LANCZOS))
+    top, left = (tile_size - size[1]) // 2, (tile_size - size[0]) // 2
+    tile[top:top + size[1], left:left + size[0]] = scaled
+    return tile
+
+
+def pack_atlas(tiles: List, tile_size: int) -> tuple:
+    """把格子按行排列成一张图集，返回 (PNG bytes, 列数, 宽, 高)"""
+    import numpy as np
+    from PIL import Image
+
+    columns = max(1, math.ceil(math.sqrt(len(tiles))))
+    rows = max(1, math.ceil(len(tiles) / columns))
+    alpha = np.zeros((rows * tile_size, columns * tile_size), dtype=np.uint8)
+    for i, tile in enumerate(tiles):
+        y, x = divmod(i, columns)
+        alpha[y * tile_size:(y + 1) * tile_size, x * tile_size:(x + 1) * tile_size] = tile
+    # 灰度恒为 0（黑色），剪影形状全部在透明度通道里
+    pixels = np.stack([np.zeros_like(alpha), alpha], axis=2)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, "LA").save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue(), columns, alpha.shape[1], alpha.shape[0]
+
+
+class SilhouetteAtlas:
+    """
+    预置图库的剪影图集（图库变化时增量重建）
+
+    Args:
+        catalog: 预置图库
+        directory: 原图、剪影格子与图集的存放目录
+        tile_size: 每个剪影格子的边长（像素）
+        threshold: 与白色背景的差异阈值（0~255）
+        interval: 检查图库是否变化的间隔（秒）
+        download_concurrency: 同时下载的原图数
+    """
+
+    def __init__(self, catalog: PresetCatalog = preset_catalog, directory: str = SILHOUETTE_DIR,
+                 tile_size: int = 128, threshold: int = 40, interval: float = 30.0, download_concurrency: int = 4):
+        self.catalog = catalog
+        self.directory = directory
+        self.tile_size = tile_size
+        self.threshold = threshold
+        self.interval = interval
+        self.download_concurrency = download_concurrency
+        self.manifest: Optional[Dict] = None
+        self.payload: Optional[bytes] = None
+        self.etag: Optional[str] = None
+        self.image: Optional[bytes] = None
+        self._built_for: Optional[str] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.builds = 0
+        self.failed = 0
+
+    @property
+    def image_name(self) -> Optional[str]:
+        return self.manifest["image"] if self.manifest else None
+
+    async def read_image(self, name: str) -> Optional[bytes]:
+        """按文件名取图集（当前图集在内存中，历史图集在线程中从磁盘读，不阻塞事件循环）"""
+        if name == self.image_name:
+            return self.image
+        if not ATLAS_NAME.match(name):
+            return None
+        try:
+            return await asyncio.to_thread(_read, os.path.join(self.directory, name))
+        except OSError:
+            return None
+
+    def _tile_path(self, image_url: str) -> str:
+        key = hashlib.sha1(f"{image_url}|{self.tile_size}|{self.threshold}".encode("utf-8")).hexdigest()[:20]
+        return os.path.join(self.directory, "tiles", f"{key}.png")
+
+    def _source_path(self, image_url: str) -> str:
+        return os.path.join(self.directory, "sources", hashlib.sha1(image_url.encode("utf-8")).hexdigest()[:20])
+
+    async def _download(self, image_url: str, semaphore: asyncio.Semaphore) -> bytes:
+        path = self._source_path(image_url)
+        if os.path.exists(path):
+            return await asyncio.to_thread(_read, path)
+        async with semaphore:
+            response = await clients.http("cdn").get(_source_url(image_url), follow_redirects=True)
+            response.raise_for_status()
+        await asyncio.to_thread(_write_atomic, path, response.content)
+        return response.content
+
+    async def _tile(self, image_url: str, semaphore: asyncio.Semaphore):
+        """读取缓存的剪影格子，没有时下载原图并计算"""
+        path = self._tile_path(image_url)
+        if os.path.exists(path):
+            return await asyncio.to_thread(_read_tile, path)
+        data = await self._download(image_url, semaphore)
+        return await asyncio.to_thread(self._make_tile, data, path)
+
+    def _make_tile(self, data: bytes, path: str):
+        from PIL import Image
+
+        tile = silhouette_tile(data, self.tile_size, self.threshold)
+        buffer = io.BytesIO()
+        Image.fromarray(tile).save(buffer, format="PNG", optimize=True)
+        _write_atomic(path, buffer.getvalue())
+        return tile
+
+    def _load(self) -> bool:
+        """读取磁盘上已生成的图集（重启后图库未变化时不必重建）"""
+        try:
+            with open(os.path.join(self.directory, "manifest.json"), "rb") as f:
+                payload = f.read()
+            manifest = json.loads(payload)
+            with open(os.path.join(self.directory, manifest["image"]), "rb") as f:
+                image = f.read()
+        except (OSError, ValueError, KeyError):
+            return False
+        self._publish(manifest, payload, image)
+        return True
+
+    def _publish(self, manifest: Dict, payload: bytes, image: bytes):
+        self.manifest, self.payload, self.image = manifest, payload, image
+        self.etag = f'"{hashlib.sha1(payload).hexdigest()[:16]}"'
+        self._built_for = manifest.get("catalog")
+
+    async def refresh(self) -> bool:
+        """图库变化（或上次有图片失败）时重建图集，返回是否重建"""
+        snapshot = self.catalog.snapshot()
+        if snapshot.etag == self._built_for:
+            return False
+        async with self._lock:
+            if snapshot.etag == self._built_for:
+                return False
+            semaphore = asyncio.Semaphore(self.download_concurrency)
+            species = [s for s in snapshot.species if s.get("image_url")]
+            results = await asyncio.gather(*(self._tile(s["image_url"], semaphore) for s in species),
+                                           return_exceptions=True)
+            names, tiles = [], []
+            for item, result in zip(species, results):
+                if isinstance(result, BaseException):
+                    self.failed += 1
+                    logger.warning(f"剪影生成失败: {item['object_name']}: {type(result).__name__}: {result}")
+                    continue
+                names.append(item["object_name"])
+                tiles.append(result)
+            if not tiles:
+                return False
+
+            image, columns, width, height = await asyncio.to_thread(pack_atlas, tiles, self.tile_size)
+            image_name = f"atlas-{hashlib.sha256(image).hexdigest()[:16]}.png"
+            manifest = {
+                "image": image_name,
+                "tile": self.tile_size,
+                "width": width,
+                "height": height,
+                "items": {name: [(i % columns) * self.tile_size, (i // columns) * self.tile_size]
+                          for i, name in enumerate(names)},
+                # 有图片失败时不记录图库版本，下一轮重试（成功的格子已缓存，只会重新处理失败的）
+                "catalog": snapshot.etag if len(tiles) == len(species) else None,
+            }
+            payload = json.dumps(manifest, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            await asyncio.to_thread(self._save, image_name, image, payload)
+            self._publish(manifest, payload, image)
+            self.builds += 1
+            logger.info(f"剪影图集已更新: {len(tiles)} 个物种, {width}x{height}, {len(image) / 1024:.0f} KB")
+            return True
+
+    def _save(self, image_name: str, image: bytes, payload: bytes):
+        _write_atomic(os.path.join(self.directory, image_name), image)
+        _write_atomic(os.path.join(self.directory, "manifest.json"), payload)
+        atlases = sorted((name for name in os.listdir(self.directory) if ATLAS_NAME.match(name)),
+                         key=lambda name: os.path.getmtime(os.path.join(self.directory, name)), reverse=True)
+        for name in atlases[KEEP_ATLASES:]:
+            os.remove(os.path.join(self.directory, name))
+
+    async def start(self):
+        """读取已有图集并启动后台检查任务（首次生成也在后台进行，不阻塞启动）"""
+        if not ATLAS_AVAILABLE:
+            logger.info("未安装 numpy / Pillow，不生成剪影图集")
+            return
+        await asyncio.to_thread(self._load)
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"剪影图集生成失败: {type(e).__name__}: {e}")
+            await asyncio.sleep(self.interval)
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _read_tile(path: str):
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(path) as image:
+        return np.asarray(image)
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+silhouette_atlas = SilhouetteAtlas(
+    tile_size=settings.silhouette_tile_size,
+    threshold=settings.silhouette_threshold,
+    interval=settings.silhouette_refresh_interval,
+    download_concurrency=settings.silhouette_download_concurrency,
+)
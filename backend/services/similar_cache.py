@@ -0,0 +1,152 @@
+"""近似症状缓存 - 措辞略有不同的症状复用已有诊断
+
+"今天不想上班只想躺平" 和 "今天不想上班，只想躺平！" 在精确匹配缓存里是两个键。这里把最近的症状表示为
+哈希后的字符 n-gram 向量（L2 归一化），存放在固定大小的 NumPy 矩阵里：
+- 查询时一次矩阵-向量乘法得到与所有缓存症状的余弦相似度
+- 相似度超过阈值时，从最相近的几条中随机复用一条诊断
+- 阈值与最短长度是命中率与准确性的取舍：字符 n-gram 看不出语义，短文本里换一个字就可能换了意思
+  （"上班如上坟" / "上班像上坟" 为 0.73，"考试挂了两科心态崩了" / "考试过了两科心态好了" 同样为 0.73），
+  而只差标点、语气词的改写通常在 0.9 以上；因此默认阈值 0.88，且规范化后不足 min_length 字的症状不参与近似匹配
+- 矩阵是环形缓冲区，写满后覆盖最旧的行，内存占用固定
+- 与查询文本规范化后完全相同的行会被跳过，留给精确匹配缓存（保证多结果随机性）
+- numpy 在首次使用时才导入，不拖慢服务启动
+"""
+import importlib.util
+import logging
+import random
+import time
+import zlib
+from typing import Dict, List, Optional
+
+from .result_cache import normalize_symptom
+from .settings import settings
+
+# 未安装 numpy 时关闭近似缓存
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+
+logger = logging.getLogger(__name__)
+
+
+def ngram_vector(text: str, dim: int, ngrams: tuple = (1, 2)):
+    """把文本映射为 L2 归一化的哈希字符 n-gram 向量"""
+    import numpy as np
+
+    vec = np.zeros(dim, dtype=np.float32)
+    for n in ngrams:
+        for i in range(len(text) - n + 1):
+            vec[zlib.crc32(text[i:i + n].encode("utf-8")) % dim] += 1.0
+    norm = float(np.linalg.norm(vec))
+    if norm:
+        vec /= norm
+    return vec
+
+
+class SimilarSymptomCache:
+    """
+    基于字符 n-gram 余弦相似度的近似缓存（进程内）
+
+    Args:
+        capacity: 环形缓冲区行数
+        dim: 哈希向量维度
+        threshold: 复用诊断所需的最低相似度
+        min_length: 参与近似匹配的最短症状长度（规范化后的字数），更短的只走精确匹配缓存
+        ttl: 每条结果的有效期（秒），<= 0 表示关闭
+        ngrams: 使用的字符 n-gram 长度
+        top_k: 超过阈值时在最相近的 top_k 条中随机选择
+    """
+
+    def __init__(self, capacity: int = 10000, dim: int = 512, threshold: float = 0.88,
+                 ttl: float = 3600.0, ngrams: tuple = (1, 2), top_k: int = 4, min_length: int = 8):
+        self.capacity = capacity
+        self.dim = dim
+        self.threshold = threshold
+        self.min_length = min_length
+        self.ttl = ttl
+        self.ngrams = ngrams
+        self.top_k = top_k
+
+        self._matrix = None
+        self._expires = None
+        self._keys: List[Optional[str]] = []
+        self._results: List[Optional[Dict]] = []
+        self._size = 0
+        self._pos = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return NUMPY_AVAILABLE and self.ttl > 0 and self.capacity > 0
+
+    def vectorize(self, key: str):
+        return ngram_vector(key, self.dim, self.ngrams)
+
+    def get(self, symptom: str) -> Optional[Dict]:
+        """返回一条相似症状的诊断副本，没有足够相似的缓存时返回 None"""
+        if not self.enabled or not self._size:
+            return None
+        import numpy as np
+
+        key = normalize_symptom(symptom)
+        if len(key) < self.min_length:
+            return None
+        scores = self._matrix[:self._size] @ self.vectorize(key)
+        # 过期行与完全相同的症状不参与匹配
+        scores[self._expires[:self._size] <= time.monotonic()] = -1.0
+        k = min(self.top_k + 1, self._size)
+        top = np.argpartition(scores, -k)[-k:]
+        candidates = [int(i) for i in top if scores[i] >= self.threshold and self._keys[i] != key]
+        if not candidates:
+            self.misses += 1
+            return None
+        self.hits += 1
+        best = max(candidates, key=lambda i: scores[i])
+        logger.info(f"命中近似症状缓存: '{symptom}' ~ '{self._keys[best]}' ({scores[best]:.2f})")
+        result = self._results[random.choice(candidates)]
+        return dict(result, keywords=list(result["keywords"]))
+
+    def put(self, symptom: str, result: Dict):
+        """写入一条诊断结果，缓冲区写满后覆盖最旧的一行"""
+        if not self.enabled:
+            return
+        if self._matrix is None:
+            import numpy as np
+
+            self._matrix = np.zeros((self.capacity, self.dim), dtype=np.float32)
+            self._expires = np.zeros(self.capacity, dtype=np.float64)
+            self._keys = [None] * self.capacity
+            self._results = [None] * self.capacity
+        key = normalize_symptom(symptom)
+        if len(key) < self.min_length:
+            return
+        i = self._pos
+        self._matrix[i] = self.vectorize(key)
+        self._expires[i] = time.monotonic() + self.ttl
+        self._keys[i] = key
+        self._results[i] = {
+            "object_name": result["object_name"],
+            "display_name": result.get("display_name") or result["object_name"],
+            "keywords": list(result.get("keywords") or []),
+            "diagnosis": result.get("diagnosis") or "",
+        }
+        self._pos = (i + 1) % self.capacity
+        self._size = max(self._size, i + 1)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "bytes": self._matrix.nbytes if self._matrix is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+similar_cache = SimilarSymptomCache(
+    capacity=settings.similar_cache_capacity,
+    dim=settings.similar_cache_dim,
+    threshold=settings.similar_cache_threshold,
+    min_length=settings.similar_cache_min_length,
+    ttl=settings.similar_cache_ttl,
+)
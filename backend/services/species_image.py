@@ -0,0 +1,109 @@
+"""物种图片服务 - 为未命中预置图库的物种生成并上传图片
+
+- 已生成过的物种直接从登记表返回，不再重复调用 Seedream
+- 同一物种（规范化后的 object_name）的并发请求共享同一个生成任务（single-flight）
+- 存储 key 由规范化名称的哈希决定，同一物种始终落在同一个对象上
+- 共享任务按等待方计数：所有等待方都被取消（客户端断开且未转入后台）时才取消生成
+- 同时进行的 Seedream 调用数受 image_admission 限制
+"""
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Optional
+
+from .admission import image_admission
+from .catalog import preset_catalog
+from .image_gen import generate_species_image_from_prompt
+from .metrics import stage
+from .qiniu_storage import save_to_qiniu
+from .species_index import species_index
+from .species_registry import normalize_object_name, species_registry
+
+logger = logging.getLogger(__name__)
+
+# 生成/上传失败时的降级图片
+PLACEHOLDER_IMAGE_URL = "https://placeholder.com/species/unknown.png"
+
+# 正在生成中的任务：规范化名称 -> Task
+_inflight: Dict[str, asyncio.Task] = {}
+# 每个生成任务的等待方数量：规范化名称 -> 数量
+_waiters: Dict[str, int] = {}
+
+
+def build_image_prompt(object_name: str) -> str:
+    """构造 Seedream 生成 Prompt"""
+    return f"""极简涂鸦风格。画风潦草，甚至有点丑。{object_name}，
+粗线条手绘，简约卡通表情，背景颜色必须是纯白的。
+适合社交媒体分享的正方形构图"""
+
+
+def species_image_key(object_name: str) -> str:
+    """按规范化名称生成内容寻址的存储 key: species/{name}_{hash}.png"""
+    normalized = normalize_object_name(object_name)
+    digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+    return f"species/{normalized.replace(' ', '_')}_{digest}.png"
+
+
+def lookup_species_image(object_name: str) -> Optional[str]:
+    """查询已有图片：预置图库优先，其次是已生成物种登记表"""
+    return preset_catalog.get_image_url(object_name) or species_registry.get_image_url(object_name)
+
+
+def nearest_preset_image(object_name: str) -> Optional[str]:
+    """最相近的预置物种图片（不生成新图时的替代），图库为空时返回 None"""
+    nearest = species_index.nearest(object_name)
+    return preset_catalog.get_image_url(nearest) if nearest else None
+
+
+async def generate_species_image(object_name: str) -> str:
+    """
+    获取（必要时生成）物种图片
+
+    Args:
+        object_name: 物种名称
+
+    Returns:
+        CDN 访问链接（失败时抛出异常，由调用方决定降级方式）
+    """
+    existing = species_registry.get_image_url(object_name)
+    if existing:
+        return existing
+
+    normalized = normalize_object_name(object_name)
+    task = _inflight.get(normalized)
+    if task is None:
+        task = asyncio.create_task(_generate_and_register(object_name))
+        _inflight[normalized] = task
+        task.add_done_callback(lambda _: _inflight.pop(normalized, None))
+    else:
+        logger.info(f"复用进行中的图片生成任务: object_name='{object_name}'")
+    # shield：某个等待方被取消时不影响共享的生成任务，最后一个等待方取消时才停止生成
+    _waiters[normalized] = _waiters.get(normalized, 0) + 1
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        if _waiters[normalized] == 1 and not task.done():
+            logger.info(f"没有等待方了，取消图片生成: object_name='{object_name}'")
+            task.cancel()
+        raise
+    finally:
+        remaining = _waiters.pop(normalized) - 1
+        if remaining:
+            _waiters[normalized] = remaining
+
+
+async def _generate_and_register(object_name: str) -> str:
+    logger.info(f"未命中预置图库，准备生成新图: object_name='{object_name}'")
+    # 图片生成并发已满且排队也满（或排队超时）时抛出 Overloaded，由调用方改用最相近的预置图片
+    async with image_admission.slot():
+        with stage("image_generate"):
+            temp_url = await generate_species_image_from_prompt(build_image_prompt(object_name))
+    logger.info(f"图片生成成功，临时 URL: {temp_url}")
+
+    key = species_image_key(object_name)
+    with stage("image_upload"):
+        image_url = await save_to_qiniu(temp_url, key)
+    logger.info(f"七牛云上传成功: {image_url}")
+
+    await species_registry.add(object_name, image_url, key)
+    return image_url
@@ -0,0 +1,114 @@
+"""物种检索索引 - 为每个请求挑选候选物种短名单
+
+图库扩充到几十上百个物种后，把全部名称塞进 System Prompt 会让 prompt token 和首字延迟线性增长。
+这里在本地为每个物种建立哈希字符 n-gram 向量（物种名 + preset_species.json 中的 description），
+请求时用一次矩阵-向量乘法选出与症状最相关的 top-k 个物种：
+- 另外随机补入少量物种，保留 LLM 自由发挥的空间，也避免冷门物种永远进不了候选
+- LLM 每次选中的物种会把该症状累加到物种的"经验向量"上，检索结果随使用越来越准
+- 图库文件变化时自动重建索引（经验向量按物种名保留）
+- 未安装 numpy 或物种数不超过 k 时，直接返回全部物种
+- nearest() 为未命中图库的物种找最相近的预置物种（SPECIES_IMAGE_ON_MISS=nearest 时代替现场生成）
+"""
+import logging
+import random
+from typing import Dict, List, Optional
+
+from .catalog import PresetCatalog, preset_catalog
+from .result_cache import normalize_symptom
+from .settings import settings
+from .similar_cache import NUMPY_AVAILABLE, ngram_vector
+
+logger = logging.getLogger(__name__)
+
+
+class SpeciesIndex:
+    """
+    预置物种的检索索引
+
+    Args:
+        catalog: 预置物种目录
+        top_k: 短名单长度
+        explore: 短名单中随机补入的物种数量
+        dim: 哈希向量维度
+    """
+
+    def __init__(self, catalog: PresetCatalog = preset_catalog, top_k: int = 12, explore: int = 3,
+                 dim: int = 1024):
+        self.catalog = catalog
+        self.top_k = top_k
+        self.explore = explore
+        self.dim = dim
+
+        self._snapshot = None
+        self._names: List[str] = []
+        self._base = None
+        self._learned = None
+        # 物种名 -> 累加的症状向量（跨索引重建保留）
+        self._experience: Dict[str, "np.ndarray"] = {}
+
+    def shortlist(self, symptom: str, k: Optional[int] = None) -> List[str]:
+        """返回与症状最相关的 k 个物种名（相关度降序，末尾为随机补入的物种）"""
+        k = k or self.top_k
+        names = self.catalog.names
+        if not NUMPY_AVAILABLE or len(names) <= k:
+            return list(names)
+        self._ensure_index()
+        import numpy as np
+
+        query = ngram_vector(normalize_symptom(symptom), self.dim)
+        scores = self._base @ query + self._learned @ query
+        ranked = [int(i) for i in np.argsort(-scores) if scores[i] > 0]
+        picked = ranked[:max(0, k - self.explore)]
+        chosen = set(picked)
+        rest = [i for i in range(len(self._names)) if i not in chosen]
+        picked += random.sample(rest, k - len(picked))
+        return [self._names[i] for i in picked]
+
+    def nearest(self, object_name: str) -> Optional[str]:
+        """与物种名最相近的预置物种（按名称 + 描述的 n-gram 相似度），图库为空时返回 None"""
+        names = self.catalog.names
+        if not names:
+            return None
+        if not NUMPY_AVAILABLE:
+            return random.choice(names)
+        self._ensure_index()
+        scores = self._base @ ngram_vector(normalize_symptom(object_name), self.dim)
+        best = int(scores.argmax())
+        return self._names[best] if scores[best] > 0 else random.choice(self._names)
+
+    def reinforce(self, symptom: str, object_name: str):
+        """记录 LLM 为该症状选中的物种"""
+        if not NUMPY_AVAILABLE or self.catalog.get(object_name) is None:
+            return
+        self._ensure_index()
+        import numpy as np
+        vec = ngram_vector(normalize_symptom(symptom), self.dim)
+        experience = self._experience.get(object_name)
+        experience = vec if experience is None else experience + vec
+        self._experience[object_name] = experience
+        row = self._names.index(object_name)
+        self._learned[row] = experience / float(np.linalg.norm(experience))
+
+    def _ensure_index(self):
+        snapshot = self.catalog.snapshot()
+        if snapshot is self._snapshot:
+            return
+        import numpy as np
+
+        self._names = list(snapshot.names)
+        self._base = np.zeros((len(self._names), self.dim), dtype=np.float32)
+        self._learned = np.zeros((len(self._names), self.dim), dtype=np.float32)
+        for row, name in enumerate(self._names):
+            description = snapshot.by_name[name].get("description", "")
+            self._base[row] = ngram_vector(normalize_symptom(name + description), self.dim)
+            experience = self._experience.get(name)
+            if experience is not None:
+                self._learned[row] = experience / float(np.linalg.norm(experience))
+        self._snapshot = snapshot
+        logger.info(f"物种检索索引已构建: {len(self._names)} 个物种")
+
+
+species_index = SpeciesIndex(
+    top_k=settings.species_shortlist_size,
+    explore=settings.species_shortlist_explore,
+)
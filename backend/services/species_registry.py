@@ -0,0 +1,99 @@
+"""已生成物种登记表 - 持久化的新物种图片索引
+
+每生成一个新物种图片就追加一行 JSON 到 generated_species.jsonl，
+启动时整体加载为字典（以规范化后的 object_name 为键），之后查询 O(1)。
+其它 worker 追加的记录通过增量读取文件尾部同步（每秒最多检查一次）。
+同名物种重复写入时以最后一条为准。
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import unicodedata
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+GENERATED_SPECIES_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "generated_species.jsonl")
+
+
+def normalize_object_name(object_name: str) -> str:
+    """规范化物种名：全半角统一、去首尾空白、合并连续空白"""
+    return " ".join(unicodedata.normalize("NFKC", object_name).split())
+
+
+class SpeciesRegistry:
+    """已生成物种的持久化索引"""
+
+    def __init__(self, path: str = GENERATED_SPECIES_FILE, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._index: Dict[str, Dict] = {}
+        self._offset = 0
+        self._next_check = 0.0
+        self._write_lock = asyncio.Lock()
+
+    def get(self, object_name: str) -> Optional[Dict]:
+        return self._load().get(normalize_object_name(object_name))
+
+    def get_image_url(self, object_name: str) -> Optional[str]:
+        record = self.get(object_name)
+        return record["image_url"] if record else None
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def load(self):
+        """立即读取文件（启动时在线程中调用，避免首个请求承担全量加载）"""
+        self._next_check = 0.0
+        self._load()
+
+    async def add(self, object_name: str, image_url: str, key: str) -> Dict:
+        """登记一个新生成的物种（先更新内存索引，再追加写文件）"""
+        record = {
+            "object_name": object_name,
+            "image_url": image_url,
+            "key": key,
+            "created_at": int(time.time()),
+        }
+        self._load()[normalize_object_name(object_name)] = record
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        async with self._write_lock:
+            await asyncio.to_thread(self._append, line)
+        return record
+
+    def _append(self, line: str):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def _load(self) -> Dict[str, Dict]:
+        """返回内存索引，必要时读取文件中新追加的记录"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return self._index
+        self._next_check = now + self.check_interval
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return self._index
+        if size <= self._offset:
+            return self._index
+
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read(size - self._offset)
+        # 只消费完整的行，写到一半的行留到下次
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+                self._index[normalize_object_name(record["object_name"])] = record
+            except (json.JSONDecodeError, KeyError):
+                continue
+        self._offset += end
+        return self._index
+
+
+species_registry = SpeciesRegistry()
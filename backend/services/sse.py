@@ -0,0 +1,123 @@
+"""SSE 编码 - 低开销的事件帧、诊断文案合并与心跳
+
+- 有 orjson 时用 orjson 序列化（直接输出 UTF-8 bytes），否则退化为紧凑的 json.dumps
+- 固定内容的帧（心跳、参数错误）与 diagnosis_chunk / done 帧的前后缀预先编码
+- LLM 的 diagnosis_chunk 往往只有一两个字，逐个转发会产生大量小帧；SSEWriter 把它们
+  缓冲起来，达到时间窗口（coalesce_interval）或大小（coalesce_bytes）时合并成一帧发出
+- 超过 heartbeat_interval 没有发送任何帧时（如等待图片生成）发送注释行保活，
+  EventSource 会忽略注释，但能阻止代理/负载均衡因空闲断开连接
+"""
+import json
+import time
+from typing import Callable, List, Optional
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用标准库
+    orjson = None
+
+
+def encode_json(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_event(data: dict) -> bytes:
+    return b"data: " + encode_json(data) + b"\n\n"
+
+
+HEARTBEAT_FRAME = b": keep-alive\n\n"
+INVALID_SYMPTOM_FRAME = encode_event({"type": "error", "message": "症状描述需要在5-50字之间"})
+_CHUNK_PREFIX = b'data: {"type":"diagnosis_chunk","chunk":'
+_DONE_PREFIX = b'data: {"type":"done","sequence_no":'
+_FRAME_SUFFIX = b"}\n\n"
+_ARCHIVED_SUFFIX = b',"archived":true}\n\n'
+
+
+def done_frame(sequence_no: int, archived: bool, source: Optional[str] = None) -> bytes:
+    """archived: 结果是否已写入存档（分享链接 /api/result/{sequence_no} 可用）"""
+    if source or not archived:
+        event = {"type": "done", "sequence_no": int(sequence_no), "archived": archived}
+        if source:
+            event["source"] = source
+        return encode_event(event)
+    return _DONE_PREFIX + str(int(sequence_no)).encode("ascii") + _ARCHIVED_SUFFIX
+
+
+class SSEWriter:
+    """
+    单个 SSE 响应的编码器
+
+    Args:
+        coalesce_interval: 诊断文案缓冲的最长时间（秒），<= 0 表示不合并
+        coalesce_bytes: 缓冲的文案达到该字节数（UTF-8）时立即发出
+        heartbeat_interval: 空闲多久后发送心跳（秒），<= 0 表示不发送
+        clock: 单调时钟（基准测试中可替换为模拟时钟）
+    """
+
+    def __init__(self, coalesce_interval: float = 0.05, coalesce_bytes: int = 256,
+                 heartbeat_interval: float = 15.0, clock: Callable[[], float] = time.monotonic):
+        self.coalesce_interval = coalesce_interval
+        self.coalesce_bytes = coalesce_bytes
+        self.heartbeat_interval = heartbeat_interval
+        self.clock = clock
+
+        self._parts: List[str] = []
+        self._buffered = 0
+        self._buffer_deadline = 0.0
+        self._last_sent = clock()
+        self.frames = 0
+        self.bytes = 0
+
+    def event(self, data: dict) -> bytes:
+        """编码一个事件；调用前应先 flush() 发出缓冲的文案"""
+        return self._sent(encode_event(data))
+
+    def done(self, sequence_no: int, archived: bool, source: Optional[str] = None) -> bytes:
+        return self._sent(done_frame(sequence_no, archived, source))
+
+    def chunk(self, text: str) -> Optional[bytes]:
+        """缓冲一段诊断文案，需要发送时返回合并后的帧"""
+        if not self._parts:
+            self._buffer_deadline = self.clock() + self.coalesce_interval
+        self._parts.append(text)
+        self._buffered += len(text.encode("utf-8"))
+        if self._buffered >= self.coalesce_bytes or self.clock() >= self._buffer_deadline:
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[bytes]:
+        """发出缓冲的文案（没有缓冲时返回 None）"""
+        if not self._parts:
+            return None
+        text = "".join(self._parts)
+        self._parts.clear()
+        self._buffered = 0
+        return self._sent(_CHUNK_PREFIX + encode_json(text) + _FRAME_SUFFIX)
+
+    def timeout(self) -> Optional[float]:
+        """距下一次需要主动发送（缓冲到期或心跳）的秒数，供 asyncio.wait 使用"""
+        deadlines = []
+        if self._parts:
+            deadlines.append(self._buffer_deadline)
+        if self.heartbeat_interval > 0:
+            deadlines.append(self._last_sent + self.heartbeat_interval)
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - self.clock())
+
+    def poll(self) -> Optional[bytes]:
+        """等待超时后调用：发出到期的缓冲文案，或在空闲过久时返回心跳"""
+        now = self.clock()
+        if self._parts and now >= self._buffer_deadline:
+            return self.flush()
+        if self.heartbeat_interval > 0 and now - self._last_sent >= self.heartbeat_interval:
+            return self._sent(HEARTBEAT_FRAME)
+        return None
+
+    def _sent(self, frame: bytes) -> bytes:
+        self._last_sent = self.clock()
+        self.frames += 1
+        self.bytes += len(frame)
+        return frame
@@ -6,8 +6,20 @@ export const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localho
 // API 端点
 export const API_ENDPOINTS = {
     presetSpecies: `${API_BASE_URL}/api/preset-species`,
+    presetSilhouettes: `${API_BASE_URL}/api/preset-species/silhouettes`, // 剪影图集偏移表
     diagnose: `${API_BASE_URL}/api/diagnose`,
     diagnoseStream: `${API_BASE_URL}/api/diagnose/stream`, // 流式诊断端点
+    dice: `${API_BASE_URL}/api/dice`, // 骰子文案（优先返回已预生成诊断的文案）
+    result: `${API_BASE_URL}/api/result`, // 按序号读取已完成的鉴定报告（分享链接）
+}
+
+// 剪影图集偏移表：图集由 `${presetSilhouettes}/${image}` 提供，items 为各物种格子的左上角坐标
+export interface SilhouetteAtlas {
+    image: string
+    tile: number
+    width: number
+    height: number
+    items: Record<string, [number, number]>
 }
 
 // SSE 事件类型定义
@@ -17,6 +29,8 @@ export interface SSESpeciesEvent {
     display_name: string
     keywords: string[]
     image_url?: string
+    // 'local': 本地分类器的模板文案（LLM 故障兜底或分流）
+    source?: 'local'
 }
 
 export interface SSEDiagnosisChunkEvent {
@@ -32,6 +46,9 @@ export interface SSEImageEvent {
 export interface SSEDoneEvent {
     type: 'done'
     sequence_no: number
+    // 是否已存档：为 false 时 /api/result/{sequence_no} 不可用，不能生成分享链接
+    archived: boolean
+    source?: 'local'
 }
 
 export interface SSEErrorEvent {